@@ -1,8 +1,6 @@
 from ultralytics import YOLOv10
+from ultralytics.models.yolov10.slim import strip_one2many
 
 model = YOLOv10('yolov10n.yaml')
-model.model.model[-1].export = True
-model.model.model[-1].format = 'onnx'
-del model.model.model[-1].cv2
-del model.model.model[-1].cv3
-model.fuse()
\ No newline at end of file
+strip_one2many(model.model)
+model.fuse()
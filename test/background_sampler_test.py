@@ -0,0 +1,86 @@
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from background_sampler import BackgroundSampler, BackgroundSamplingTrainer  # noqa: E402
+from ultralytics.cfg import get_cfg  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+
+
+def fake_dataset(n_pos=30, n_bg=100):
+    """前 n_pos 张切片各有一个目标，其余为空标签切片"""
+    labels = [{"cls": [0]}] * n_pos + [{"cls": []}] * n_bg
+    return SimpleNamespace(im_files=[f"slice_{i}.png" for i in range(len(labels))], labels=labels)
+
+
+@pytest.mark.parametrize("hard", [0, 10])
+def test_ranks_disjoint_with_background_ratio(hard):
+    """两个 rank 每个 epoch 得到互不重叠、大小相同的索引，合起来是全部阳性加 bg_fraction 比例的背景"""
+    dataset = fake_dataset()
+    samplers = [BackgroundSampler(dataset, bg_fraction=0.3, num_replicas=2, rank=r) for r in range(2)]
+    hard_files = dataset.im_files[30 : 30 + hard]
+    for s in samplers:
+        s.update_hard_negatives(hard_files)
+
+    seen = []
+    for _ in range(3):
+        splits = [list(s) for s in samplers]
+        assert len(splits[0]) == len(splits[1]) == len(samplers[0]) == 30
+        assert not set(splits[0]) & set(splits[1])
+        union = set(splits[0]) | set(splits[1])
+        assert set(range(30)) <= union
+        assert len(union - set(range(30))) == 30  # round(100 * 0.3) 张背景
+        assert set(range(30, 30 + hard)) <= union  # 难负样本名额足够时全部入选
+        seen.append(union)
+    assert seen[0] != seen[1]  # 每个 epoch 重新抽取背景
+
+
+def fake_trainer(epoch, epochs=10, **overrides):
+    """只包含难负样本挖掘所需状态的 trainer，train_loader 记录 reset 次数"""
+    trainer = object.__new__(BackgroundSamplingTrainer)
+    trainer.args = get_cfg(overrides={"close_mosaic": 2, **overrides})
+    trainer.epoch, trainer.epochs = epoch, epochs
+    trainer.hard_conf = 0.0  # 随机初始化的模型得分很低，所有背景切片都算难负样本
+    trainer.bg_scores, trainer._batch, trainer._miner = {}, None, None
+    torch.manual_seed(0)
+    trainer.model = YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False).train()
+    resets = []
+    trainer.train_loader = SimpleNamespace(sampler=BackgroundSampler(fake_dataset()), reset=lambda: resets.append(1))
+    return trainer, resets
+
+
+def train_step(trainer):
+    """一张阳性切片和两张背景切片的训练前向"""
+    trainer._batch = {"im_file": ["slice_0.png", "slice_30.png", "slice_31.png"], "batch_idx": torch.tensor([0.0])}
+    trainer.model(torch.rand(3, 3, 64, 64))
+
+
+@pytest.mark.parametrize("epoch, overrides, mined", [(8, {}, True), (3, {}, False), (3, {"mosaic": 0.0}, True)])
+def test_trainer_mines_hard_negatives(epoch, overrides, mined):
+    """只在未拼接的 epoch 挖掘：钩子记录背景切片得分，epoch 结束时移除钩子并更新采样器的难负样本"""
+    trainer, resets = fake_trainer(epoch, **overrides)
+    head = trainer.model.model[-1]
+    assert trainer._mining() is mined
+
+    trainer._start_epoch()
+    assert bool(head._forward_hooks) is mined
+    train_step(trainer)
+    assert sorted(trainer.bg_scores) == (["slice_30.png", "slice_31.png"] if mined else [])
+
+    trainer._update_hard_negatives()
+    assert not head._forward_hooks and trainer._miner is None and trainer._batch is None
+    assert trainer.train_loader.sampler.hard == ([30, 31] if mined else [])
+    assert resets == ([1] if mined else [])
+
+    trainer.epoch = epoch + 1  # 难负样本不变时不重置 dataloader
+    trainer._start_epoch()
+    trainer._update_hard_negatives()
+    assert len(resets) == int(mined)
@@ -0,0 +1,68 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from cascade import _batches, pick_threshold  # noqa: E402
+
+
+def brute_threshold(scores, positive, target_recall):
+    """逐个尝试候选阈值，取召回率满足要求的最大值"""
+    best = None
+    for t in np.unique(scores[positive]):
+        if (scores[positive] >= t).mean() >= target_recall:
+            best = t
+    return best
+
+
+@pytest.mark.parametrize(
+    "target, threshold, recall, pass_rate",
+    [(1.0, 0.6, 1.0, 4 / 6), (0.75, 0.7, 0.75, 3 / 6), (0.7, 0.7, 0.75, 3 / 6), (0.0, 0.9, 0.25, 1 / 6)],
+)
+def test_pick_threshold(target, threshold, recall, pass_rate):
+    scores = np.array([0.9, 0.1, 0.8, 0.7, 0.2, 0.6])
+    positive = np.array([True, False, True, True, False, True])
+    assert pick_threshold(scores, positive, target) == pytest.approx((threshold, recall, pass_rate))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("target", [0.5, 0.9, 0.99, 1.0])
+def test_pick_threshold_is_highest(seed, target):
+    """阈值是召回率不低于 target 的最大阈值，含得分相同的切片"""
+    rng = np.random.default_rng(seed)
+    scores = rng.integers(0, 20, 300) / 20  # 大量相同得分
+    positive = rng.random(300) < 0.3
+    threshold, recall, _ = pick_threshold(scores, positive, target)
+    assert threshold == brute_threshold(scores, positive, target)
+    assert recall >= target
+    assert (scores[positive] >= np.nextafter(threshold, 2)).mean() < target
+
+
+def test_pick_threshold_no_positives():
+    """没有含目标的切片时全部通过"""
+    assert pick_threshold(np.array([0.3, 0.9]), np.array([False, False])) == (0.0, 1.0, 1.0)
+    assert pick_threshold(np.array([]), np.array([], dtype=bool)) == (0.0, 1.0, 1.0)
+
+
+def test_batches_skip_unreadable(tmp_path):
+    """无法读取的文件跳过，全部无法读取的批次不返回"""
+    files = []
+    for name in ("a.png", "broken.png", "b.png", "missing.png", "c.png"):
+        f = tmp_path / name
+        if name == "broken.png":
+            f.write_bytes(b"not an image")
+        elif name != "missing.png":
+            cv2.imwrite(str(f), np.zeros((8, 8, 3), dtype=np.uint8))
+        files.append(str(f))
+    batches = list(_batches(files, 2))
+    assert [[Path(p).name for p in paths] for paths, _ in batches] == [["a.png"], ["b.png"], ["c.png"]]
+    assert all(len(paths) == len(imgs) for paths, imgs in batches)
+    assert list(_batches(files[1:2] + files[3:4], 2)) == []
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("pycocotools")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from coco_eval import COCOEvaluator, pycocotools_eval, synthetic_coco  # noqa: E402
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_matches_pycocotools(seed):
+    """向量化评估结果与 pycocotools 一致"""
+    anno, preds = synthetic_coco(300, nc=3, seed=seed)
+    stats = COCOEvaluator(anno).evaluate(preds, workers=2)
+    np.testing.assert_allclose(stats, pycocotools_eval(anno, preds), atol=1e-4)
+
+
+def test_quirks_and_subset():
+    """标注 id 为 0、字符串 image_id 以及只评估部分图像时与 pycocotools 一致"""
+    anno, preds = synthetic_coco(200, nc=2, seed=3)
+    for a in anno["annotations"]:
+        a["id"] -= 1  # 与 yolo2coco.py 一样从 0 开始编号
+    rename = {im["id"]: f"slice_{im['id']}" for im in anno["images"]}
+    for x in anno["images"]:
+        x["id"] = rename[x["id"]]
+    for x in anno["annotations"] + preds:
+        x["image_id"] = rename[x["image_id"]]
+    subset = [rename[i] for i in range(1, 201, 2)]
+    stats = COCOEvaluator(anno).evaluate(preds, img_ids=subset)
+    np.testing.assert_allclose(stats, pycocotools_eval(anno, preds, img_ids=subset), atol=1e-4)
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_no_detections(background):
+    """评估的图像没有检测（全部为背景时也没有 GT）时不报错，与 pycocotools 一致（-1 与 0）"""
+    anno, preds = synthetic_coco(100, nc=2, seed=4)
+    labeled = {a["image_id"] for a in anno["annotations"]}
+    subset = [im["id"] for im in anno["images"] if (im["id"] in labeled) != background][:20]
+    preds = [p for p in preds if p["image_id"] not in subset]  # pycocotools 不接受空的预测列表
+    stats = COCOEvaluator(anno).evaluate(preds, img_ids=subset)
+    ref = pycocotools_eval(anno, preds, img_ids=subset)
+    np.testing.assert_allclose(stats, ref, atol=1e-4)
+    if background:
+        np.testing.assert_array_equal(stats, -1)
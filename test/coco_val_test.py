@@ -0,0 +1,103 @@
+import sys
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from collections import defaultdict
+
+import pytest
+
+np = pytest.importorskip("numpy")
+torch = pytest.importorskip("torch")
+pytest.importorskip("pycocotools")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from coco_eval import pycocotools_eval, synthetic_coco  # noqa: E402
+from coco_val import COCOEvalTrainer, COCOEvalValidator  # noqa: E402
+from ultralytics.cfg import get_cfg  # noqa: E402
+
+NAMES = {0: "emphysema", 1: "bulla"}
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """字符串 image_id、类别顺序与模型不同的 COCO 标注，以及对应的预测"""
+    anno, preds = synthetic_coco(60, nc=2, seed=0)
+    anno["categories"] = [{"id": 0, "name": "bulla", "supercategory": "none"},
+                          {"id": 1, "name": "emphysema", "supercategory": "none"}]
+    rename = {im["id"]: f"slice_{im['id']}" for im in anno["images"]}
+    for x in anno["images"]:
+        x["id"] = rename[x["id"]]
+    for x in anno["annotations"] + preds:
+        x["image_id"] = rename[x["image_id"]]
+    (tmp_path / "anno.json").write_text(json.dumps(anno))
+    return anno, preds
+
+
+def build_validator(tmp_path, anno_json="anno.json"):
+    validator = COCOEvalValidator(save_dir=tmp_path, args={"plots": False})
+    validator.data = {"path": str(tmp_path), "val": str(tmp_path / "images"), "anno_json": anno_json, "names": NAMES}
+    validator.init_metrics(SimpleNamespace(names=NAMES))
+    return validator
+
+
+def feed(validator, anno, preds):
+    """按图像把 COCO 格式的预测转换为 predn (xyxy, conf, cls) 交给 pred_to_json"""
+    files = {im["id"]: f"/data/images/{im['file_name']}" for im in anno["images"]}
+    by_image = defaultdict(list)
+    for p in preds:
+        x, y, w, h = p["bbox"]
+        by_image[p["image_id"]].append([x, y, x + w, y + h, p["score"], validator.class_map.index(p["category_id"])])
+    for image_id, rows in by_image.items():
+        validator.pred_to_json(torch.tensor(rows, dtype=torch.float64), files[image_id])
+    validator.pred_to_json(torch.tensor([[0, 0, 10, 10, 0.9, 0]], dtype=torch.float64), "/data/images/other.png")
+
+
+def test_validator_matches_pycocotools(tmp_path, dataset):
+    """类别按名称对应，预测按文件名对应到字符串 image_id，eval_json 以 COCO mAP 替换内置指标"""
+    anno, preds = dataset
+    validator = build_validator(tmp_path)
+    assert validator.args.save_json
+    assert validator.class_map == [1, 0]
+    feed(validator, anno, preds)
+    assert len(validator.jdict) == len(preds)  # 不在标注中的图像被忽略
+    assert sorted(json.dumps(p, sort_keys=True) for p in validator.jdict) == sorted(
+        json.dumps({**p, "bbox": [round(v, 3) for v in p["bbox"]]}, sort_keys=True) for p in preds
+    )
+
+    subset = anno["images"][::2]  # 只评估 dataloader 中的图像
+    validator.dataloader = SimpleNamespace(dataset=SimpleNamespace(
+        im_files=[f"/data/images/{im['file_name']}" for im in subset] + ["/data/images/other.png"]))
+    keys = validator.metrics.keys
+    stats = validator.eval_json({k: 0.0 for k in keys})
+    ref = pycocotools_eval(anno, preds, img_ids=[im["id"] for im in subset])
+    np.testing.assert_allclose([stats[keys[-1]], stats[keys[-2]]], ref[:2], atol=1e-4)
+    assert stats[keys[0]] == stats[keys[1]] == 0.0  # precision/recall 不变
+
+
+def test_validator_without_anno(tmp_path):
+    """没有 anno_json 时退回 YOLOv10DetectionValidator 的行为"""
+    validator = build_validator(tmp_path, anno_json=None)
+    assert validator.coco is None and not validator.args.save_json
+    stats = {k: 0.5 for k in validator.metrics.keys}
+    assert validator.eval_json(dict(stats)) == stats
+
+
+def test_validator_reuses_annotations(tmp_path, dataset):
+    """训练中每次验证都会调用 init_metrics，标注只加载一次"""
+    validator = build_validator(tmp_path)
+    coco = validator.coco
+    validator.init_metrics(SimpleNamespace(names=NAMES))
+    assert validator.coco is coco and validator.jdict == []
+
+
+def test_trainer_uses_coco_validator(tmp_path):
+    trainer = object.__new__(COCOEvalTrainer)
+    trainer.test_loader, trainer.save_dir = None, tmp_path
+    trainer.args, trainer.callbacks = get_cfg(overrides={"plots": False}), defaultdict(list)
+    validator = trainer.get_validator()
+    assert isinstance(validator, COCOEvalValidator)
+    assert validator.save_dir == tmp_path and validator.args is not trainer.args
+    assert len(trainer.loss_names) == 6
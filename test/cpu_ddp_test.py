@@ -0,0 +1,82 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+import torch.multiprocessing as mp  # noqa: E402
+from torch import distributed as dist  # noqa: E402
+from torch import nn  # noqa: E402
+
+from cpu_ddp import _synthetic_batch, benchmark_scaling  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+from ultralytics.utils import DEFAULT_CFG  # noqa: E402
+from ultralytics.utils.dist import find_free_network_port  # noqa: E402
+
+# 2 个进程相对 1 个进程的最低加速比，可通过环境变量调整
+SCALING_SPEEDUP = float(os.getenv("DDP_SCALING_SPEEDUP", 1.5))
+
+pytestmark = pytest.mark.skipif(not dist.is_available(), reason="torch.distributed 不可用")
+
+
+def _step_worker(rank, world_size, port, queue):
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port))
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+    torch.set_num_threads(1)
+
+    torch.manual_seed(0)
+    model = YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False)
+    model.args = DEFAULT_CFG
+    model.train()
+    init = nn.utils.parameters_to_vector(model.parameters()).detach().clone()
+    ddp = nn.parallel.DistributedDataParallel(model)
+    optimizer = torch.optim.SGD([p for p in model.parameters() if p.requires_grad], lr=0.01, momentum=0.9)
+
+    torch.manual_seed(rank + 1)  # 各 rank 使用不同数据，梯度只有经过 all-reduce 才会一致
+    loss, _ = ddp(_synthetic_batch(2, 64))
+    loss.backward()
+    optimizer.step()
+    weights = nn.utils.parameters_to_vector(model.parameters()).detach()
+    queue.put((rank, weights.numpy(), (weights - init).abs().max().item()))
+    dist.barrier()
+    dist.destroy_process_group()
+
+
+def test_ranks_identical_after_step():
+    """2 进程 gloo DDP 训练一步后各 rank 的权重完全一致且确实被更新"""
+    ctx = mp.get_context("spawn")
+    queue = ctx.Queue()
+    port = find_free_network_port()
+    workers = [ctx.Process(target=_step_worker, args=(r, 2, port, queue)) for r in range(2)]
+    for w in workers:
+        w.start()
+    results = {r: (w, d) for r, w, d in (queue.get(timeout=600) for _ in workers)}
+    for w in workers:
+        w.join(timeout=60)
+        assert w.exitcode == 0
+
+    (w0, d0), (w1, d1) = results[0], results[1]
+    assert d0 > 0 and d1 > 0
+    assert torch.equal(torch.from_numpy(w0), torch.from_numpy(w1))
+
+
+def test_benchmark_scaling_smoke():
+    """扩展性测试在 1、2 个进程下都能跑通"""
+    results = benchmark_scaling(procs=[1, 2], batch_size=2, imgsz=64, steps=1, warmup=1)
+    assert sorted(results) == [1, 2]
+    assert all(ips > 0 for ips in results.values())
+
+
+def test_benchmark_scaling_efficiency():
+    """核心足够时 2 个进程的吞吐接近 1 个进程的两倍"""
+    n_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if n_cores < 4:
+        pytest.skip(f"只有 {n_cores} 个可用核心，无法测量扩展效率")
+    results = benchmark_scaling(procs=[1, 2], batch_size=4, imgsz=128, steps=8, warmup=2)
+    assert results[2] >= SCALING_SPEEDUP * results[1], results
@@ -0,0 +1,96 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+import cpu_optimize  # noqa: E402
+from cpu_optimize import OptimizedModel, cache_key, optimize, outputs_match  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+
+
+def detections(batch=2, max_det=30, seed=0):
+    """得分全部低于 conf=0.25 的端到端输出 (B, max_det, 6)，与训练好的模型在随机输入上的输出类似"""
+    g = torch.Generator().manual_seed(seed)
+    xy = torch.rand(batch, max_det, 2, generator=g) * 500
+    wh = torch.rand(batch, max_det, 2, generator=g) * 80 + 20
+    score = (torch.rand(batch, max_det, generator=g) * 0.2).sort(-1, descending=True).values
+    cls = torch.randint(0, 2, (batch, max_det), generator=g).float()
+    return torch.cat((xy, xy + wh, score[..., None], cls[..., None]), -1)
+
+
+def test_outputs_match_identical_and_reordered():
+    ref = detections()
+    assert outputs_match(ref, ref.clone())
+    out = ref.clone()
+    out[:, [0, 1]] = out[:, [1, 0]]  # 相近得分的顺序交换
+    assert outputs_match(ref, out)
+    out = ref.clone()
+    out[:, -1, :4] += 200  # topk 之外、低于 conf 的检测不核对框
+    assert outputs_match(ref, out)
+
+
+@pytest.mark.parametrize("row", [0, 9])
+def test_outputs_match_checks_topk_below_conf(row):
+    """所有得分都低于 conf 时，得分最高的 topk 个检测的框与类别仍要一致"""
+    ref = detections()
+    out = ref.clone()
+    out[1, row, :4] += 40
+    assert not outputs_match(ref, out)
+    out = ref.clone()
+    out[0, row, 5] = 1 - out[0, row, 5]
+    assert not outputs_match(ref, out)
+
+
+def test_outputs_match_scores_and_shape():
+    ref = detections()
+    out = ref.clone()
+    out[0, 3, 4] += 0.05
+    assert not outputs_match(ref, out, tol=0.03)
+    assert outputs_match(ref, out, tol=0.1)
+    assert not outputs_match(ref, ref[:, :20])
+
+
+def test_outputs_match_empty():
+    """没有检测（max_det=0）或全部为 0 的输出不会报错"""
+    assert outputs_match(torch.zeros(2, 0, 6), torch.zeros(2, 0, 6))
+    assert outputs_match(torch.zeros(2, 30, 6), torch.zeros(2, 30, 6))
+    assert not outputs_match(torch.zeros(2, 0, 6), torch.zeros(2, 30, 6))
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    return YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False).eval()
+
+
+def test_cache_reuse_and_version(model, tmp_path, monkeypatch):
+    """第二次调用直接使用缓存；CACHE_VERSION 变化后旧记录不再命中，重新调优"""
+    cache = tmp_path / "cpu_optimize.json"
+    kwargs = dict(imgsz=160, batch=1, modes=("eager", "channels_last"), cache=cache)
+    runner = optimize(model, **kwargs)
+    assert isinstance(runner, OptimizedModel) and runner.shape == (1, 3, 160, 160)
+    (key,) = json.loads(cache.read_text())
+    assert key == cache_key(runner.model, runner.shape)
+    assert key.startswith(f"v{cpu_optimize.CACHE_VERSION}-")
+
+    calls = []
+    tune = cpu_optimize.tune
+    monkeypatch.setattr(cpu_optimize, "tune", lambda *args, **kw: calls.append(1) or tune(*args, **kw))
+    assert optimize(model, **kwargs).mode == runner.mode
+    assert not calls
+
+    optimize(model, retune=True, **kwargs)
+    assert len(calls) == 1
+
+    monkeypatch.setattr(cpu_optimize, "CACHE_VERSION", cpu_optimize.CACHE_VERSION + 1)
+    optimize(model, **kwargs)
+    assert len(calls) == 2
+    assert len(json.loads(cache.read_text())) == 2  # 旧版本的记录保留但不再使用
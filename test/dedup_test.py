@@ -0,0 +1,71 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from dedup import HammingIndex, cluster  # noqa: E402
+
+
+def near_duplicates(n=300, n_bits=64, n_centers=20, max_flips=8, seed=0):
+    """以少量中心哈希随机翻转若干位生成的打包哈希，近邻分布接近相邻 CT 切片"""
+    rng = np.random.default_rng(seed)
+    centers = rng.integers(0, 2, (n_centers, n_bits), dtype=np.uint8)
+    bits = centers[rng.integers(0, n_centers, n)]
+    for b in bits:
+        b[rng.choice(n_bits, rng.integers(0, max_flips + 1), replace=False)] ^= 1
+    return np.packbits(bits, axis=1), bits.astype(np.int64)
+
+
+def brute_cluster(bits, valid, groups, priority, radius):
+    """两两比较的领导者聚类"""
+    n = len(bits)
+    rep, dist = np.arange(n), np.zeros(n, dtype=np.int64)
+    for g in set(groups):
+        idx = sorted((i for i in range(n) if groups[i] == g and valid[i]), key=lambda i: priority[i])
+        free = set(idx)
+        for i in idx:
+            if i not in free:
+                continue
+            for j in idx:
+                d = int((bits[i] != bits[j]).sum())
+                if j in free and d <= radius:
+                    free.discard(j)
+                    rep[j], dist[j] = i, d
+    return rep, dist
+
+
+@pytest.mark.parametrize("n_bits", [64, 25])
+@pytest.mark.parametrize("radius", [0, 3, 6, 10])
+def test_index_matches_brute_force(n_bits, radius):
+    """多重索引查询结果与两两比较得到的半径内近邻完全一致（含末字节补 0 的哈希）"""
+    hashes, bits = near_duplicates(n_bits=n_bits, seed=radius)
+    index = HammingIndex(hashes, radius)
+    d_all = (bits[:, None] != bits[None]).sum(2)
+    mask = np.random.default_rng(1).random(len(hashes)) > 0.3
+    for i in range(len(hashes)):
+        nb, d = index.query(i)
+        np.testing.assert_array_equal(nb, np.flatnonzero(d_all[i] <= radius))
+        np.testing.assert_array_equal(d, d_all[i, nb])
+        nb, _ = index.query(i, mask)
+        np.testing.assert_array_equal(nb, np.flatnonzero((d_all[i] <= radius) & mask))
+
+
+@pytest.mark.parametrize("radius", [2, 6])
+def test_cluster_matches_brute_force(radius):
+    """分组、优先级和无效哈希下的聚类结果与两两比较的领导者聚类一致"""
+    hashes, bits = near_duplicates(seed=radius + 10)
+    rng = np.random.default_rng(radius)
+    valid = rng.random(len(hashes)) > 0.05
+    groups = rng.integers(0, 4, len(hashes)).tolist()
+    priority = rng.integers(0, 5, len(hashes)).tolist()
+    rep, dist = cluster(hashes, valid, groups, priority, radius)
+    ref_rep, ref_dist = brute_cluster(bits, valid, groups, priority, radius)
+    np.testing.assert_array_equal(rep, ref_rep)
+    np.testing.assert_array_equal(dist, ref_dist)
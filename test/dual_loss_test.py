@@ -0,0 +1,41 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from dual_loss import FusedV10DetectLoss, random_targets  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+from ultralytics.utils import DEFAULT_CFG  # noqa: E402
+from ultralytics.utils.loss import v10DetectLoss  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model():
+    model = YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False)
+    model.args = DEFAULT_CFG
+    return model.train()
+
+
+def random_preds(model, batch_size, imgsz=160):
+    """两个分支各自的随机特征图，形状与 v10Detect 训练时的输出相同"""
+    head = model.model[-1]
+    shapes = [(batch_size, head.no, imgsz // int(s), imgsz // int(s)) for s in head.stride]
+    return {k: [torch.randn(shape) for shape in shapes] for k in ("one2many", "one2one")}
+
+
+@pytest.mark.parametrize("chunk", [None, 1, 3, 8, 16])
+@pytest.mark.parametrize("n_boxes", [0, 6])
+def test_fused_loss_bit_identical(model, chunk, n_boxes):
+    """融合损失在不同分块大小下都与 v10DetectLoss 逐位一致，包括整个 batch 都没有目标的情况"""
+    torch.manual_seed(chunk or 0)
+    preds, batch = random_preds(model, 8), random_targets(8, n_boxes, nc=2)
+    ref = v10DetectLoss(model)(preds, batch)
+    out = FusedV10DetectLoss(model, chunk=chunk)(preds, batch)
+    assert torch.equal(ref[0], out[0])
+    assert torch.equal(ref[1], out[1])
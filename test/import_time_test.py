@@ -0,0 +1,45 @@
+import os
+import sys
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# 导入耗时预算（秒），可通过环境变量调整
+ULTRALYTICS_BUDGET = float(os.getenv("IMPORT_BUDGET_ULTRALYTICS", 0.3))
+INFER_LITE_OVERHEAD = float(os.getenv("IMPORT_BUDGET_INFER_LITE", 0.3))
+
+
+def run_import(stmt):
+    """在干净的子进程中执行导入语句，返回耗时(秒)和已加载的模块列表"""
+    code = (
+        "import sys, time, json\n"
+        "t = time.perf_counter()\n"
+        f"{stmt}\n"
+        "print(json.dumps([time.perf_counter() - t, sorted(sys.modules)]))\n"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(ROOT), str(ROOT / "tools"), str(ROOT / "ultralytics.zip")])}
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env, cwd=ROOT)
+    if out.returncode:
+        pytest.fail(f"无法执行 `{stmt}`:\n{out.stderr.strip()}")
+    dt, modules = json.loads(out.stdout.strip().splitlines()[-1])
+    return dt, set(modules)
+
+
+def test_ultralytics_import_is_lazy():
+    dt, modules = run_import("import ultralytics")
+    heavy = {"torch", "cv2", "huggingface_hub", "ultralytics.models", "ultralytics.data"} & modules
+    assert not heavy, f"import ultralytics 不应加载 {sorted(heavy)}"
+    assert dt < ULTRALYTICS_BUDGET, f"import ultralytics 耗时 {dt:.3f}s 超出预算 {ULTRALYTICS_BUDGET}s"
+
+
+def test_infer_lite_import_time():
+    pytest.importorskip("torch")
+    pytest.importorskip("cv2")
+    base, _ = run_import("import torch, numpy, cv2")
+    dt, modules = run_import("import infer_lite")
+    assert not any(m == "ultralytics" or m.startswith("ultralytics.") for m in modules)
+    assert dt < base + INFER_LITE_OVERHEAD, f"infer_lite 导入耗时 {dt:.3f}s，基准 torch/numpy/cv2 为 {base:.3f}s"
@@ -0,0 +1,75 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+stats = pytest.importorskip("scipy.stats")
+pytest.importorskip("torch")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from kfold import stratified_group_kfold, summarize  # noqa: E402
+
+
+def synthetic_slices(n_patients=60, nc=2, seed=0):
+    """每个患者 5~40 张切片，各类别目标数随患者变化，约一半切片为背景（最后一列）"""
+    rng = np.random.default_rng(seed)
+    groups, counts = [], []
+    for p in range(n_patients):
+        n = rng.integers(5, 41)
+        rate = rng.gamma(1.0, 0.5, nc)
+        c = rng.poisson(rate, (n, nc)) * (rng.random((n, 1)) < 0.5)
+        groups += [f"patient{p:03d}"] * n
+        counts.append(np.concatenate((c, (c.sum(1, keepdims=True) == 0)), 1))
+    return groups, np.concatenate(counts)
+
+
+@pytest.mark.parametrize("k", [3, 5])
+@pytest.mark.parametrize("seed", [0, 1])
+def test_stratified_group_kfold(k, seed):
+    """每张切片恰好属于一折，同一患者不跨折，各折的类别占比接近 1/k"""
+    groups, counts = synthetic_slices(seed=seed)
+    folds = stratified_group_kfold(groups, counts, k=k, seed=seed)
+    assert folds.shape == (len(groups),)
+    assert set(folds.tolist()) == set(range(k))
+
+    patient_folds = {}
+    for g, f in zip(groups, folds):
+        patient_folds.setdefault(g, set()).add(int(f))
+    assert all(len(f) == 1 for f in patient_folds.values())
+
+    share = np.stack([counts[folds == i].sum(0) for i in range(k)]) / counts.sum(0)
+    np.testing.assert_allclose(share, 1 / k, atol=0.05)
+    np.testing.assert_array_equal(folds, stratified_group_kfold(groups, counts, k=k, seed=seed))  # 只由 seed 决定
+
+
+def test_stratified_group_kfold_too_few_groups():
+    with pytest.raises(AssertionError):
+        stratified_group_kfold(["a", "a", "b"], np.ones((3, 2)), k=3)
+
+
+def test_summarize():
+    """均值、样本标准差与 t 分布置信区间；缺失的指标按 NaN 忽略，单折时区间退化为均值"""
+    folds = [{"map50": 0.60, "map": 0.30}, {"map50": 0.64, "map": 0.34}, {"map50": 0.62}, {"map50": 0.70, "map": 0.32}]
+    s = summarize(folds, confidence=0.9)
+    v = np.array([0.60, 0.64, 0.62, 0.70])
+    half = stats.t.ppf(0.95, 3) * v.std(ddof=1) / 2
+    assert s["map50"]["mean"] == pytest.approx(v.mean())
+    assert s["map50"]["std"] == pytest.approx(v.std(ddof=1))
+    assert s["map50"]["ci_low"] == pytest.approx(v.mean() - half)
+    assert s["map50"]["ci_high"] == pytest.approx(v.mean() + half)
+    m = np.array([0.30, 0.34, 0.32])  # 第 3 折缺失，按 3 折计算自由度与标准误
+    half = stats.t.ppf(0.95, 2) * m.std(ddof=1) / np.sqrt(3)
+    assert s["map"]["mean"] == pytest.approx(0.32)
+    assert s["map"]["std"] == pytest.approx(m.std(ddof=1))
+    assert s["map"]["ci_low"] == pytest.approx(0.32 - half)
+    assert s["map"]["ci_high"] == pytest.approx(0.32 + half)
+
+    partial = summarize([{"map50": 0.5, "recall": 0.4}, {"map50": 0.7}])["recall"]  # 只有一折给出
+    assert partial == {"mean": 0.4, "std": 0.0, "ci_low": 0.4, "ci_high": 0.4}
+
+    single = summarize([{"map50": 0.5}])["map50"]
+    assert single == {"mean": 0.5, "std": 0.0, "ci_low": 0.5, "ci_high": 0.5}
@@ -0,0 +1,58 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from onnx_iobinding import IOBindingSession, benchmark, export_onnx  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+
+IMGSZ, MAX_DET = 160, 50
+
+
+@pytest.fixture(scope="module")
+def onnx_file(tmp_path_factory):
+    """随机初始化的小模型导出的动态批大小 ONNX 文件"""
+    torch.manual_seed(0)
+    model = YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False)
+    ckpt = tmp_path_factory.mktemp("onnx") / "tiny.pt"
+    torch.save({"model": model}, ckpt)
+    return export_onnx(str(ckpt), imgsz=IMGSZ, max_det=MAX_DET)
+
+
+def test_output_buffers_reused(onnx_file):
+    """每种批形状的输出写入同一块预分配缓冲区，结果与 session.run 一致"""
+    runner = IOBindingSession(onnx_file)
+    names = [o.name for o in runner.outputs]
+    for batch in (1, 3, 1):
+        im = torch.rand(batch, 3, IMGSZ, IMGSZ)
+        ref = runner.session.run(names, {runner.input.name: im.numpy()})[0]
+        first = runner(im)
+        assert first.shape == (batch, MAX_DET, 6)
+        ptr = first.data_ptr()
+        torch.testing.assert_close(first, torch.from_numpy(ref))
+        for _ in range(3):
+            assert runner(torch.rand(batch, 3, IMGSZ, IMGSZ)).data_ptr() == ptr
+    assert len(runner._bindings) == 2
+
+
+def test_input_copied_into_buffer(onnx_file):
+    """非连续或 float64 的输入复制到预分配的输入缓冲区后推理"""
+    runner = IOBindingSession(onnx_file)
+    im = torch.rand(2, 3, IMGSZ, IMGSZ)
+    ref = runner(im).clone()
+    torch.testing.assert_close(runner(im.double()), ref)
+    torch.testing.assert_close(runner(im.transpose(2, 3).contiguous().transpose(2, 3)), ref)
+
+
+def test_benchmark_reports_reuse(onnx_file):
+    result = benchmark(onnx_file, batch=2, imgsz=IMGSZ, iters=2)
+    assert result["buffers_reused"]
+    assert result["max_abs_diff"] < 1e-4
@@ -0,0 +1,83 @@
+import sys
+import json
+from pathlib import Path
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("psutil")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from parallel_tune import AshaRungs, AshaTrialTrainer, asha_rungs  # noqa: E402
+from ultralytics.cfg import get_cfg  # noqa: E402
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer  # noqa: E402
+
+
+@pytest.mark.parametrize(
+    "epochs, eta, min_epochs, expected",
+    [(30, 3, 3, [3, 10]), (30, 3, 1, [1, 3, 10]), (100, 4, 5, [6, 25]), (2, 3, 1, [])],
+)
+def test_asha_rungs(epochs, eta, min_epochs, expected):
+    """检查点按 eta 逐级缩小，不小于 min_epochs，且不包含最后一个 epoch"""
+    assert asha_rungs(epochs, eta, min_epochs) == expected
+
+
+def test_asha_promotion_and_pruning(tmp_path):
+    """记录不足 eta 条时一律晋级，之后只有不低于前 1/eta 的 trial 继续训练"""
+    path = tmp_path / "asha_rungs.json"
+    asha = AshaRungs(path, rungs=[3, 10], eta=3)
+    assert asha.report(1, 2, 0.0)  # 不是检查点
+    assert not path.exists()
+
+    assert asha.report(1, 3, 0.5)
+    assert asha.report(2, 3, 0.9)
+    assert not asha.report(3, 3, 0.1)  # [0.9, 0.5, 0.1] 只保留前 1 名
+    assert asha.report(4, 3, 0.95)
+    assert not asha.report(5, 3, 0.6)
+    assert asha.report(6, 3, 0.9)  # 6 条记录保留前 2 名，与第 2 名持平时晋级
+    assert asha.report(1, 10, 0.2)  # 各检查点分别统计
+
+    records = json.loads(path.read_text())
+    assert records["3"] == {"1": 0.5, "2": 0.9, "3": 0.1, "4": 0.95, "5": 0.6, "6": 0.9}
+    assert records["10"] == {"1": 0.2}
+
+    # 另一个进程中的实例读取同一文件
+    assert not AshaRungs(path, rungs=[3, 10], eta=3).report(7, 3, 0.3)
+
+
+@pytest.mark.parametrize("fitness, stopped", [(0.5, True), (0.95, False)])
+def test_trial_trainer_stops_at_rung(tmp_path, monkeypatch, fitness, stopped):
+    """trial 只在检查点 epoch 打开验证并上报，被已有记录淘汰时设置 stop，其余 epoch 保持 val=False"""
+    path = tmp_path / "asha_rungs.json"
+    path.write_text(json.dumps({"3": {"0": 0.9, "1": 0.8, "2": 0.7}}))
+
+    def init(self, *args, **kwargs):  # 只保留 AshaTrialTrainer 用到的 trainer 状态
+        self.args = get_cfg(overrides={"val": False, "val_period": 5})
+        self.callbacks = defaultdict(list)
+        self.fitness, self.stop = None, False
+
+    class Trial(AshaTrialTrainer):
+        rungs, eta, rung_file, trial = (3, 6), 3, str(path), 3
+
+    monkeypatch.setattr(YOLOv10DetectionTrainer, "__init__", init)
+    trainer = Trial()
+    for epoch in range(6):
+        if trainer.stop:
+            break
+        trainer.epoch = epoch
+        trainer.run_callbacks("on_train_epoch_end")
+        assert trainer.args.val is (epoch + 1 in Trial.rungs)
+        assert trainer.args.val_period == (1 if trainer.args.val else 5)
+        trainer.fitness = fitness if trainer.args.val else None
+        trainer.run_callbacks("on_fit_epoch_end")
+        assert not trainer.args.val and trainer.args.val_period == 5
+
+    assert trainer.stop is stopped
+    assert trainer.epoch == (2 if stopped else 5)
+    records = json.loads(path.read_text())
+    assert records["3"]["3"] == fitness
+    assert records.get("6", {}) == ({} if stopped else {"3": fitness})
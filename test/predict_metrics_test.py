@@ -0,0 +1,73 @@
+import sys
+import math
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from predict_metrics import Histogram, PredictMetrics  # noqa: E402
+
+
+def test_histogram_buckets_and_quantiles():
+    """值等于桶上界时计入该桶（le 语义），超过最大上界时计入 +Inf"""
+    h = Histogram((1, 2, 5))
+    assert math.isnan(h.quantile(0.5))
+    for v in (0.5, 1, 1.5, 2, 10):
+        h.observe(v)
+    assert h.counts == [2, 2, 0, 1]
+    assert (h.count, h.sum) == (5, 15.0)
+    assert h.quantile(0.2) == pytest.approx(0.5)
+    assert h.quantile(0.5) == pytest.approx(1.25)
+    assert h.quantile(1.0) == 5  # 落在 +Inf 桶
+
+
+def sample_metrics():
+    metrics = PredictMetrics(prefix="t", latency_buckets=(0.5, 1))
+    labels = (("model", "m"),)
+    for v in (0.25, 0.5, 3):
+        metrics.observe("stage_seconds", v, labels + (("stage", "inference"),))
+    metrics.inc("images_total", 3, labels)
+    metrics.set_max("rss_peak_bytes", 100, labels)
+    metrics.set_max("rss_peak_bytes", 50, labels)
+    return metrics
+
+
+def test_render_exposition_format():
+    """HELP/TYPE、累积的 _bucket（含 +Inf）、_sum 与 _count，按指标名排序"""
+    assert sample_metrics().render() == (
+        "# HELP t_images_total Images processed\n"
+        "# TYPE t_images_total counter\n"
+        't_images_total{model="m"} 3\n'
+        "# HELP t_rss_peak_bytes Peak resident set size of the process\n"
+        "# TYPE t_rss_peak_bytes gauge\n"
+        't_rss_peak_bytes{model="m"} 100\n'
+        "# HELP t_stage_seconds Per-batch latency of each prediction stage\n"
+        "# TYPE t_stage_seconds histogram\n"
+        't_stage_seconds_bucket{model="m",stage="inference",le="0.5"} 2\n'
+        't_stage_seconds_bucket{model="m",stage="inference",le="1"} 2\n'
+        't_stage_seconds_bucket{model="m",stage="inference",le="+Inf"} 3\n'
+        't_stage_seconds_sum{model="m",stage="inference"} 3.75\n'
+        't_stage_seconds_count{model="m",stage="inference"} 3\n'
+    )
+
+
+def test_render_escaping_and_special_values():
+    """标签值中的反斜杠、引号与换行被转义，非有限值按 +Inf/NaN 输出"""
+    metrics = PredictMetrics(prefix="t")
+    metrics.inc("busy_seconds_total", 0.125, (("model", 'a\\b"c\nd'),))
+    metrics.set_max("cuda_memory_peak_bytes", float("inf"))
+    text = metrics.render()
+    assert 't_busy_seconds_total{model="a\\\\b\\"c\\nd"} 0.125\n' in text
+    assert "t_cuda_memory_peak_bytes +Inf\n" in text
+
+
+def test_render_parses_with_prometheus_client():
+    parser = pytest.importorskip("prometheus_client.parser")
+    families = {f.name: f for f in parser.text_string_to_metric_families(sample_metrics().render())}
+    assert families["t_stage_seconds"].type == "histogram"
+    samples = {(s.name, s.labels.get("le")): s.value for s in families["t_stage_seconds"].samples}
+    assert samples[("t_stage_seconds_bucket", "+Inf")] == 3
+    assert samples[("t_stage_seconds_sum", None)] == 3.75
+    assert families["t_images"].type == "counter"  # 解析器去掉 counter 的 _total 后缀
@@ -0,0 +1,89 @@
+import sys
+import json
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("torch")
+pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from result_store import STORE_FORMAT, CompactResult, ResultSink, ResultStore  # noqa: E402
+
+NAMES = {0: "emphysema", 1: "bulla"}
+COUNTS = [2, 0, 1, 4, 0, 3, 1, 0]
+
+
+def make_results(counts=COUNTS, seed=0):
+    """每张切片 counts[i] 个随机检测，文件名末尾为切片序号"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for i, n in enumerate(counts):
+        xy = rng.random((n, 2)) * 400
+        data = np.concatenate((xy, xy + 50, rng.random((n, 1)), rng.integers(0, 2, (n, 1))), 1)
+        results.append(CompactResult(f"patient01/p01_{i + 10:04d}.png", NAMES, (512, 512), data.astype(np.float32)))
+    return results
+
+
+def test_sink_store_round_trip(tmp_path):
+    """按图像数与检测数分块写入，manifest 记录每个块，读取时逐块惰性加载且与写入的结果一致"""
+    results = make_results()
+    with ResultSink(tmp_path, names=NAMES, chunk_images=3, chunk_detections=5) as sink:
+        for r in results:
+            sink.append(r)
+
+    manifest = json.loads((tmp_path / "manifest.json").read_text())
+    assert manifest["format"] == STORE_FORMAT
+    assert manifest["names"] == {"0": "emphysema", "1": "bulla"}
+    assert manifest["chunks"] == [  # 第 2 块因检测数达到 5 提前结束，最后一块由 close 写出
+        {"file": "part-00000.npz", "images": 3, "detections": 3},
+        {"file": "part-00001.npz", "images": 3, "detections": 7},
+        {"file": "part-00002.npz", "images": 2, "detections": 1},
+    ]
+
+    store = ResultStore(tmp_path)
+    assert len(store) == len(results) and store.n_detections == sum(COUNTS)
+    assert store.names == NAMES
+    assert store._cache[0] is None  # 打开时不加载任何块
+    for i in (4, 0, 7, -1):
+        r, ref = store[i], results[i]
+        assert store._cache[0] == i % len(results) // 3
+        assert r.path == ref.path and r.orig_shape == (512, 512)
+        np.testing.assert_array_equal(r.data, ref.data)
+    with pytest.raises(IndexError):
+        store[len(results)]
+    assert [len(r) for r in store] == COUNTS
+    assert store.find(results[5].path).path == results[5].path
+    assert store.find("missing.png") is None
+
+    chunks = list(store.detections(cls=1, min_conf=0.5))
+    assert len(chunks) == 3
+    conf = np.concatenate([c["conf"] for c in chunks])
+    ref = np.concatenate([r.data for r in results])
+    keep = (ref[:, 5] == 1) & (ref[:, 4] >= 0.5)
+    np.testing.assert_array_equal(conf, ref[keep, 4])
+    assert all((c["cls"] == 1).all() for c in chunks)
+    slices = np.concatenate([c["slice"] for c in chunks])
+    np.testing.assert_array_equal(slices, np.repeat(np.arange(10, 18), COUNTS)[keep])
+
+
+def test_sink_appends_to_existing(tmp_path):
+    """目录已存在时继续追加新的块"""
+    first, second = make_results(COUNTS[:4]), make_results(COUNTS[4:], seed=1)
+    with ResultSink(tmp_path, names=NAMES) as sink:
+        for r in first:
+            sink.append(r)
+    with ResultSink(tmp_path) as sink:
+        for r in second:
+            sink.append(r, slice_idx=99)
+
+    store = ResultStore(tmp_path)
+    assert [c["file"] for c in store.chunks] == ["part-00000.npz", "part-00001.npz"]
+    assert len(store) == len(COUNTS) and store.names == NAMES
+    np.testing.assert_array_equal(store[-1].data, second[-1].data)
+    assert set(next(store.detections())["slice"]) <= set(range(10, 14))
+    assert set(list(store.detections())[1]["slice"]) <= {99}
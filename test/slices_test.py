@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+from slices import box_counts, label_classes, patient_id, split_files  # noqa: E402
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """images/ 下 3 张切片（其中一张为背景、一张没有标签文件），以及引用其中两张的列表文件"""
+    (tmp_path / "images").mkdir()
+    (tmp_path / "labels").mkdir()
+    for name in ("p01_0001.png", "p01_0002.png", "p02_0001.jpg", "notes.txt"):
+        (tmp_path / "images" / name).touch()
+    (tmp_path / "labels" / "p01_0001.txt").write_text("0 0.5 0.5 0.1 0.1\n1 0.2 0.2 0.1 0.1\n1 0.7 0.7 0.1 0.1\n")
+    (tmp_path / "labels" / "p01_0002.txt").write_text("")
+    (tmp_path / "val.txt").write_text("./images/p01_0002.png\nimages/p02_0001.jpg\n")
+    return tmp_path
+
+
+def test_split_files(dataset):
+    """目录只列出图像，列表文件中的相对路径相对于列表所在目录，多个来源合并排序"""
+    images = [str(dataset / "images" / f) for f in ("p01_0001.png", "p01_0002.png", "p02_0001.jpg")]
+    assert split_files({"train": str(dataset / "images")}, "train") == images
+    assert split_files({"val": str(dataset / "val.txt")}, "val") == images[1:]
+    assert split_files({"train": [str(dataset / "val.txt"), str(dataset / "images")]}, "train") == sorted(
+        images + images[1:]
+    )
+    with pytest.raises(FileNotFoundError):
+        split_files({"test": str(dataset / "missing")}, "test")
+
+
+@pytest.mark.parametrize(
+    "path, pattern, expected",
+    [
+        ("data/patient01_0123.png", None, "patient01"),
+        ("data/patient01-12.png", None, "patient01"),
+        ("data/case7/0042.png", None, "case7"),
+        ("data/ct_A12_s3.png", r"ct_(\w+?)_s", "A12"),
+        ("data/other.png", r"ct_(\w+?)_s", "other"),
+    ],
+)
+def test_patient_id(path, pattern, expected):
+    assert patient_id(path, pattern) == expected
+
+
+def test_label_classes_and_box_counts(dataset):
+    """背景切片与缺失的标签文件都没有目标框"""
+    files = split_files({"train": str(dataset / "images")}, "train")
+    assert label_classes(files) == [[0, 1, 1], [], []]
+    assert box_counts(files).tolist() == [3, 0, 0]
+    assert box_counts(files, classes={1}).tolist() == [2, 0, 0]
@@ -0,0 +1,104 @@
+import sys
+import copy
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("safetensors")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+import infer_lite  # noqa: E402
+from export_slim import export_slim  # noqa: E402
+from ultralytics.models.yolov10.slim import load_slim, strip_one2many  # noqa: E402
+from ultralytics.nn.autobackend import AutoBackend  # noqa: E402
+from ultralytics.nn.tasks import YOLOv10DetectionModel  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def exported(tmp_path_factory):
+    """导出一个随机初始化的小模型，返回精简文件路径和同样经过 strip_one2many 与 fuse 的参考模型"""
+    torch.manual_seed(0)
+    model = YOLOv10DetectionModel("yolov10n.yaml", nc=2, verbose=False)
+    for m in model.modules():  # 非平凡的 BN 统计量，使融合真正改变权重
+        if isinstance(m, torch.nn.BatchNorm2d):
+            m.running_mean.uniform_(-0.1, 0.1)
+            m.running_var.uniform_(0.5, 1.5)
+    model.names = {0: "emphysema", 1: "bulla"}
+    ckpt = tmp_path_factory.mktemp("slim") / "tiny.pt"
+    torch.save({"model": model}, ckpt)
+
+    ref = strip_one2many(copy.deepcopy(model).eval(), max_det=50)
+    ref.fuse(verbose=False)
+    return export_slim(str(ckpt), max_det=50), ref
+
+
+def images():
+    torch.manual_seed(1)
+    return torch.rand(2, 3, 160, 160)
+
+
+@torch.no_grad()
+def test_load_slim_matches_fused(exported):
+    """load_slim 重建的模型与原模型 strip_one2many + fuse 后的输出一致，元数据完整保留"""
+    path, ref = exported
+    model = load_slim(path)
+    im = images()
+    out = model(im)
+    assert out.shape == (2, 50, 6)
+    torch.testing.assert_close(out, ref(im))
+    assert model.names == ref.names
+    assert torch.equal(model.stride, ref.stride)
+    assert not hasattr(model.model[-1], "cv2") and not hasattr(model.model[-1], "cv3")
+
+
+@torch.no_grad()
+def test_load_slim_without_assign(exported, monkeypatch):
+    """torch<2.1 没有 load_state_dict(assign=True) 时回退到直接替换参数，结果相同"""
+    path, ref = exported
+    load_state_dict = torch.nn.Module.load_state_dict
+
+    def legacy(self, state_dict, strict=True, **kwargs):
+        if kwargs:
+            raise TypeError(f"load_state_dict() got an unexpected keyword argument '{next(iter(kwargs))}'")
+        return load_state_dict(self, state_dict, strict)
+
+    monkeypatch.setattr(torch.nn.Module, "load_state_dict", legacy)
+    model = load_slim(path)
+    im = images()
+    torch.testing.assert_close(model(im), ref(im))
+
+
+@torch.no_grad()
+def test_autobackend_slim(exported):
+    """AutoBackend 按 .safetensors 后缀加载精简模型，前向结果与融合后的模型一致"""
+    path, ref = exported
+    backend = AutoBackend(path, device=torch.device("cpu"), fuse=True, verbose=False)
+    assert backend.pt and backend.stride == 32
+    assert backend.names == ref.names
+    im = images()
+    torch.testing.assert_close(backend(im), ref(im))
+
+
+@torch.no_grad()
+def test_torchscript_matches_slim(exported, tmp_path):
+    """小尺寸导出的 TorchScript 经 infer_lite 推理，batch>1 时与 load_slim 的结果一致"""
+    path, _ = exported
+    output = export_slim(path.replace(".slim.safetensors", ".pt"), str(tmp_path / "tiny.slim.safetensors"),
+                         max_det=50, torchscript=True, imgsz=160)
+    model, metadata = infer_lite.load_model(str(tmp_path / "tiny.slim.torchscript"))
+    assert metadata["imgsz"] == [160, 160] and metadata["max_det"] == 50
+
+    rng = np.random.default_rng(0)
+    imgs = [rng.integers(0, 256, (h, w, 3), dtype=np.uint8) for h, w in ((160, 160), (120, 200), (200, 96))]
+    dets = infer_lite.predict(model, metadata, imgs, conf=0.0)
+    x, ratio_pad = infer_lite.preprocess(imgs, (160, 160))
+    ref = infer_lite.postprocess(load_slim(output)(x), imgs, ratio_pad, conf=0.0)
+    assert len(dets) == 3
+    for det, r in zip(dets, ref):
+        assert det.shape == (50, 6)
+        np.testing.assert_allclose(det, r, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,185 @@
+import sys
+import csv
+from pathlib import Path
+from collections import defaultdict
+
+import pytest
+
+pytest.importorskip("torch")
+cv2 = pytest.importorskip("cv2")
+pytest.importorskip("ultralytics")
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "tools"))
+
+import numpy as np  # noqa: E402
+
+import stage_profile  # noqa: E402
+from stage_profile import ProfiledYOLODataset, StageProfileTrainer, StageTimer, TimedTransform  # noqa: E402
+from ultralytics.cfg import get_cfg  # noqa: E402
+from ultralytics.data import base as data_base  # noqa: E402
+
+
+class FakeClock:
+    """手动推进的 perf_counter"""
+
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(stage_profile.time, "perf_counter", clock)
+    return clock
+
+
+def test_stage_timer_exclusive(clock):
+    """嵌套阶段只把独占时间记到外层，重复进入的阶段累计次数"""
+    timer = StageTimer()
+    with timer.stage("mosaic"):
+        clock.t += 1.0
+        for _ in range(2):
+            with timer.stage("imread"):
+                clock.t += 2.0
+                with timer.stage("resize"):
+                    clock.t += 0.5
+        clock.t += 0.25
+    assert timer.pop() == {"mosaic": (1.25, 1), "imread": (4.0, 2), "resize": (1.0, 2)}
+    assert timer.pop() == {}
+
+
+def test_stage_timer_disabled(clock):
+    timer = StageTimer(enabled=False)
+    with timer.stage("imread"):
+        clock.t += 1.0
+    assert timer.pop() == {}
+
+
+class Flip:
+    p = 0.5
+
+    def __init__(self, clock):
+        self.clock = clock
+
+    def __call__(self, labels):
+        self.clock.t += 3.0
+        return {**labels, "flipped": True}
+
+
+def test_timed_transform(clock):
+    """包装后的增强按类名计时，结果与属性透传给原始增强"""
+    timer = StageTimer()
+    t = TimedTransform(Flip(clock), timer)
+    with timer.stage("label"):
+        clock.t += 1.0
+        out = t({"img": None})
+    assert out["flipped"] and t.p == 0.5
+    assert timer.pop() == {"label": (1.0, 1), "augment/Flip": (3.0, 1)}
+
+
+def fake_trainer(tmp_path):
+    trainer = object.__new__(StageProfileTrainer)
+    trainer.clock = stage_profile.LapClock()
+    trainer.loader_totals = defaultdict(float)
+    trainer.callbacks = defaultdict(list)
+    trainer._hooks, trainer.stage_rows = [], []
+    trainer.save_dir = tmp_path
+    trainer.stage_csv = tmp_path / "stage_times.csv"
+    return trainer
+
+
+def test_stage_summary_csv(tmp_path):
+    """等待数据超过阈值判定为 dataloader-bound，每个 epoch 以所有列的并集重写 CSV"""
+    trainer = fake_trainer(tmp_path)
+    summaries = []
+    trainer.add_callback("on_stage_summary", lambda t: summaries.append(t.stage_summary))
+
+    epochs = [
+        ({"data": 3.0, "forward": 4.0, "backward": 3.0}, {"imread": 2.0, "augment/Mosaic": 6.0}, 100),
+        ({"data": 1.0, "forward": 6.0, "backward": 3.0}, {"imread": 2.0, "augment/LetterBox": 1.0}, 100),
+    ]
+    for epoch, (trainer_s, loader_s, n) in enumerate(epochs):
+        trainer.epoch = epoch
+        trainer.clock.totals.clear()
+        trainer.clock.totals.update(trainer_s)
+        trainer.loader_totals.clear()
+        trainer.loader_totals.update(loader_s)
+        trainer.loader_images = n
+        trainer._summarize_stages()
+
+    assert [s["verdict"] for s in summaries] == ["dataloader-bound", "compute-bound"]
+    assert summaries[0]["data_fraction"] == pytest.approx(0.3)
+    assert list(summaries[0]["loader_ms_per_image"]) == ["augment/Mosaic", "imread"]  # 从慢到快
+    assert summaries[0]["trainer_s"]["h2d"] == 0.0
+
+    with open(trainer.stage_csv) as f:
+        rows = list(csv.DictReader(f))
+    assert [r["epoch"] for r in rows] == ["1", "2"]
+    assert float(rows[0]["augment/Mosaic_ms_per_img"]) == pytest.approx(60.0)
+    assert rows[0]["augment/LetterBox_ms_per_img"] == ""
+    assert float(rows[1]["augment/LetterBox_ms_per_img"]) == pytest.approx(10.0)
+    assert float(rows[1]["forward_s"]) == 6.0
+
+
+@pytest.fixture(scope="module")
+def image_dir(tmp_path_factory):
+    """4 张带一个目标的随机图像"""
+    root = tmp_path_factory.mktemp("stage_profile")
+    rng = np.random.default_rng(0)
+    for sub in ("images", "labels"):
+        (root / sub).mkdir()
+    for i in range(4):
+        cv2.imwrite(str(root / "images" / f"{i}.png"), rng.integers(0, 256, (80, 100, 3), dtype=np.uint8))
+        (root / "labels" / f"{i}.txt").write_text("0 0.5 0.5 0.2 0.2\n")
+    return root / "images"
+
+
+def build(image_dir, profile):
+    return ProfiledYOLODataset(
+        img_path=str(image_dir),
+        imgsz=64,
+        batch_size=2,
+        augment=True,
+        hyp=get_cfg(),
+        data={"names": {0: "emphysema"}, "nc": 1},
+        profile=profile,
+    )
+
+
+def timed(compose):
+    return any(isinstance(t, TimedTransform) or hasattr(t, "transforms") and timed(t) for t in compose.transforms)
+
+
+def test_dataset_profile(image_dir):
+    """开启计时时 batch 带上各阶段耗时，load_image 返回后 cv2 模块已还原"""
+    dataset = build(image_dir, profile=True)
+    assert timed(dataset.transforms)
+    batch = dataset.collate_fn([dataset[0], dataset[1]])
+    assert data_base.cv2 is cv2
+    stages = batch["stage_times"]
+    assert {"imread", "resize", "load_image", "label", "collate"} <= set(stages)
+    assert any(k.startswith("augment/") for k in stages)
+    assert stages["imread"][1] >= 2
+
+
+def test_dataset_profile_off(image_dir, monkeypatch):
+    """profile=False 时数据集和训练器都不做任何替换：不包装增强、不替换 cv2、batch 中没有计时结果"""
+    dataset = build(image_dir, profile=False)
+    assert not timed(dataset.transforms)
+    monkeypatch.setattr(data_base, "cv2", cv2)
+    seen = []
+    monkeypatch.setattr(cv2, "imread", lambda *a, **k: seen.append(data_base.cv2) or np.zeros((80, 100, 3), np.uint8))
+    batch = dataset.collate_fn([dataset[0], dataset[1]])
+    assert seen and all(m is cv2 for m in seen)
+    assert "stage_times" not in batch and dataset.timer.pop() == {}
+
+    monkeypatch.setattr(StageProfileTrainer, "profile_loader", False)
+    trainer = object.__new__(StageProfileTrainer)
+    trainer.args = get_cfg(overrides={"imgsz": 64})
+    trainer.model, trainer.data = None, {"names": {0: "emphysema"}, "nc": 1}
+    dataset = trainer.build_dataset(str(image_dir), "train", batch=2)
+    assert not dataset.timer.enabled and not timed(dataset.transforms)
@@ -0,0 +1,213 @@
+import os
+import math
+
+import torch
+from torch import distributed as dist
+from torch.utils.data import Sampler
+
+from ultralytics.data.build import InfiniteDataLoader, seed_worker
+from ultralytics.data.utils import PIN_MEMORY
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.utils import LOGGER, RANK, colorstr
+from ultralytics.utils.torch_utils import de_parallel, torch_distributed_zero_first
+
+
+class BackgroundSampler(Sampler):
+    """
+    保留全部阳性切片、每个 epoch 按比例重新抽取空标签（背景）切片的采样器，支持 DDP
+
+    每次迭代（即每个 epoch）使用 seed + 迭代次数 作为随机种子，因此各 rank 抽取结果一致，
+    再按 rank 切分。InfiniteDataLoader 的 worker 会在当前 epoch 结束前预取下一个 epoch 的索引，
+    迭代时 trainer 的 epoch 可能尚未更新，因此不以 epoch 作为种子，set_epoch 不影响抽样。
+    update_hard_negatives 只影响之后的抽样，要在下一个 epoch 生效需重置 dataloader。
+
+    参数:
+        dataset: YOLODataset
+        bg_fraction: 每个 epoch 保留的背景切片比例 (0-1]
+        hard_fraction: 背景名额中优先分配给难负样本的最大比例
+        shuffle: 是否打乱
+        seed: 随机种子
+        num_replicas: 进程数（可选，默认从进程组获取）
+        rank: 当前进程的 rank（可选，默认从进程组获取）
+    """
+
+    def __init__(
+        self, dataset, bg_fraction=0.25, hard_fraction=0.5, shuffle=True, seed=0, num_replicas=None, rank=None
+    ):
+        self.im_files = dataset.im_files
+        self.pos = [i for i, lb in enumerate(dataset.labels) if len(lb["cls"])]
+        self.bg = [i for i, lb in enumerate(dataset.labels) if not len(lb["cls"])]
+        self.n_bg = min(len(self.bg), max(0, round(len(self.bg) * bg_fraction)))
+        self.hard_fraction = hard_fraction
+        self.shuffle = shuffle
+        self.seed = seed
+
+        distributed = dist.is_available() and dist.is_initialized()
+        if num_replicas is None:
+            num_replicas = dist.get_world_size() if distributed else 1
+        if rank is None:
+            rank = dist.get_rank() if distributed else 0
+        self.num_replicas, self.rank = num_replicas, rank
+        self.num_samples = math.ceil((len(self.pos) + self.n_bg) / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+
+        self.iteration = 0
+        self.hard = []
+
+    def __iter__(self):
+        g = torch.Generator()
+        g.manual_seed(self.seed + self.iteration)
+        self.iteration += 1
+
+        # 难负样本优先占用部分背景名额，其余名额从剩余背景切片中随机抽取
+        n_hard = self._n_hard()
+        hard = [self.hard[i] for i in torch.randperm(len(self.hard), generator=g)[:n_hard].tolist()]
+        chosen = set(hard)
+        rest = [i for i in self.bg if i not in chosen]
+        rest = [rest[i] for i in torch.randperm(len(rest), generator=g)[: self.n_bg - n_hard].tolist()]
+
+        indices = self.pos + hard + rest
+        if self.shuffle:
+            indices = [indices[i] for i in torch.randperm(len(indices), generator=g).tolist()]
+        indices += indices[: self.total_size - len(indices)]  # pad to be evenly divisible
+        return iter(indices[self.rank : self.total_size : self.num_replicas])
+
+    def __len__(self):
+        return self.num_samples
+
+    def _n_hard(self):
+        return min(len(self.hard), int(self.n_bg * self.hard_fraction))
+
+    def set_epoch(self, epoch):
+        """DDP 训练时 trainer 会调用；抽样按迭代次数播种，与 epoch 无关"""
+
+    def update_hard_negatives(self, im_files):
+        """
+        设置难负样本，返回是否有变化；之后的抽样开始使用
+
+        各 rank 须在同一同步点调用（如 all_gather 之后），并随后重置 dataloader 丢弃已预取的索引，
+        保证所有 rank 从同一次抽样开始使用同一份难负样本。
+        """
+        index = {f: i for i, f in enumerate(self.im_files)}
+        bg = set(self.bg)
+        hard = sorted(index[f] for f in im_files if f in index and index[f] in bg)
+        changed = hard != self.hard
+        self.hard = hard
+        return changed
+
+    def summary(self):
+        return {
+            "positive": len(self.pos),
+            "background": len(self.bg),
+            "background_kept": self.n_bg,
+            "hard_negatives": self._n_hard(),
+            "epoch_size": len(self.pos) + self.n_bg,
+        }
+
+
+class BackgroundSamplingTrainer(YOLOv10DetectionTrainer):
+    """
+    训练集使用 BackgroundSampler 的 YOLOv10 训练器
+
+    空标签切片每个 epoch 只抽取 bg_fraction 比例；训练前向中最高置信度超过 hard_conf 的背景切片
+    被视为难负样本，从下一个 epoch 起优先抽取。置信度由检测头上的前向钩子记录，钩子只在 epoch 内注册，
+    不包装 model.criterion，检查点中不会带上 trainer。参数以类属性配置，DDP 子进程按类名重建 trainer 时同样生效。
+
+    mosaic/mixup 的训练图像由多张切片拼接，无法把得分归到单张切片，因此只在关闭 mosaic 的 epoch
+    （close_mosaic 之后，或 mosaic=0 且 mixup=0）挖掘难负样本。难负样本变化时会重置 dataloader，
+    丢弃 worker 已预取的索引，否则要再晚一个 epoch 才生效。
+
+    用法:
+        >>> class EmphysemaTrainer(BackgroundSamplingTrainer):
+        ...     bg_fraction = 0.2
+        >>> model = YOLOv10("yolov10n.yaml")
+        >>> model.train(data="configs/emphysema.yaml", trainer=EmphysemaTrainer)
+    """
+
+    bg_fraction = 0.25
+    hard_fraction = 0.5
+    hard_conf = 0.25
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bg_scores = {}
+        self._batch = None
+        self._miner = None
+        self.add_callback("on_train_epoch_start", lambda trainer: trainer._start_epoch())
+        self.add_callback("on_train_epoch_end", lambda trainer: trainer._update_hard_negatives())
+
+    def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+        if mode != "train":
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+        with torch_distributed_zero_first(rank):  # init dataset *.cache only once if DDP
+            dataset = self.build_dataset(dataset_path, mode, batch_size)
+        sampler = BackgroundSampler(dataset, self.bg_fraction, self.hard_fraction, seed=self.args.seed)
+
+        nd = torch.cuda.device_count()  # number of CUDA devices
+        nw = min([os.cpu_count() // max(nd, 1), self.args.workers])  # number of workers
+        generator = torch.Generator()
+        generator.manual_seed(6148914691236517205 + RANK)
+        return InfiniteDataLoader(
+            dataset=dataset,
+            batch_size=min(batch_size, len(sampler)),
+            shuffle=False,
+            num_workers=nw,
+            sampler=sampler,
+            pin_memory=PIN_MEMORY,
+            collate_fn=getattr(dataset, "collate_fn", None),
+            worker_init_fn=seed_worker,
+            generator=generator,
+        )
+
+    def preprocess_batch(self, batch):
+        self._batch = super().preprocess_batch(batch)
+        return self._batch
+
+    def _mining(self):
+        """当前 epoch 的训练图像是否为未拼接的单张切片"""
+        if self.args.close_mosaic and self.epoch >= self.epochs - self.args.close_mosaic:
+            return True  # trainer 在 on_train_epoch_start 之后才关闭 mosaic
+        return self.args.mosaic == 0 and self.args.mixup == 0
+
+    def _mine(self, head, inputs, preds):
+        """检测头的前向钩子，记录训练前向中空标签切片的最高类别置信度"""
+        if not head.training or self._batch is None:
+            return
+        batch = self._batch
+        with torch.no_grad():
+            scores = torch.cat([xi.view(xi.shape[0], head.no, -1) for xi in preds["one2one"]], 2)[:, head.reg_max * 4 :]
+            scores = scores.amax((1, 2)).sigmoid().tolist()
+        counts = torch.bincount(batch["batch_idx"].long(), minlength=len(scores)).tolist()
+        for f, n, s in zip(batch["im_file"], counts, scores):
+            if n == 0:
+                self.bg_scores[f] = s
+
+    def _start_epoch(self):
+        mining = self._mining()
+        if mining:
+            self._miner = de_parallel(self.model).model[-1].register_forward_hook(self._mine)
+        if RANK in (-1, 0):
+            s = self.train_loader.sampler.summary()
+            LOGGER.info(
+                f"{colorstr('background sampler:')} {s['positive']} 张阳性 + {s['background_kept']}/{s['background']} "
+                f"张背景 (其中难负样本 {s['hard_negatives']}) = 每 epoch {s['epoch_size']} 张"
+                + ("" if mining else "，mosaic 开启中，暂不挖掘难负样本")
+            )
+
+    def _update_hard_negatives(self):
+        # on_train_epoch_end 在 save_model 之前，移除钩子后模型不再引用 trainer
+        self._batch = None
+        if self._miner is None:
+            return
+        self._miner.remove()
+        self._miner = None
+
+        scores = self.bg_scores
+        if dist.is_available() and dist.is_initialized():
+            gathered = [None] * dist.get_world_size()
+            dist.all_gather_object(gathered, scores)
+            scores = {k: v for d in gathered for k, v in d.items()}
+        self.bg_scores = scores  # 未被抽到的背景切片保留上一次的得分
+        hard = [f for f, s in scores.items() if s > self.hard_conf]
+        if self.train_loader.sampler.update_hard_negatives(hard) and self.epoch + 1 < self.epochs:
+            self.train_loader.reset()  # 丢弃按旧难负样本预取的下一个 epoch 索引
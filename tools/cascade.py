@@ -0,0 +1,380 @@
+"""
+两阶段级联推理: 低分辨率的切片级分类器（门控）先判断切片是否含有病灶，只有通过门控的切片才送入检测器
+
+筛查数据中大部分切片没有任何目标，完整的 v10Detect 主干、颈部和检测头却要在每张切片上运行。
+门控分类器使用 yolov8-cls，由现有的 YOLO 标签训练（有任意目标框的切片为 positive），
+阈值由 calibrate 在验证集上按目标召回率选取。
+
+流程:
+    python tools/cascade.py --action build --data configs/emphysema.yaml --gate_dir data/gate
+    python tools/cascade.py --action train --gate_dir data/gate --gate_imgsz 128
+    python tools/cascade.py --action calibrate --data configs/emphysema.yaml --gate runs/classify/train/weights/best.pt \\
+        --weights best.pt --target_recall 0.99
+    python tools/cascade.py --action predict --gate runs/classify/train/weights/best.pt --weights best.pt --source images/
+"""
+import os
+import json
+import math
+import time
+import shutil
+import argparse
+from itertools import islice
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from ultralytics import YOLO, YOLOv10
+from ultralytics.data.utils import IMG_FORMATS, check_det_dataset
+from ultralytics.engine.results import Results
+from ultralytics.utils import LOGGER
+from ultralytics.utils.torch_utils import get_flops
+
+from slices import box_counts, split_files
+
+POSITIVE, NEGATIVE = "positive", "negative"
+
+
+def build_gate_dataset(data, out_dir, classes=None, overwrite=False):
+    """
+    由检测数据集生成 ultralytics 分类任务的目录结构（out_dir/{train,val}/{negative,positive}/），图像以符号链接方式引用
+
+    参数:
+        data: 检测数据集配置 yaml
+        out_dir: 输出目录
+        classes: 计为 positive 的类别，None 表示任意类别
+        overwrite: out_dir 非空时删除后重建，否则报错
+    """
+    data, out_dir = check_det_dataset(data), Path(out_dir)
+    if out_dir.exists() and any(out_dir.iterdir()):
+        if not overwrite:
+            raise FileExistsError(f"{out_dir} 不是空目录，使用 overwrite=True（--overwrite）删除后重建")
+        shutil.rmtree(out_dir)
+    for split in ("train", "val", "test"):
+        if not data.get(split):
+            continue
+        files = split_files(data, split)
+        positive = box_counts(files, classes) > 0
+        for name in (NEGATIVE, POSITIVE):
+            (out_dir / split / name).mkdir(parents=True, exist_ok=True)
+        for i, (f, pos) in enumerate(zip(files, positive)):
+            dst = out_dir / split / (POSITIVE if pos else NEGATIVE) / f"{i:07d}_{Path(f).name}"  # 不同病人的切片可能重名
+            try:
+                dst.symlink_to(os.path.abspath(f))
+            except OSError:
+                shutil.copy(f, dst)
+        LOGGER.info(f"{split}: {positive.sum()} positive / {(~positive).sum()} negative")
+    return out_dir
+
+
+def train_gate(gate_dir, model="yolov8n-cls.yaml", imgsz=128, epochs=30, batch=256, **kwargs):
+    """训练门控分类器，返回 best.pt 路径"""
+    gate = YOLO(model)
+    gate.train(data=str(gate_dir), imgsz=imgsz, epochs=epochs, batch=batch, **kwargs)
+    return gate.trainer.best
+
+
+def positive_index(gate):
+    return {v: k for k, v in gate.names.items()}[POSITIVE]
+
+
+def _batches(files, batch):
+    """按批读取 BGR 图像，返回 (路径, 图像)；无法读取的文件给出警告后跳过，不影响同一批次的其他图像"""
+    for i in range(0, len(files), batch):
+        paths, imgs = [], []
+        for p in files[i : i + batch]:
+            im = cv2.imread(p)
+            if im is None:
+                LOGGER.warning(f"WARNING ⚠️ 无法读取 {p}，已跳过")
+                continue
+            paths.append(p)
+            imgs.append(im)
+        if imgs:
+            yield paths, imgs
+
+
+@torch.no_grad()
+def gate_scores(gate, files, imgsz=128, batch=64, device=None):
+    """
+    门控分类器对每张图像给出的 positive 概率
+
+    返回:
+        概率数组（无法读取的图像为 NaN）, 分类器总耗时（秒，不含图像读取）
+    """
+    pos, scores, dt = positive_index(gate), {}, 0.0
+    for i, (paths, imgs) in enumerate(_batches(files, batch)):
+        if i == 0:  # 预热: 首次调用包含预测器初始化，不计入耗时
+            gate.predict(imgs[:1], imgsz=imgsz, device=device, verbose=False)
+        t = time.perf_counter()
+        results = gate.predict(imgs, imgsz=imgsz, device=device, verbose=False)
+        dt += time.perf_counter() - t
+        scores.update((p, float(r.probs.data[pos])) for p, r in zip(paths, results))
+    return np.array([scores.get(f, np.nan) for f in files]), dt
+
+
+def pick_threshold(scores, positive, target_recall=0.99):
+    """
+    满足切片级召回率 >= target_recall 的最大阈值（score >= 阈值的切片通过门控）
+
+    返回:
+        阈值, 实际召回率, 通过率
+    """
+    pos = np.sort(scores[positive])[::-1]
+    if not len(pos):
+        return 0.0, 1.0, 1.0
+    threshold = float(pos[max(math.ceil(target_recall * len(pos)) - 1, 0)])
+    passed = scores >= threshold
+    return threshold, float(passed[positive].mean()), float(passed.mean())
+
+
+def calibrate(
+    gate_weights,
+    det_weights,
+    data,
+    split="val",
+    target_recall=0.99,
+    gate_imgsz=128,
+    imgsz=640,
+    batch=64,
+    classes=None,
+    time_batches=4,
+    device=None,
+):
+    """
+    在 split 上为门控选取阈值，并报告节省的计算量；结果写入门控权重同目录下的 gate.json
+
+    计算量节省按 FLOPs 与实测耗时两种方式给出:
+        1 - (门控开销 + 通过率 * 检测器开销) / 检测器开销
+
+    参数:
+        gate_weights: 门控分类器权重
+        det_weights: 检测器权重
+        data: 检测数据集配置 yaml
+        target_recall: 含目标切片的目标召回率
+        gate_imgsz: 门控输入尺寸
+        imgsz: 检测器输入尺寸
+        batch: 批大小
+        classes: 计为 positive 的类别，与 build_gate_dataset 一致
+        time_batches: 用于测量检测器耗时的批次数（另有一个不计时的预热批次）
+    """
+    data = check_det_dataset(data)
+    files = split_files(data, split)
+    counts = box_counts(files, classes)
+    positive = counts > 0
+
+    gate = YOLO(gate_weights)
+    scores, gate_time = gate_scores(gate, files, gate_imgsz, batch, device)
+    readable = ~np.isnan(scores)
+    if not readable.all():  # 无法读取的切片不参与阈值选取
+        files = [f for f, ok in zip(files, readable) if ok]
+        scores, counts, positive = scores[readable], counts[readable], positive[readable]
+    if not files:
+        raise FileNotFoundError(f"{split} 中没有可读取的图像")
+    threshold, recall, pass_rate = pick_threshold(scores, positive, target_recall)
+    box_recall = float(counts[scores >= threshold].sum() / max(counts.sum(), 1))
+
+    det = YOLOv10(det_weights)
+    det_time, n = 0.0, 0
+    batches = islice(_batches(files, batch), time_batches + 1)  # 只读取需要的批次
+    for _, imgs in islice(batches, 1):  # 预热批次不计时
+        det.predict(imgs, imgsz=imgsz, device=device, verbose=False)
+    for _, imgs in batches:
+        t = time.perf_counter()
+        det.predict(imgs, imgsz=imgsz, device=device, verbose=False)
+        det_time += time.perf_counter() - t
+        n += len(imgs)
+    gate_ms, det_ms = gate_time / len(files) * 1e3, det_time / max(n, 1) * 1e3
+    gate_flops, det_flops = get_flops(gate.model, gate_imgsz), get_flops(det.model, imgsz)
+
+    report = {
+        "threshold": threshold,
+        "target_recall": target_recall,
+        "recall": recall,
+        "box_recall": box_recall,
+        "pass_rate": pass_rate,
+        "gate_imgsz": gate_imgsz,
+        "classes": classes,
+        "images": len(files),
+        "positive": int(positive.sum()),
+        "gate_ms": gate_ms,
+        "det_ms": det_ms,
+        "time_saved": 1 - (gate_ms + pass_rate * det_ms) / det_ms if det_ms else None,
+        "gate_gflops": gate_flops,
+        "det_gflops": det_flops,
+        "flops_saved": 1 - (gate_flops + pass_rate * det_flops) / det_flops if det_flops else None,
+    }
+    path = Path(gate_weights).parent / "gate.json"
+    path.write_text(json.dumps(report, indent=2))
+
+    LOGGER.info(
+        f"门控阈值 {threshold:.4f}: 切片召回率 {recall:.4f}，目标框召回率 {box_recall:.4f}，"
+        f"通过率 {pass_rate:.3f} ({len(files)} 张切片，{positive.sum()} 张含目标)"
+    )
+    if det_ms:
+        LOGGER.info(f"耗时: 门控 {gate_ms:.2f} ms/张，检测器 {det_ms:.2f} ms/张，节省 {report['time_saved']:.1%}")
+    if det_flops:
+        LOGGER.info(f"FLOPs: 门控 {gate_flops:.2f} G，检测器 {det_flops:.2f} G，节省 {report['flops_saved']:.1%}")
+    LOGGER.info(f"已保存到 {path}")
+    return report
+
+
+class Cascade:
+    """
+    门控分类器 + 检测器的级联推理，未通过门控的切片返回空的检测结果
+
+    用法:
+        >>> cascade = Cascade.from_calibration("best.pt", "runs/classify/train/weights/best.pt")
+        >>> for results in cascade.stream("images/", batch=32, conf=0.25):
+        ...     ...
+        >>> cascade.pass_rate
+    """
+
+    def __init__(self, det_model, gate_model, threshold, gate_imgsz=128):
+        self.det = YOLOv10(det_model) if isinstance(det_model, (str, Path)) else det_model
+        self.gate = YOLO(gate_model) if isinstance(gate_model, (str, Path)) else gate_model
+        self.threshold = threshold
+        self.gate_imgsz = gate_imgsz
+        self.pos = positive_index(self.gate)
+        self.seen = self.passed = 0
+
+    @classmethod
+    def from_calibration(cls, det_weights, gate_weights, calibration=None):
+        """使用 calibrate 写出的 gate.json 中的阈值和门控输入尺寸"""
+        cfg = json.loads(Path(calibration or Path(gate_weights).parent / "gate.json").read_text())
+        return cls(det_weights, gate_weights, cfg["threshold"], cfg["gate_imgsz"])
+
+    @property
+    def pass_rate(self):
+        return self.passed / max(self.seen, 1)
+
+    def __call__(self, imgs, paths=None, device=None, **kwargs):
+        """
+        对一批 BGR 图像执行级联推理
+
+        参数:
+            imgs: BGR 图像列表
+            paths: 图像路径，写入 Results.path
+            kwargs: 检测器的预测参数（如 conf、imgsz）
+        """
+        paths = paths or [f"image{i}.jpg" for i in range(len(imgs))]
+        gated = self.gate.predict(imgs, imgsz=self.gate_imgsz, device=device, verbose=False)
+        keep = [i for i, r in enumerate(gated) if float(r.probs.data[self.pos]) >= self.threshold]
+        self.seen += len(imgs)
+        self.passed += len(keep)
+
+        results = [
+            Results(im, path=p, names=self.det.names, boxes=torch.zeros((0, 6))) for im, p in zip(imgs, paths)
+        ]
+        if keep:
+            for i, r in zip(keep, self.det.predict([imgs[i] for i in keep], device=device, verbose=False, **kwargs)):
+                r.path = paths[i]
+                results[i] = r
+        return results
+
+    def stream(self, source, batch=32, **kwargs):
+        """按批读取目录（或文件列表）中的图像，逐批返回结果；无法读取的图像跳过"""
+        if isinstance(source, (str, Path)) and os.path.isdir(source):
+            files = sorted(str(f) for f in Path(source).rglob("*.*") if f.suffix[1:].lower() in IMG_FORMATS)
+        else:
+            files = [str(source)] if isinstance(source, (str, Path)) else list(source)
+        for paths, imgs in _batches(files, batch):
+            yield self(imgs, paths, **kwargs)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="切片级分类器门控的两阶段级联推理")
+    parser.add_argument(
+        "--action",
+        required=True,
+        choices=["build", "train", "calibrate", "predict"],
+        help="build: 由 YOLO 标签生成门控数据集; train: 训练门控分类器; calibrate: 选取门控阈值; predict: 级联推理")
+    parser.add_argument(
+        "--data",
+        default=None,
+        help="检测数据集配置 yaml")
+    parser.add_argument(
+        "--gate_dir",
+        default=None,
+        help="门控数据集目录")
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="build 时允许删除并重建非空的 --gate_dir")
+    parser.add_argument(
+        "--gate",
+        default="yolov8n-cls.yaml",
+        help="门控分类器权重（train 时为初始模型）")
+    parser.add_argument(
+        "--weights",
+        default=None,
+        help="检测器权重")
+    parser.add_argument(
+        "--classes",
+        type=int,
+        nargs="+",
+        default=None,
+        help="计为 positive 的类别，默认任意类别")
+    parser.add_argument(
+        "--gate_imgsz",
+        type=int,
+        default=128,
+        help="门控输入尺寸")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="检测器输入尺寸")
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=30,
+        help="门控训练轮数")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=64,
+        help="批大小")
+    parser.add_argument(
+        "--split",
+        default="val",
+        help="calibrate 使用的数据划分")
+    parser.add_argument(
+        "--target_recall",
+        type=float,
+        default=0.99,
+        help="含目标切片的目标召回率")
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="predict 的图像文件或目录")
+    parser.add_argument(
+        "--conf",
+        type=float,
+        default=0.25,
+        help="检测器置信度阈值")
+    parser.add_argument(
+        "--device",
+        default=None,
+        help="推理设备")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.action == "build":
+        build_gate_dataset(args.data, args.gate_dir, args.classes, args.overwrite)
+    elif args.action == "train":
+        print(train_gate(args.gate_dir, args.gate, args.gate_imgsz, args.epochs, args.batch, device=args.device))
+    elif args.action == "calibrate":
+        calibrate(args.gate, args.weights, args.data, args.split, args.target_recall, args.gate_imgsz, args.imgsz,
+                  args.batch, args.classes, device=args.device)
+    else:
+        cascade = Cascade.from_calibration(args.weights, args.gate)
+        names = cascade.det.names
+        for results in cascade.stream(args.source, args.batch, conf=args.conf, imgsz=args.imgsz, device=args.device):
+            for r in results:
+                labels = ", ".join(f"{names[int(c)]} {s:.2f}" for s, c in zip(r.boxes.conf, r.boxes.cls))
+                print(f"{r.path}: {len(r.boxes)} 个目标 {labels}")
+        print(f"门控通过率 {cascade.pass_rate:.3f} ({cascade.passed}/{cascade.seen})")
@@ -0,0 +1,132 @@
+import io
+import copy
+import time
+import argparse
+import contextlib
+
+import numpy as np
+
+from ultralytics.utils.coco_eval import COCOEvaluator, load_json
+
+
+def pycocotools_eval(anno, preds, img_ids=None):
+    """使用 pycocotools 计算指标，用于对比"""
+    from pycocotools.coco import COCO
+    from pycocotools.cocoeval import COCOeval
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        gt = COCO()
+        gt.dataset = copy.deepcopy(load_json(anno))
+        gt.createIndex()
+        dt = gt.loadRes(copy.deepcopy(load_json(preds)))
+        ev = COCOeval(gt, dt, "bbox")
+        if img_ids is not None:
+            ev.params.imgIds = sorted(set(img_ids))
+        ev.evaluate()
+        ev.accumulate()
+        ev.summarize()
+    return ev.stats
+
+
+def synthetic_coco(n_images=2000, nc=2, seed=0):
+    """
+    生成随机的 COCO 标注与预测，包含 crowd、空图像、各种尺度的目标以及得分相同的检测
+
+    返回:
+        (anno dict, preds list)
+    """
+    rng = np.random.default_rng(seed)
+    images = [{"id": i + 1, "file_name": f"{i + 1:06d}.png", "width": 512, "height": 512} for i in range(n_images)]
+    categories = [{"id": c, "name": f"class_{c}", "supercategory": "none"} for c in range(nc)]
+    anns, preds = [], []
+    for im in images:
+        for _ in range(rng.poisson(2.0) if rng.random() > 0.3 else 0):
+            wh = np.exp(rng.uniform(np.log(8), np.log(300), 2))
+            xy = rng.uniform(0, 512 - wh)
+            box = [round(float(v), 2) for v in (*xy, *wh)]
+            cat = int(rng.integers(nc))
+            anns.append(
+                {
+                    "id": len(anns) + 1,
+                    "image_id": im["id"],
+                    "category_id": cat,
+                    "bbox": box,
+                    "area": box[2] * box[3],
+                    "iscrowd": int(rng.random() < 0.03),
+                }
+            )
+            for _ in range(int(rng.integers(0, 3))):  # 抖动后的正确/重复检测
+                jitter = rng.normal(0, 0.1, 4) * np.array([box[2], box[3], box[2], box[3]])
+                b = np.array(box) + jitter
+                b[2:] = np.maximum(b[2:], 1)
+                c = cat if rng.random() > 0.1 else int(rng.integers(nc))
+                preds.append({"image_id": im["id"], "category_id": c, "bbox": [round(float(v), 2) for v in b],
+                              "score": round(float(rng.random()), 2)})
+        for _ in range(rng.poisson(1.0)):  # 误检
+            wh = np.exp(rng.uniform(np.log(8), np.log(200), 2))
+            xy = rng.uniform(0, 512 - wh)
+            preds.append({"image_id": im["id"], "category_id": int(rng.integers(nc)),
+                          "bbox": [round(float(v), 2) for v in (*xy, *wh)], "score": round(float(rng.random()), 2)})
+    return {"images": images, "annotations": anns, "categories": categories}, preds
+
+
+def benchmark(anno, preds, workers=1):
+    """对比 COCOEvaluator 与 pycocotools 的耗时和结果"""
+    anno, preds = load_json(anno), load_json(preds)
+    t = time.perf_counter()
+    evaluator = COCOEvaluator(anno)
+    stats = evaluator.evaluate(preds, workers=workers)
+    t_native = time.perf_counter() - t
+    evaluator.summarize()
+    print(f"COCOEvaluator(workers={workers}): {t_native:.2f}s, {len(preds)} 个检测")
+
+    try:
+        t = time.perf_counter()
+        ref = pycocotools_eval(anno, preds)
+        t_ref = time.perf_counter() - t
+    except ImportError:
+        print("未安装 pycocotools，跳过对比")
+        return stats, None
+    diff = np.abs(stats - ref).max()
+    print(f"pycocotools: {t_ref:.2f}s, 加速 {t_ref / t_native:.1f}x, 最大差异 {diff:.2e}")
+    print("结果一致" if diff < 1e-4 else "结果不一致!")
+    return stats, ref
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="向量化 COCO 检测指标评估")
+    parser.add_argument(
+        "--anno",
+        default=None,
+        help="COCO 标注文件，如 tools/yolo2coco.py 的输出")
+    parser.add_argument(
+        "--pred",
+        default=None,
+        help="预测结果 json，如 val 时 save_json=True 生成的 predictions.json")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="并行匹配的线程数")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="与 pycocotools 对比耗时与结果")
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=0,
+        help="使用 N 张随机生成的图像代替 --anno/--pred")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    anno, pred = (synthetic_coco(args.synthetic) if args.synthetic else (args.anno, args.pred))
+    if args.benchmark:
+        benchmark(anno, pred, args.workers)
+    else:
+        evaluator = COCOEvaluator(anno)
+        evaluator.evaluate(pred, workers=args.workers)
+        evaluator.summarize()
@@ -0,0 +1,80 @@
+from copy import copy
+from pathlib import Path
+
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.models.yolov10.val import YOLOv10DetectionValidator
+from ultralytics.utils import LOGGER, ops
+from ultralytics.utils.coco_eval import COCOEvaluator
+
+
+class COCOEvalValidator(YOLOv10DetectionValidator):
+    """
+    对任意数据集使用 COCO 标注评估的 YOLOv10 验证器，评估由向量化的 COCOEvaluator 完成
+
+    数据集配置中的 anno_json（相对于 path，或绝对路径）指定 COCO 标注文件，
+    如 tools/yolo2coco.py 的输出；图像按文件名对应到标注中的 image_id，类别按名称对应，名称不一致时按 id 顺序对应。
+    训练中的每次验证与最终验证都会以 COCO mAP50-95/mAP50 替换内置指标。
+
+    用法:
+        >>> model = YOLOv10("best.pt")
+        >>> model.val(data="configs/emphysema.yaml", validator=COCOEvalValidator)
+    """
+
+    coco_workers = 4
+
+    def init_metrics(self, model):
+        super().init_metrics(model)
+        anno = self.data.get("anno_json")
+        if not anno or self.is_coco:
+            self.coco = None
+            return
+        anno = Path(anno) if Path(anno).is_absolute() else Path(self.data["path"]) / anno
+        if getattr(self, "coco", None) is None or self.coco_path != anno:  # 标注只加载一次
+            self.coco = COCOEvaluator(str(anno))
+            self.coco_path = anno
+            self.image_ids = {Path(im["file_name"]).stem: im["id"] for im in self.coco.images}
+        by_name = {c["name"]: c["id"] for c in self.coco.categories}
+        cats = self.coco.cat_ids
+        self.class_map = [by_name.get(self.names[i], cats[i] if i < len(cats) else i) for i in range(self.nc)]
+        self.args.save_json = True
+
+    def pred_to_json(self, predn, filename):
+        if self.coco is None:
+            return super().pred_to_json(predn, filename)
+        stem = Path(filename).stem
+        image_id = self.image_ids.get(stem)
+        if image_id is None:  # 不在标注中的图像不参与 COCO 评估
+            return
+        box = ops.xyxy2xywh(predn[:, :4])  # xywh
+        box[:, :2] -= box[:, 2:] / 2  # xy center to top-left corner
+        for p, b in zip(predn.tolist(), box.tolist()):
+            self.jdict.append(
+                {
+                    "image_id": image_id,
+                    "category_id": self.class_map[int(p[5])],
+                    "bbox": [round(x, 3) for x in b],
+                    "score": round(p[4], 5),
+                }
+            )
+
+    def eval_json(self, stats):
+        if not (self.args.save_json and self.coco is not None and len(self.jdict)):
+            return super().eval_json(stats)
+        LOGGER.info(f"\nEvaluating COCO mAP using {self.coco_path}...")
+        stems = (Path(f).stem for f in self.dataloader.dataset.im_files)
+        img_ids = [self.image_ids[s] for s in stems if s in self.image_ids]  # images to eval
+        coco_stats = self.coco.evaluate(self.jdict, img_ids=img_ids, workers=self.coco_workers)
+        if not self.training:
+            self.coco.summarize()
+        stats[self.metrics.keys[-1]], stats[self.metrics.keys[-2]] = coco_stats[:2]  # update mAP50-95 and mAP50
+        return stats
+
+
+class COCOEvalTrainer(YOLOv10DetectionTrainer):
+    """每次验证都使用 COCOEvalValidator 的 YOLOv10 训练器，fitness 随之使用 COCO mAP50-95"""
+
+    def get_validator(self):
+        self.loss_names = "box_om", "cls_om", "dfl_om", "box_oo", "cls_oo", "dfl_oo",
+        return COCOEvalValidator(
+            self.test_loader, save_dir=self.save_dir, args=copy(self.args), _callbacks=self.callbacks
+        )
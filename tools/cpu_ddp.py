@@ -0,0 +1,292 @@
+import os
+import sys
+import json
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+import torch
+import yaml
+from torch import distributed as dist
+from torch import nn
+
+from ultralytics.data import build_dataloader
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.nn.tasks import YOLOv10DetectionModel
+from ultralytics.utils import DEFAULT_CFG, DEFAULT_CFG_DICT, LOCAL_RANK, LOGGER, RANK, colorstr
+from ultralytics.utils.dist import find_free_network_port
+
+
+def pin_cores(local_rank, local_world_size, cores_per_rank=None):
+    """
+    将当前进程绑定到一组独占的 CPU 核心，并设置 torch 的线程数
+
+    参数:
+        local_rank: 本机内的 rank
+        local_world_size: 本机进程数
+        cores_per_rank: 每个进程的核心数，为 None 时平均分配本机可用核心
+    """
+    if not hasattr(os, "sched_getaffinity"):  # macOS / Windows
+        return None
+    cores = sorted(os.sched_getaffinity(0))
+    n = cores_per_rank or max(1, len(cores) // local_world_size)
+    mine = cores[local_rank * n : (local_rank + 1) * n] or cores
+    os.sched_setaffinity(0, mine)
+    torch.set_num_threads(len(mine))
+    return mine
+
+
+@contextmanager
+def host_zero_first(local_rank):
+    """
+    每台主机的 local rank 0 先执行（构建标签缓存、磁盘图像缓存），其余进程随后直接读取
+
+    与 ultralytics 的 torch_distributed_zero_first 相同，但 barrier 不带 device_ids，可用于 gloo。
+    """
+    initialized = dist.is_available() and dist.is_initialized()
+    if initialized and local_rank not in (-1, 0):
+        dist.barrier()
+    yield
+    if initialized and local_rank == 0:
+        dist.barrier()
+
+
+class CPUDDPTrainer(YOLOv10DetectionTrainer):
+    """
+    基于 gloo 的纯 CPU 数据并行 YOLOv10 训练器，由 torchrun（torch.distributed.run）启动
+
+    每个进程绑定独占的 CPU 核心；标签缓存由每台主机的 local rank 0 构建，
+    图像缓存改为磁盘 (.npy) 缓存，同一主机的进程通过系统页缓存共享，而不是每个 rank 各占一份内存。
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.world_size = 1
+        self.cores = None
+
+    def train(self):
+        world_size = int(os.getenv("WORLD_SIZE", 1))
+        if world_size > 1 and "LOCAL_RANK" in os.environ:  # launched by torchrun
+            self._do_train(world_size)
+        else:
+            super().train()
+
+    def _setup_ddp(self, world_size):
+        self.cores = pin_cores(LOCAL_RANK, int(os.getenv("LOCAL_WORLD_SIZE", 1)))
+        self.device = torch.device("cpu")
+        dist.init_process_group(
+            backend="gloo",
+            timeout=timedelta(seconds=10800),  # 3 hours
+            rank=RANK,
+            world_size=world_size,
+        )
+        LOGGER.info(f"{colorstr('CPU DDP:')} rank {RANK}/{world_size} 绑定核心 {self.cores}")
+
+    def _setup_train(self, world_size):
+        self.world_size = world_size
+        self.args.amp = False  # AMP is CUDA-only
+        if world_size > 1 and self.args.cache in (True, "ram"):
+            LOGGER.info(f"{colorstr('CPU DDP:')} cache={self.args.cache} 改为 cache=disk，同一主机的进程共享图像缓存")
+            self.args.cache = "disk"
+
+        # 父类会以 device_ids=[RANK] 包装 DDP，这只适用于 GPU，因此按单进程构建后再用 CPU DDP 包装
+        super()._setup_train(1)
+        if world_size > 1:
+            self.model = nn.parallel.DistributedDataParallel(self.model)
+
+    def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+        if mode != "train" or self.world_size <= 1:
+            return super().get_dataloader(dataset_path, batch_size, rank, mode)
+        with host_zero_first(LOCAL_RANK):
+            dataset = self.build_dataset(dataset_path, mode, batch_size)
+        batch_size = max(batch_size // self.world_size, 1)
+        return build_dataloader(dataset, batch_size, self.args.workers, shuffle=True, rank=rank)
+
+
+def run_worker(overrides):
+    """torchrun 启动的每个进程的入口"""
+    cfg = DEFAULT_CFG_DICT.copy()
+    cfg.update(save_dir="")  # handle the extra key 'save_dir'
+    trainer = CPUDDPTrainer(cfg=cfg, overrides=overrides)
+    trainer.train()
+
+
+def launch(overrides, nproc_per_node, nnodes=1, node_rank=0, master_addr="127.0.0.1", master_port=None):
+    """
+    以 torchrun 方式在本机启动 nproc_per_node 个进程，多机训练时在每台主机上以不同 node_rank 各执行一次
+
+    参数:
+        overrides: 训练参数，如 {"model": "yolov10n.yaml", "data": "configs/emphysema.yaml", "epochs": 100}
+        nproc_per_node: 每台主机的进程数
+        nnodes: 主机数
+        node_rank: 本机序号
+        master_addr: rank 0 所在主机的地址
+        master_port: rank 0 监听的 TCP 端口
+    """
+    import subprocess
+
+    overrides = {**overrides, "device": "cpu"}
+    # 所有 rank、所有主机使用同一个保存目录
+    overrides.setdefault("save_dir", str(Path(overrides.get("project") or "runs/detect") / overrides.get("name", "cpu_ddp")))
+    port = master_port or (find_free_network_port() if nnodes == 1 else 29500)
+    cmd = [
+        sys.executable, "-m", "torch.distributed.run",
+        "--nnodes", str(nnodes),
+        "--node_rank", str(node_rank),
+        "--nproc_per_node", str(nproc_per_node),
+        "--master_addr", master_addr,
+        "--master_port", str(port),
+        os.path.abspath(__file__),
+        "--overrides", json.dumps(overrides),
+    ]
+    LOGGER.info(f"{colorstr('CPU DDP:')} {' '.join(cmd)}")
+    subprocess.run(cmd, check=True)
+
+
+def _synthetic_batch(batch_size, imgsz, n_boxes=4):
+    idx = torch.arange(batch_size).repeat_interleave(n_boxes).float()
+    xy = torch.rand(len(idx), 2) * 0.6 + 0.2
+    wh = torch.rand(len(idx), 2) * 0.2 + 0.05
+    return {
+        "img": torch.rand(batch_size, 3, imgsz, imgsz),
+        "batch_idx": idx,
+        "cls": torch.randint(0, 2, (len(idx),)).float(),
+        "bboxes": torch.cat((xy, wh), 1),
+    }
+
+
+def _bench_worker(rank, world_size, port, cfg, batch_size, imgsz, steps, warmup, cores_per_rank, queue):
+    os.environ.update(MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port))
+    pin_cores(rank, world_size, cores_per_rank)
+    dist.init_process_group("gloo", rank=rank, world_size=world_size)
+
+    torch.manual_seed(0)
+    model = YOLOv10DetectionModel(cfg, nc=2, verbose=False)
+    model.args = DEFAULT_CFG
+    model.train()
+    ddp = nn.parallel.DistributedDataParallel(model)
+    optimizer = torch.optim.SGD([p for p in model.parameters() if p.requires_grad], lr=0.01, momentum=0.9)
+    batch = _synthetic_batch(batch_size, imgsz)
+
+    for i in range(warmup + steps):
+        if i == warmup:
+            dist.barrier()
+            t = time.perf_counter()
+        loss, _ = ddp(batch)
+        loss.backward()
+        optimizer.step()
+        optimizer.zero_grad()
+    dist.barrier()
+    dt = time.perf_counter() - t
+    if rank == 0:
+        queue.put(world_size * batch_size * steps / dt)
+    dist.destroy_process_group()
+
+
+def benchmark_scaling(
+    cfg="yolov10n.yaml", procs=None, batch_size=4, imgsz=320, steps=10, warmup=2, cores_per_rank=1, timeout=600
+):
+    """
+    本机多进程 CPU DDP 扩展性测试：每个进程固定 batch 与核心数，统计不同进程数下的 images/sec
+
+    参数:
+        procs: 进程数列表，默认从 1 开始按 2 的幂增长到可用核心数
+        cores_per_rank: 每个进程绑定的核心数
+        timeout: 等待每组进程结果的最长时间（秒），超时或有进程异常退出时抛出 RuntimeError
+    """
+    import queue as queue_lib
+
+    import torch.multiprocessing as mp
+
+    n_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    if procs is None:
+        procs, n = [], 1
+        while n * cores_per_rank <= n_cores:
+            procs.append(n)
+            n *= 2
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for world_size in procs:
+        queue = ctx.Queue()
+        port = find_free_network_port()
+        workers = [
+            ctx.Process(
+                target=_bench_worker,
+                args=(r, world_size, port, cfg, batch_size, imgsz, steps, warmup, cores_per_rank, queue),
+            )
+            for r in range(world_size)
+        ]
+        for w in workers:
+            w.start()
+        try:
+            results[world_size] = queue.get(timeout=timeout)
+        except queue_lib.Empty:
+            for w in workers:
+                w.terminate()
+            raise RuntimeError(
+                f"{world_size} 个进程的扩展性测试 {timeout}s 内没有结果, exitcode={[w.exitcode for w in workers]}"
+            ) from None
+        for w in workers:
+            w.join(timeout=60)
+        if any(w.exitcode != 0 for w in workers):
+            raise RuntimeError(f"{world_size} 个进程的扩展性测试异常退出, exitcode={[w.exitcode for w in workers]}")
+
+    base = results[procs[0]] / procs[0]
+    print(f"{'进程数':>6} {'images/sec':>12} {'加速比':>8} {'扩展效率':>8}")
+    for world_size, ips in results.items():
+        print(f"{world_size:>6} {ips:>12.2f} {ips / base:>8.2f} {ips / base / world_size:>8.1%}")
+    return results
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="纯 CPU 多进程/多机 YOLOv10 数据并行训练 (gloo)")
+    parser.add_argument(
+        "--nproc_per_node",
+        type=int,
+        default=2,
+        help="每台主机的进程数")
+    parser.add_argument(
+        "--nnodes",
+        type=int,
+        default=1,
+        help="主机数")
+    parser.add_argument(
+        "--node_rank",
+        type=int,
+        default=0,
+        help="本机序号")
+    parser.add_argument(
+        "--master_addr",
+        default="127.0.0.1",
+        help="rank 0 所在主机的地址")
+    parser.add_argument(
+        "--master_port",
+        type=int,
+        default=None,
+        help="rank 0 监听的 TCP 端口")
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="运行本机扩展性测试而不是训练")
+    parser.add_argument(
+        "--overrides",
+        default=None,
+        help=argparse.SUPPRESS)  # torchrun 子进程使用
+
+    args, extra = parser.parse_known_args()
+    # 其余参数按 yolo 命令行的 key=value 形式解析，如 model=yolov10n.yaml data=configs/emphysema.yaml epochs=100
+    args.train_args = {k: yaml.safe_load(v) for k, v in (x.split("=", 1) for x in extra)}
+    return args
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.overrides is not None:
+        run_worker(json.loads(args.overrides))
+    elif args.benchmark:
+        benchmark_scaling(args.train_args.get("model", "yolov10n.yaml"), imgsz=args.train_args.get("imgsz", 320))
+    else:
+        launch(args.train_args, args.nproc_per_node, args.nnodes, args.node_rank, args.master_addr, args.master_port)
@@ -0,0 +1,409 @@
+"""
+CPU 推理执行方式自动调优
+
+AutoBackend 在 CPU 上以 FP32 NCHW eager 模式运行 PyTorch 模型。这里在实际模型、实际输入尺寸和批大小上
+对以下几种执行方式计时，检查输出与 eager 结果一致后选用最快的一种（提供真实图像时在真实图像上校验）:
+    eager            FP32 NCHW（基准）
+    channels_last    NHWC 内存格式
+    bf16             channels_last + bfloat16 autocast（仅在支持 bf16 指令的 CPU 上尝试）
+    jit              torch.jit.trace + freeze
+    jit_channels_last
+    compile          torch.compile
+
+选择结果按 (CPU 型号与指令集、torch 版本与线程数, 模型权重哈希, 输入形状) 缓存在 USER_CONFIG_DIR/cpu_optimize.json，
+之后的运行直接构建缓存的方式，不再重新计时。
+
+用法:
+    >>> model = YOLOv10("best.pt")
+    >>> predictor = cpu_optimized_predictor(model, imgsz=640, batch=8, tune_source="configs/emphysema.yaml")
+    >>> results = model.predict(source, predictor=predictor)
+    或
+    >>> runner = optimize(load_slim("best.slim.safetensors"), imgsz=640, batch=8, source="data/val/images")
+    >>> preds = runner(x)  # (B, max_det, 6)
+"""
+import copy
+import json
+import time
+import fcntl
+import hashlib
+import argparse
+import platform
+import contextlib
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from torch import nn
+
+from ultralytics.data.augment import LetterBox
+from ultralytics.data.utils import IMG_FORMATS, check_det_dataset
+from ultralytics.models.yolov10.slim import load_slim, strip_one2many
+from ultralytics.utils import LOGGER, USER_CONFIG_DIR
+from ultralytics.utils.checks import check_imgsz
+
+from result_store import ReusablePredictor, build_predictor
+from slices import split_files
+
+MODES = ("eager", "channels_last", "bf16", "jit", "jit_channels_last", "compile")
+CACHE_FILE = USER_CONFIG_DIR / "cpu_optimize.json"
+CACHE_VERSION = 2  # 2: 输出校验核对 top-k 检测，此前只在随机输入上按 conf 校验的缓存作废
+BF16_FLAGS = {"avx512_bf16", "amx_bf16"}
+
+
+def cpu_flags():
+    """返回 CPU 型号与指令集标志，非 Linux 系统只返回 platform 信息"""
+    name, flags = platform.processor() or platform.machine(), set()
+    with contextlib.suppress(OSError):
+        for line in Path("/proc/cpuinfo").read_text().splitlines():
+            key, _, value = line.partition(":")
+            key = key.strip()
+            if key == "model name":
+                name = value.strip()
+            elif key in ("flags", "Features"):
+                flags = set(value.split())
+                break
+    return name, flags
+
+
+def host_key():
+    """主机标识: CPU 型号、指令集、torch 版本和线程数共同决定哪种执行方式最快"""
+    name, flags = cpu_flags()
+    s = json.dumps([name, sorted(flags), torch.__version__, torch.get_num_threads()])
+    return hashlib.sha1(s.encode()).hexdigest()[:16]
+
+
+def model_hash(model):
+    """模型权重与结构的哈希，权重或 max_det 变化后缓存自动失效"""
+    h = hashlib.sha1()
+    for k, v in model.state_dict().items():
+        h.update(k.encode())
+        h.update(v.detach().float().contiguous().numpy().tobytes())
+    h.update(str(getattr(model.model[-1], "max_det", "")).encode())
+    return h.hexdigest()[:16]
+
+
+def cache_key(model, shape):
+    """缓存键: 缓存格式版本、主机、模型与输入形状，任何一项变化都会重新调优"""
+    return f"v{CACHE_VERSION}-{host_key()}-{model_hash(model)}-{'x'.join(map(str, shape))}"
+
+
+def _load_cache(path):
+    try:
+        return json.loads(Path(path).read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_cache(path, key, record):
+    """并发运行时以文件锁保护读-改-写"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = _load_cache(path)
+        cache[key] = record
+        path.write_text(json.dumps(cache, indent=2))
+
+
+def build(model, mode, im):
+    """
+    按 mode 构建执行函数，输入为 FP32 NCHW 张量，输出为 FP32 (B, max_det, 6)
+
+    参数:
+        model: 已融合并去除 one2many 分支的模型，不会被修改
+        mode: MODES 之一
+        im: 示例输入，jit 方式按该形状 trace
+    """
+    model = copy.deepcopy(model).float().eval()
+    channels_last = mode in ("channels_last", "bf16", "jit_channels_last")
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        im = im.contiguous(memory_format=torch.channels_last)
+
+    if mode in ("eager", "channels_last"):
+        fn = model
+    elif mode == "bf16":
+        def fn(x):
+            with torch.autocast("cpu", dtype=torch.bfloat16):
+                return model(x).float()
+    elif mode in ("jit", "jit_channels_last"):
+        with torch.no_grad():
+            fn = torch.jit.freeze(torch.jit.trace(model, im, strict=False))
+    elif mode == "compile":
+        fn = torch.compile(model)
+    else:
+        raise ValueError(f"未知的执行方式 {mode}，可选 {MODES}")
+
+    if not channels_last:
+        return fn
+    return lambda x: fn(x.contiguous(memory_format=torch.channels_last))
+
+
+def outputs_match(ref, out, conf=0.25, tol=0.03, iou=0.9, topk=10):
+    """
+    比较端到端输出 (B, max_det, 6)
+
+    得分排序后逐项相差不超过 tol；ref 中得分最高的 topk 个检测以及所有得分高于 conf 的检测（共 n 个），在 out 得分最高的
+    n + topk 个检测中都有同类别、IoU 不低于 iou（或坐标相差不超过 1 像素）、得分相差不超过 tol 的对应检测。
+    训练好的模型在随机输入上几乎没有高于 conf 的检测，topk 保证无论输入如何都会核对框与类别。
+    不要求顺序一致，bf16 下相近得分的顺序可能交换。
+    """
+    if ref.shape != out.shape:
+        return False
+    if not ref.numel():
+        return True
+    if (ref[..., 4].sort(-1).values - out[..., 4].sort(-1).values).abs().max() > tol:
+        return False
+    for r, o in zip(ref, out):
+        n = max(min(topk, len(r)), int((r[:, 4] > conf).sum()))
+        if not n:
+            continue
+        r = r[r[:, 4].argsort(descending=True)[:n]]
+        o = o[o[:, 4].argsort(descending=True)[: n + topk]]  # 相近得分的顺序可能交换，在略多的高分检测中查找
+        lt = torch.max(r[:, None, :2], o[None, :, :2])
+        rb = torch.min(r[:, None, 2:4], o[None, :, 2:4])
+        inter = (rb - lt).clamp(0).prod(2)
+        area = lambda b: (b[:, 2:4] - b[:, :2]).clamp(0).prod(1)
+        ious = inter / (area(r)[:, None] + area(o)[None] - inter + 1e-9)
+        close = (ious >= iou) | ((r[:, None, :4] - o[None, :, :4]).abs().amax(-1) <= 1)
+        ok = close & (r[:, None, 5] == o[None, :, 5]) & ((r[:, None, 4] - o[None, :, 4]).abs() <= tol)
+        if not ok.any(1).all():
+            return False
+    return True
+
+
+def sample_images(source, imgsz, batch):
+    """
+    读取调优用的真实图像，按 LetterBox(auto=False) 填充成 (batch, 3, h, w) 的 FP32 RGB 张量
+
+    参数:
+        source: 图像文件、目录、图像列表 txt，或数据集 yaml（使用 val 划分）
+        imgsz: (h, w)
+        batch: 批大小，均匀抽取 batch 张图像，不足时循环使用
+    """
+    source = str(source)
+    if source.endswith((".yaml", ".yml")):
+        files = split_files(check_det_dataset(source), "val")
+    elif source.rpartition(".")[-1].lower() in IMG_FORMATS:
+        files = [source]
+    else:
+        files = split_files({"source": source}, "source")
+    letterbox = LetterBox(imgsz, auto=False)
+    step = max(1, len(files) // batch)
+    ims = []
+    for f in files[::step] + files:  # 均匀抽取，读取失败时继续使用其余图像
+        x = cv2.imread(f)
+        if x is not None:
+            ims.append(letterbox(image=x))
+        if len(ims) == batch:
+            break
+    if not ims:
+        raise FileNotFoundError(f"{source} 中没有可读取的图像")
+    im = np.stack([ims[i % len(ims)] for i in range(batch)])
+    im = im[..., ::-1].transpose(0, 3, 1, 2)  # BGR to RGB, BHWC to BCHW
+    return torch.from_numpy(np.ascontiguousarray(im)).float() / 255
+
+
+@torch.no_grad()
+def benchmark(fn, im, warmup=3, iters=10):
+    """返回中位数耗时（秒）和输出"""
+    for _ in range(warmup):  # torch.compile / jit 在前几次调用时完成编译与融合
+        out = fn(im)
+    times = []
+    for _ in range(iters):
+        t = time.perf_counter()
+        out = fn(im)
+        times.append(time.perf_counter() - t)
+    return float(np.median(times)), out
+
+
+@torch.no_grad()
+def tune(model, im, modes=MODES, tol=0.03, warmup=3, iters=10):
+    """
+    对各执行方式计时并校验输出，返回 (最快的 mode, {mode: 秒或 None})
+
+    构建失败、输出不一致或当前 CPU 不支持的方式记为 None。
+    """
+    _, flags = cpu_flags()
+    ref = model(im)
+    times = {}
+    for mode in modes:
+        if mode == "bf16" and flags and not flags & BF16_FLAGS:
+            LOGGER.info(f"cpu_optimize: 跳过 {mode}，CPU 不支持 {'/'.join(sorted(BF16_FLAGS))}")
+            times[mode] = None
+            continue
+        if mode == "compile" and not hasattr(torch, "compile"):
+            times[mode] = None
+            continue
+        try:
+            dt, out = benchmark(build(model, mode, im), im, warmup, iters)
+        except Exception as e:
+            LOGGER.info(f"cpu_optimize: {mode} 构建或运行失败: {type(e).__name__}: {str(e).splitlines()[0]}")
+            times[mode] = None
+            continue
+        if not outputs_match(ref, out.float(), tol=tol):
+            LOGGER.info(f"cpu_optimize: {mode} 输出与 eager 不一致，已舍弃")
+            times[mode] = None
+            continue
+        times[mode] = dt
+        LOGGER.info(f"cpu_optimize: {mode:<18} {dt * 1e3:8.2f} ms")
+    valid = {k: v for k, v in times.items() if v is not None}
+    best = min(valid, key=valid.get) if valid else "eager"
+    return best, times
+
+
+class OptimizedModel(nn.Module):
+    """
+    以选定方式执行的模型，输入形状与调优形状不同时（如最后一个不满的批次）回退到 eager 模型
+
+    属性:
+        model: eager FP32 模型
+        mode: 选定的执行方式
+        shape: 调优时的输入形状 (B, 3, H, W)
+    """
+
+    def __init__(self, model, mode, fn, shape):
+        super().__init__()
+        self.model = model
+        self.mode = mode
+        self.shape = tuple(shape)
+        self._fn = fn
+
+    @torch.no_grad()
+    def forward(self, im, *args, **kwargs):
+        if tuple(im.shape) == self.shape:
+            return self._fn(im.float())
+        return self.model(im.float())
+
+
+def optimize(model, imgsz=640, batch=1, modes=MODES, tol=0.03, cache=CACHE_FILE, retune=False, im=None, source=None):
+    """
+    为模型选择最快的 CPU 执行方式，返回 OptimizedModel
+
+    参数:
+        model: YOLOv10DetectionModel，不会被修改；在副本上融合并去除 one2many 分支，输出变为 (B, max_det, 6)
+        imgsz: 输入尺寸，int 或 (h, w)
+        batch: 批大小
+        modes: 参与比较的执行方式
+        tol: 与 eager 输出比较时的得分容差
+        cache: 缓存文件，None 表示不读写缓存
+        retune: 忽略已有缓存重新计时
+        im: 调优使用的输入 (batch, 3, h, w)
+        source: 未给出 im 时从中读取真实图像作为调优输入（见 sample_images），都未给出时使用随机输入，
+            此时只能核对得分最高的少量检测
+    """
+    imgsz = (imgsz, imgsz) if isinstance(imgsz, int) else tuple(imgsz)
+    model = copy.deepcopy(model).float().cpu().eval().fuse(verbose=False)  # 已融合时 fuse 不做任何事
+    if not getattr(model.model[-1], "export", False):
+        strip_one2many(model, getattr(model.model[-1], "max_det", 300))
+    if im is None and source is not None:
+        im = sample_images(source, imgsz, batch)
+    elif im is None:
+        LOGGER.info("cpu_optimize: 未提供调优图像（source），使用随机输入校验输出")
+        im = torch.rand(batch, 3, *imgsz, generator=torch.Generator().manual_seed(0))
+    shape = tuple(im.shape)
+
+    key = cache_key(model, shape)
+    record = None if retune or cache is None else _load_cache(cache).get(key)
+    if record and record.get("mode") in modes:
+        mode = record["mode"]
+        LOGGER.info(f"cpu_optimize: 使用缓存的执行方式 {mode} ({cache})")
+        try:
+            return OptimizedModel(model, mode, build(model, mode, im), shape)
+        except Exception as e:  # 如 torch 升级后 compile 不可用，重新调优
+            LOGGER.info(f"cpu_optimize: 缓存的 {mode} 构建失败 ({type(e).__name__})，重新调优")
+
+    mode, times = tune(model, im, modes, tol)
+    eager = times.get("eager")
+    speedup = f"，相比 eager 加速 {eager / times[mode]:.2f}x" if eager and times.get(mode) else ""
+    LOGGER.info(f"cpu_optimize: 选用 {mode}{speedup}")
+    if cache is not None:
+        _save_cache(cache, key, {"mode": mode, "times": times, "cpu": cpu_flags()[0], "torch": torch.__version__})
+    return OptimizedModel(model, mode, build(model, mode, im), shape)
+
+
+class CPUOptimizedPredictor(ReusablePredictor):
+    """
+    在 CPU 上使用 optimize() 选出的执行方式的预测器
+
+    所有图像都按 imgsz 填充成固定形状（auto=False），保证 jit/compile 方式始终使用调优时的输入形状。
+    """
+
+    cpu_optimize_kwargs = {}
+
+    def load_model(self, model, verbose=True):
+        super().load_model(model, verbose)
+        if self.device.type != "cpu" or not self.model.pt:
+            return
+        imgsz = check_imgsz(self.args.imgsz, stride=self.model.stride, min_dim=2)
+        self.model.model = optimize(self.model.model, imgsz, self.args.batch, **self.cpu_optimize_kwargs)
+
+    def pre_transform(self, im):
+        letterbox = LetterBox(self.imgsz, auto=False, stride=self.model.stride)
+        return [letterbox(image=x) for x in im]
+
+
+def cpu_optimized_predictor(model, imgsz=640, batch=1, tune_source=None, **kwargs):
+    """
+    构建 CPUOptimizedPredictor 实例，供 Model.predict(predictor=...) 使用
+
+    参数:
+        model: YOLOv10 模型
+        tune_source: 调优时校验输出使用的真实图像（图像、目录、列表 txt 或数据集 yaml），见 sample_images
+        kwargs: 其他预测参数（如 conf、save）
+    """
+    attrs = None
+    if tune_source is not None:
+        attrs = {"cpu_optimize_kwargs": {**CPUOptimizedPredictor.cpu_optimize_kwargs, "source": tune_source}}
+    kwargs = {"batch": batch, "imgsz": imgsz, "device": "cpu", **kwargs}
+    return build_predictor(CPUOptimizedPredictor, model, attrs, **kwargs)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="为模型选择最快的 CPU 推理执行方式并缓存结果")
+    parser.add_argument(
+        "--weights",
+        required=True,
+        help=".pt 检查点或 tools/export_slim.py 导出的 .safetensors 文件")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="输入尺寸")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=1,
+        help="批大小")
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        default=list(MODES),
+        help="参与比较的执行方式")
+    parser.add_argument(
+        "--tol",
+        type=float,
+        default=0.03,
+        help="与 eager 输出比较时的得分容差")
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="校验输出使用的真实图像: 图像、目录、列表 txt 或数据集 yaml（使用 val 划分）")
+    parser.add_argument(
+        "--retune",
+        action="store_true",
+        help="忽略缓存重新计时")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.weights.endswith(".safetensors"):
+        model = load_slim(args.weights)
+    else:
+        from ultralytics.nn.tasks import attempt_load_one_weight
+        model, _ = attempt_load_one_weight(args.weights, device="cpu", fuse=False)
+    runner = optimize(model, args.imgsz, args.batch, args.modes, args.tol, retune=args.retune, source=args.source)
+    print(f"{args.weights} @ {args.batch}x3x{args.imgsz}x{args.imgsz}: {runner.mode}")
@@ -0,0 +1,259 @@
+"""
+近重复切片去重: 薄层 CT 相邻切片几乎相同，去重后减少每个 epoch、cache_images 和标注的开销
+
+1. 并行计算所有图像的 DCT 感知哈希（pHash）
+2. 多重索引哈希（multi-index hashing）: 将哈希分成 radius+1 段，汉明距离不超过 radius 的两幅图像
+   至少有一段完全相同（鸽巢原理），只需核对同段相同的候选，避免 O(n²) 两两比较
+3. 在同一序列（患者/检查）内按优先级做领导者聚类: 有标注（目标框更多）的切片优先成为代表，
+   其余与代表距离不超过 radius 且尚未归类的切片并入该簇；簇内任意切片都与代表相近，不会沿相邻切片链式漂移
+4. 每簇只保留代表，输出与 tools/yolo2txt.py 相同格式的图像列表文件（每行一个路径），并报告删减情况
+
+用法:
+    python tools/dedup.py --data configs/emphysema.yaml --split train --output data/train_dedup.txt
+    python tools/dedup.py --source /data/unlabeled --radius 8 --output unlabeled_dedup.txt --global_index
+"""
+import csv
+import argparse
+from pathlib import Path
+from collections import Counter, defaultdict
+from multiprocessing.pool import ThreadPool
+
+import cv2
+import numpy as np
+
+from ultralytics.data.utils import check_det_dataset
+from ultralytics.utils import LOGGER, NUM_THREADS, TQDM
+
+from slices import label_classes, patient_id, split_files
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def phash(path, hash_size=8, highfreq=4):
+    """
+    DCT 感知哈希: 灰度图缩放到 (hash_size*highfreq)² 后取 DCT 左上角 hash_size² 个低频系数，与中值比较
+
+    返回:
+        按位打包的 uint8 数组（ceil(hash_size² / 8) 字节，末字节不足 8 位时补 0），无法读取时返回 None
+    """
+    im = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    if im is None:
+        return None
+    n = hash_size * highfreq
+    im = cv2.resize(im, (n, n), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(im)[:hash_size, :hash_size]
+    return np.packbits((low > np.median(low)).ravel())
+
+
+def compute_hashes(files, hash_size=8, workers=NUM_THREADS):
+    """并行计算哈希（cv2 解码、缩放和 DCT 会释放 GIL），返回 (N, 字节数) 数组和有效掩码"""
+    nbytes = -(-hash_size * hash_size // 8)  # packbits 将不足 8 位的末字节补 0
+    hashes, valid = np.zeros((len(files), nbytes), dtype=np.uint8), np.ones(len(files), dtype=bool)
+    with ThreadPool(workers) as pool:
+        it = pool.imap(lambda f: phash(f, hash_size), files, chunksize=64)
+        for i, h in enumerate(TQDM(it, total=len(files), desc="pHash")):
+            if h is None:
+                valid[i] = False
+                LOGGER.warning(f"无法读取 {files[i]}，该图像保留且不参与去重")
+            else:
+                hashes[i] = h
+    return hashes, valid
+
+
+def hamming(a, b):
+    """a: (nbytes,) 与 b: (M, nbytes) 的汉明距离"""
+    return POPCOUNT[np.bitwise_xor(a, b)].sum(1)
+
+
+class HammingIndex:
+    """
+    多重索引哈希，查询汉明距离不超过 radius 的近邻
+
+    每一段按段值排序，查询时通过 searchsorted 取出同段值的候选，再用 popcount 精确核对距离。
+
+    参数:
+        hashes: (N, nbytes) 打包的哈希
+        radius: 最大汉明距离
+    """
+
+    def __init__(self, hashes, radius=6):
+        self.hashes, self.radius = hashes, radius
+        bits = np.unpackbits(hashes, axis=1)
+        bounds = np.linspace(0, bits.shape[1], radius + 2).astype(int)
+        self.keys, self.orders, self.sorted_keys = [], [], []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            _, key = np.unique(bits[:, lo:hi], axis=0, return_inverse=True)
+            key = key.ravel()
+            order = np.argsort(key, kind="stable")
+            self.keys.append(key)
+            self.orders.append(order)
+            self.sorted_keys.append(key[order])
+
+    def query(self, i, mask=None):
+        """
+        返回与第 i 个哈希距离不超过 radius 的索引（含 i 本身）及其距离
+
+        参数:
+            mask: 只返回 mask 为 True 的索引
+        """
+        cand = []
+        for key, order, sk in zip(self.keys, self.orders, self.sorted_keys):
+            lo, hi = np.searchsorted(sk, key[i], "left"), np.searchsorted(sk, key[i], "right")
+            cand.append(order[lo:hi])
+        cand = np.unique(np.concatenate(cand))
+        if mask is not None:
+            cand = cand[mask[cand]]
+        d = hamming(self.hashes[i], self.hashes[cand])
+        keep = d <= self.radius
+        return cand[keep], d[keep]
+
+
+def cluster(hashes, valid, groups, priority, radius=6):
+    """
+    在每个组内做领导者聚类
+
+    参数:
+        hashes: (N, nbytes) 打包的哈希
+        valid: 哈希有效的掩码，无效图像各自成簇
+        groups: 每张图像的组（序列）标识，None 表示所有图像同组
+        priority: 排序键，值越小越优先成为代表
+        radius: 最大汉明距离
+
+    返回:
+        rep: 每张图像所属簇的代表索引, dist: 与代表的汉明距离
+    """
+    n = len(hashes)
+    rep, dist = np.arange(n), np.zeros(n, dtype=np.int64)
+    members = defaultdict(list)
+    for i, g in enumerate(groups if groups is not None else [0] * n):
+        members[g].append(i)
+    for idx in members.values():
+        idx = np.array(sorted(idx, key=lambda i: priority[i]))
+        idx = idx[valid[idx]]
+        if len(idx) < 2:
+            continue
+        index = HammingIndex(hashes[idx], radius)
+        free = np.ones(len(idx), dtype=bool)
+        for j in range(len(idx)):  # idx 已按优先级排序
+            if not free[j]:
+                continue
+            nb, d = index.query(j, free)
+            free[nb] = False
+            rep[idx[nb]], dist[idx[nb]] = idx[j], d
+    return rep, dist
+
+
+def dedup(files, output, radius=6, hash_size=8, per_series=True, pattern=None, keep_labeled=False, report=None):
+    """
+    去重并写出精简后的图像列表
+
+    参数:
+        files: 图像路径列表
+        output: 输出的列表文件（yolo2txt.py 格式）
+        radius: 视为近重复的最大汉明距离（hash_size=8 时哈希共 64 位）
+        hash_size: pHash 边长，哈希位数为 hash_size²
+        per_series: 只在同一序列内去重，序列由 tools/slices.py 的 patient_id 从路径得到
+        pattern: 传给 patient_id 的正则表达式
+        keep_labeled: 有标注的切片全部保留，只对无目标的切片去重
+        report: 逐图像明细 csv（路径, 序列, 代表, 距离, 是否保留）
+
+    返回:
+        保留的图像路径列表
+    """
+    files = [str(f) for f in files]
+    boxes = [Counter(cls) for cls in label_classes(files)]
+    nbox = np.array([sum(b.values()) for b in boxes])
+    groups = [patient_id(f, pattern) for f in files] if per_series else None
+    priority = [(-min(n, 1), -n, f) for n, f in zip(nbox, files)]  # 有标注优先，其次目标框多，再按路径（切片顺序）
+
+    hashes, valid = compute_hashes(files, hash_size)
+    rep, dist = cluster(hashes, valid, groups, priority, radius)
+    kept = rep == np.arange(len(files))
+    if keep_labeled:
+        kept |= nbox > 0
+
+    kept_files = [f for f, k in zip(files, kept) if k]
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        for path in kept_files:
+            f.write(path + "\n")
+    if report:
+        with open(report, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["path", "series", "representative", "distance", "kept", "boxes"])
+            for i, path in enumerate(files):
+                writer.writerow([path, groups[i] if groups else "", files[rep[i]], dist[i], int(kept[i]), nbox[i]])
+
+    n, nk = len(files), int(kept.sum())
+    labeled = nbox > 0
+    LOGGER.info(f"去重完成! {n} -> {nk} 张 (删除 {n - nk} 张, {(n - nk) / max(n, 1):.1%})，列表已写入 {output}")
+    LOGGER.info(
+        f"有标注切片 {labeled.sum()} -> {(labeled & kept).sum()}，"
+        f"无目标切片 {(~labeled).sum()} -> {(~labeled & kept).sum()}，簇数 {len(set(rep.tolist()))}"
+    )
+    total, kept_boxes = Counter(), Counter()
+    for b, k in zip(boxes, kept):
+        total.update(b)
+        if k:
+            kept_boxes.update(b)
+    for c in sorted(total):
+        LOGGER.info(f"类别 {c}: 目标框 {total[c]} -> {kept_boxes[c]}")
+    return kept_files
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="近重复切片去重，输出 yolo2txt.py 格式的图像列表")
+    parser.add_argument(
+        "--data",
+        default=None,
+        help="数据集配置 yaml，与 --split 一起使用")
+    parser.add_argument(
+        "--split",
+        default="train",
+        help="要去重的数据划分")
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="图像目录或列表文件（不使用 --data 时）")
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="输出的图像列表文件")
+    parser.add_argument(
+        "--radius",
+        type=int,
+        default=6,
+        help="视为近重复的最大汉明距离")
+    parser.add_argument(
+        "--hash_size",
+        type=int,
+        default=8,
+        help="pHash 边长，哈希位数为其平方")
+    parser.add_argument(
+        "--global_index",
+        action="store_true",
+        help="跨序列去重（如序列信息未知的无标注数据）")
+    parser.add_argument(
+        "--pattern",
+        default=None,
+        help="从路径提取序列号的正则表达式，取第一个分组")
+    parser.add_argument(
+        "--keep_labeled",
+        action="store_true",
+        help="保留全部有标注的切片，只对无目标切片去重")
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="逐图像明细 csv")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.data:
+        files = split_files(check_det_dataset(args.data), args.split)
+    else:
+        files = split_files({"source": args.source}, "source")
+    dedup(files, args.output, args.radius, args.hash_size, not args.global_index, args.pattern, args.keep_labeled,
+          args.report)
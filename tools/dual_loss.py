@@ -0,0 +1,275 @@
+import argparse
+
+import torch
+
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.nn.tasks import YOLOv10DetectionModel
+from ultralytics.utils import DEFAULT_CFG
+from ultralytics.utils.loss import v8DetectionLoss, v10DetectLoss
+from ultralytics.utils.tal import TaskAlignedAssigner, make_anchors
+from ultralytics.utils.torch_utils import de_parallel
+
+
+class SharedCandidateAssigner(TaskAlignedAssigner):
+    """
+    一次完成多个分支的 TaskAlignedAssigner 分配：各分支共用 in-GT 候选掩码，只有 top-k 按分支分别计算；
+    支持按 batch 分块分配，候选掩码也在每个分块内计算，以限制峰值显存
+
+    每张图像的分配互不依赖，因此分块结果与整体分配完全一致。
+    """
+
+    @torch.no_grad()
+    def forward(self, preds, anc_points, gt_labels, gt_bboxes, mask_gt, chunk=None):
+        """
+        参数:
+            preds: {分支名: (pd_scores, pd_bboxes, topk)}
+            chunk: 每次分配的图像数，为 None 时整个 batch 一次完成
+
+        返回:
+            {分支名: (target_labels, target_bboxes, target_scores, fg_mask, target_gt_idx)}
+        """
+        bs = gt_bboxes.shape[0]
+        self.n_max_boxes = gt_bboxes.shape[1]
+
+        if self.n_max_boxes == 0:
+            device = gt_bboxes.device
+            return {
+                k: (
+                    torch.full_like(pd_scores[..., 0], self.bg_idx).to(device),
+                    torch.zeros_like(pd_bboxes).to(device),
+                    torch.zeros_like(pd_scores).to(device),
+                    torch.zeros_like(pd_scores[..., 0]).bool().to(device),
+                    torch.zeros_like(pd_scores[..., 0]).to(device),
+                )
+                for k, (pd_scores, pd_bboxes, _) in preds.items()
+            }
+
+        chunk = chunk or bs
+        outs = {k: [] for k in preds}
+        for i in range(0, bs, chunk):
+            s = slice(i, i + chunk)
+            mask_in_gts = self.select_candidates_in_gts(anc_points, gt_bboxes[s])  # 本分块内各分支共用
+            self.bs = mask_in_gts.shape[0]
+            for k, (pd_scores, pd_bboxes, topk) in preds.items():
+                outs[k].append(
+                    self.assign(pd_scores[s], pd_bboxes[s], gt_labels[s], gt_bboxes[s], mask_gt[s], mask_in_gts, topk)
+                )
+        return {k: tuple(torch.cat(x) if len(x) > 1 else x[0] for x in zip(*v)) for k, v in outs.items()}
+
+    def assign(self, pd_scores, pd_bboxes, gt_labels, gt_bboxes, mask_gt, mask_in_gts, topk):
+        """与 TaskAlignedAssigner.forward 相同，但使用给定的 in-GT 候选掩码和 topk"""
+        self.topk = topk
+        align_metric, overlaps = self.get_box_metrics(pd_scores, pd_bboxes, gt_labels, gt_bboxes, mask_in_gts * mask_gt)
+        mask_topk = self.select_topk_candidates(align_metric, topk_mask=mask_gt.expand(-1, -1, topk).bool())
+        mask_pos = mask_topk * mask_in_gts * mask_gt
+
+        target_gt_idx, fg_mask, mask_pos = self.select_highest_overlaps(mask_pos, overlaps, self.n_max_boxes)
+        target_labels, target_bboxes, target_scores = self.get_targets(gt_labels, gt_bboxes, target_gt_idx, fg_mask)
+
+        # Normalize
+        align_metric *= mask_pos
+        pos_align_metrics = align_metric.amax(dim=-1, keepdim=True)  # b, max_num_obj
+        pos_overlaps = (overlaps * mask_pos).amax(dim=-1, keepdim=True)  # b, max_num_obj
+        norm_align_metric = (align_metric * pos_overlaps / (pos_align_metrics + self.eps)).amax(-2).unsqueeze(-1)
+        target_scores = target_scores * norm_align_metric
+
+        return target_labels, target_bboxes, target_scores, fg_mask.bool(), target_gt_idx
+
+
+class FusedV10DetectLoss(v8DetectionLoss):
+    """
+    v10DetectLoss 的融合实现：one2many(topk=10) 与 one2one(topk=1) 两个分支共享 anchor 生成、
+    GT 预处理和 in-GT 候选掩码，只有解码和 top-k 分配按分支分别计算。
+
+    损失与 v10DetectLoss 逐位一致；chunk 不为 None 时按 batch 分块执行分配以降低峰值显存。
+    """
+
+    topk = {"one2many": 10, "one2one": 1}
+
+    def __init__(self, model, chunk=None):
+        super().__init__(model, tal_topk=10)
+        self.chunk = chunk
+        self.assigner = SharedCandidateAssigner(topk=10, num_classes=self.nc, alpha=0.5, beta=6.0)
+
+    def __call__(self, preds, batch):
+        feats = {k: preds[k][1] if isinstance(preds[k], tuple) else preds[k] for k in self.topk}
+        ref = feats["one2many"]
+
+        dtype = ref[0].dtype
+        batch_size = ref[0].shape[0]
+        imgsz = torch.tensor(ref[0].shape[2:], device=self.device, dtype=dtype) * self.stride[0]  # image size (h,w)
+        anchor_points, stride_tensor = make_anchors(ref, self.stride, 0.5)
+
+        # Targets
+        targets = torch.cat((batch["batch_idx"].view(-1, 1), batch["cls"].view(-1, 1), batch["bboxes"]), 1)
+        targets = self.preprocess(targets.to(self.device), batch_size, scale_tensor=imgsz[[1, 0, 1, 0]])
+        gt_labels, gt_bboxes = targets.split((1, 4), 2)  # cls, xyxy
+        mask_gt = gt_bboxes.sum(2, keepdim=True).gt_(0)
+
+        # 两个分支分别解码，再一次完成分配
+        decoded = {k: self.decode(feats[k], anchor_points) for k in self.topk}
+        assigned = self.assigner(
+            {
+                k: (
+                    decoded[k][1].detach().sigmoid(),  # pred_scores
+                    (decoded[k][2].detach() * stride_tensor).type(gt_bboxes.dtype),  # pred_bboxes
+                    topk,
+                )
+                for k, topk in self.topk.items()
+            },
+            anchor_points * stride_tensor,
+            gt_labels,
+            gt_bboxes,
+            mask_gt,
+            chunk=self.chunk,
+        )
+
+        loss_one2many = self.head_loss(*decoded["one2many"], *assigned["one2many"][1:4], anchor_points, stride_tensor)
+        loss_one2one = self.head_loss(*decoded["one2one"], *assigned["one2one"][1:4], anchor_points, stride_tensor)
+        return loss_one2many[0] + loss_one2one[0], torch.cat((loss_one2many[1], loss_one2one[1]))
+
+    def decode(self, feats, anchor_points):
+        """拼接单个分支的预测并解码，返回 (pred_distri, pred_scores, pred_bboxes)"""
+        pred_distri, pred_scores = torch.cat([xi.view(feats[0].shape[0], self.no, -1) for xi in feats], 2).split(
+            (self.reg_max * 4, self.nc), 1
+        )
+
+        pred_scores = pred_scores.permute(0, 2, 1).contiguous()
+        pred_distri = pred_distri.permute(0, 2, 1).contiguous()
+
+        # Pboxes
+        pred_bboxes = self.bbox_decode(anchor_points, pred_distri)  # xyxy, (b, h*w, 4)
+        return pred_distri, pred_scores, pred_bboxes
+
+    def head_loss(
+        self, pred_distri, pred_scores, pred_bboxes, target_bboxes, target_scores, fg_mask, anchor_points, stride_tensor
+    ):
+        """计算单个分支的 box/cls/dfl 损失，与 v8DetectionLoss.__call__ 的计算顺序一致"""
+        loss = torch.zeros(3, device=self.device)  # box, cls, dfl
+        dtype = pred_scores.dtype
+        batch_size = pred_scores.shape[0]
+
+        target_scores_sum = max(target_scores.sum(), 1)
+
+        # Cls loss
+        loss[1] = self.bce(pred_scores, target_scores.to(dtype)).sum() / target_scores_sum  # BCE
+
+        # Bbox loss
+        if fg_mask.sum():
+            target_bboxes /= stride_tensor
+            loss[0], loss[2] = self.bbox_loss(
+                pred_distri, pred_bboxes, anchor_points, target_bboxes, target_scores, target_scores_sum, fg_mask
+            )
+
+        loss[0] *= self.hyp.box  # box gain
+        loss[1] *= self.hyp.cls  # cls gain
+        loss[2] *= self.hyp.dfl  # dfl gain
+
+        return loss.sum() * batch_size, loss.detach()  # loss(box, cls, dfl)
+
+
+class FusedLossTrainer(YOLOv10DetectionTrainer):
+    """
+    使用融合双分支损失的 YOLOv10 训练器
+
+    模型仍是 YOLOv10DetectionModel，融合损失只在训练时挂到 model.criterion 上，保存检查点时摘下，
+    因此检查点可以直接用 YOLOv10("best.pt") 加载，不依赖本模块。分块分配的图像数 assign_chunk 以类属性配置，
+    通过子类修改（DDP 子进程按类名重建 trainer，构造参数不会传过去）。
+
+    用法:
+        >>> class ChunkedTrainer(FusedLossTrainer):
+        ...     assign_chunk = 8
+        >>> model = YOLOv10("yolov10n.yaml")
+        >>> model.train(data="configs/emphysema.yaml", trainer=ChunkedTrainer)
+    """
+
+    assign_chunk = None
+
+    def preprocess_batch(self, batch):
+        # 在 EMA 创建之后再挂上融合损失，EMA 模型不会带上它
+        model = de_parallel(self.model)
+        if not isinstance(getattr(model, "criterion", None), FusedV10DetectLoss):
+            model.criterion = FusedV10DetectLoss(model, chunk=self.assign_chunk)
+        return super().preprocess_batch(batch)
+
+    def save_model(self):
+        # 融合损失定义在 tools 中，不能随模型一起序列化
+        model = de_parallel(self.model)
+        criterion = model.__dict__.pop("criterion", None)
+        try:
+            super().save_model()
+        finally:
+            if criterion is not None:
+                model.criterion = criterion
+
+
+def random_targets(batch_size=8, n_boxes=6, nc=2):
+    """随机 GT，每张图像 0~n_boxes 个目标（部分图像为空，模拟空切片），格式与 dataloader 的 batch 相同"""
+    batch_idx, cls, bboxes = [], [], []
+    for i in range(batch_size):
+        n = int(torch.randint(0, n_boxes + 1, (1,)))
+        batch_idx.append(torch.full((n,), float(i)))
+        cls.append(torch.randint(0, nc, (n,)).float())
+        xy = torch.rand(n, 2) * 0.6 + 0.2
+        wh = torch.rand(n, 2) * 0.2 + 0.05
+        bboxes.append(torch.cat((xy, wh), 1))
+    return {"batch_idx": torch.cat(batch_idx), "cls": torch.cat(cls), "bboxes": torch.cat(bboxes)}
+
+
+def compare_losses(cfg="yolov10n.yaml", batch_size=8, imgsz=320, n_boxes=6, chunk=None, seed=0):
+    """
+    在随机输入上对比 FusedV10DetectLoss 与 v10DetectLoss，返回两者是否逐位一致
+
+    参数:
+        cfg: 模型配置
+        batch_size: batch 大小
+        imgsz: 输入尺寸
+        n_boxes: 每张图像的最大目标数（部分图像随机为空，模拟空切片）
+        chunk: 分块分配的图像数
+        seed: 随机种子
+    """
+    torch.manual_seed(seed)
+    model = YOLOv10DetectionModel(cfg, nc=2, verbose=False)
+    model.args = DEFAULT_CFG
+    model.train()
+    batch = random_targets(batch_size, n_boxes, nc=2)
+
+    with torch.no_grad():
+        preds = model(torch.rand(batch_size, 3, imgsz, imgsz))
+    ref = v10DetectLoss(model)(preds, batch)
+    out = FusedV10DetectLoss(model, chunk=chunk)(preds, batch)
+    same = torch.equal(ref[0], out[0]) and torch.equal(ref[1], out[1])
+    print(f"v10DetectLoss: {ref[1].tolist()}")
+    print(f"FusedV10DetectLoss(chunk={chunk}): {out[1].tolist()}")
+    print("结果逐位一致" if same else "结果不一致!")
+    return same
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="对比融合双分支损失与原始 v10DetectLoss")
+    parser.add_argument(
+        "--cfg",
+        default="yolov10n.yaml",
+        help="模型配置")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=8,
+        help="batch 大小")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=320,
+        help="输入尺寸")
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=None,
+        help="分块分配的图像数(可选)")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    compare_losses(args.cfg, args.batch, args.imgsz, chunk=args.chunk)
@@ -0,0 +1,121 @@
+import os
+import json
+import argparse
+
+import torch
+from safetensors.torch import save_file
+
+from ultralytics.models.yolov10.slim import SLIM_FORMAT, strip_one2many
+from ultralytics.nn.tasks import attempt_load_one_weight
+
+
+def export_slim(weights, output=None, half=False, max_det=300, torchscript=False, imgsz=640):
+    """
+    将训练得到的 .pt 检查点导出为部署用的精简 safetensors 文件
+
+    去除优化器状态、EMA 以及 one2many 分支，融合 Conv+BN 与 RepVGGDW，
+    只保存权重和重建模型所需的配置。导出的文件可由 AutoBackend 直接加载（权重通过内存映射读取），
+    如 YOLOv10("best.slim.safetensors").predict(source)。
+
+    参数:
+        weights: 训练得到的 .pt 检查点路径
+        output: 输出的 .safetensors 文件路径（可选，默认与 weights 同名）
+        half: 是否以 FP16 保存权重
+        max_det: 端到端后处理保留的最大检测框数量
+        torchscript: 是否同时导出 TorchScript 模型，供 tools/infer_lite.py 使用
+        imgsz: 导出 TorchScript 时的输入尺寸
+    """
+    if output is None:
+        output = os.path.splitext(weights)[0] + ".slim.safetensors"
+
+    model, _ = attempt_load_one_weight(weights, device="cpu", fuse=False)
+    model.eval()
+    strip_one2many(model, max_det)
+    model.fuse(verbose=False)
+
+    tensors = {}
+    for k, v in model.state_dict().items():
+        v = v.detach().contiguous()
+        if half and v.is_floating_point():
+            v = v.half()
+        tensors[k] = v
+
+    metadata = {
+        "format": SLIM_FORMAT,
+        "yaml": json.dumps(model.yaml),
+        "names": json.dumps(model.names),
+        "stride": json.dumps(model.stride.tolist()),
+        "max_det": str(max_det),
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    save_file(tensors, output, metadata=metadata)
+
+    src_size = os.path.getsize(weights) / 1e6
+    dst_size = os.path.getsize(output) / 1e6
+    print(f"导出完成! {weights} ({src_size:.1f} MB) -> {output} ({dst_size:.1f} MB)")
+
+    if torchscript:
+        export_torchscript(model, os.path.splitext(output)[0] + ".torchscript", imgsz)
+    return output
+
+
+@torch.no_grad()
+def export_torchscript(model, output, imgsz=640):
+    """
+    将精简模型导出为 TorchScript，模型元数据写入 config.txt 附加文件
+
+    参数:
+        model: 经过 strip_one2many 和 fuse 的模型
+        output: 输出的 .torchscript 文件路径
+        imgsz: 输入尺寸
+    """
+    model = model.float().eval()
+    im = torch.zeros(1, 3, imgsz, imgsz)
+    model(im)  # 预热一次，使检测头按输入尺寸生成 anchors/strides，避免 trace 检查时图不一致
+    ts = torch.jit.trace(model, im, strict=False)
+    metadata = {
+        "names": model.names,
+        "stride": int(model.stride.max()),
+        "imgsz": [imgsz, imgsz],
+        "max_det": model.model[-1].max_det,
+    }
+    ts.save(output, _extra_files={"config.txt": json.dumps(metadata)})
+    print(f"TorchScript 已保存到: {output}")
+    return output
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="导出去除 one2many 分支并完成重参数化的部署模型")
+    parser.add_argument(
+        "--weights",
+        required=True,
+        help="训练得到的 .pt 检查点路径")
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="输出 .safetensors 文件路径(可选)")
+    parser.add_argument(
+        "--half",
+        action="store_true",
+        help="以 FP16 保存权重")
+    parser.add_argument(
+        "--max_det",
+        type=int,
+        default=300,
+        help="端到端后处理保留的最大检测框数量")
+    parser.add_argument(
+        "--torchscript",
+        action="store_true",
+        help="同时导出 TorchScript 模型(供 tools/infer_lite.py 使用)")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="导出 TorchScript 时的输入尺寸")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    export_slim(args.weights, args.output, args.half, args.max_det, args.torchscript, args.imgsz)
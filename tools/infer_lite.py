@@ -0,0 +1,146 @@
+"""
+仅依赖 torch/numpy/cv2 的轻量推理入口，用于短时批处理任务和命令行调用
+
+模型由 tools/export_slim.py --torchscript 导出（已去除 one2many 分支并完成融合），
+输出即为 v10 端到端结果 (B, max_det, 6)，无需导入 ultralytics。
+"""
+import os
+import json
+import argparse
+
+import cv2
+import numpy as np
+import torch
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def load_model(path, device="cpu"):
+    """
+    加载 TorchScript 模型及其元数据
+
+    参数:
+        path: .torchscript 文件路径
+        device: 推理设备
+    """
+    extra_files = {"config.txt": ""}
+    model = torch.jit.load(path, _extra_files=extra_files, map_location=device).eval()
+    metadata = json.loads(extra_files["config.txt"]) if extra_files["config.txt"] else {}
+    metadata["names"] = {int(k): v for k, v in metadata.get("names", {}).items()}
+    return model, metadata
+
+
+def letterbox(img, new_shape=(640, 640)):
+    """
+    等比缩放并居中填充到 new_shape，与 ultralytics LetterBox(auto=False) 一致
+
+    返回:
+        填充后的图像, 缩放比例, (左填充, 上填充)
+    """
+    shape = img.shape[:2]
+    r = min(new_shape[0] / shape[0], new_shape[1] / shape[1])
+    new_unpad = int(round(shape[1] * r)), int(round(shape[0] * r))
+    dw, dh = (new_shape[1] - new_unpad[0]) / 2, (new_shape[0] - new_unpad[1]) / 2
+
+    if shape[::-1] != new_unpad:
+        img = cv2.resize(img, new_unpad, interpolation=cv2.INTER_LINEAR)
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    img = cv2.copyMakeBorder(img, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+    return img, r, (left, top)
+
+
+def preprocess(imgs, imgsz=(640, 640), device="cpu"):
+    """
+    将 BGR 图像列表转换为模型输入张量
+
+    返回:
+        BCHW 张量(0-1), 每张图像的 (缩放比例, 填充)
+    """
+    batch, ratio_pad = [], []
+    for img in imgs:
+        im, r, pad = letterbox(img, imgsz)
+        batch.append(im)
+        ratio_pad.append((r, pad))
+    x = np.ascontiguousarray(np.stack(batch)[..., ::-1].transpose(0, 3, 1, 2))  # BGR->RGB, BHWC->BCHW
+    x = torch.from_numpy(x).to(device).float() / 255.0
+    return x, ratio_pad
+
+
+def postprocess(preds, imgs, ratio_pad, conf=0.25):
+    """
+    按置信度过滤端到端输出，并将框还原到原图坐标
+
+    返回:
+        每张图像一个 (N, 6) 数组: x1, y1, x2, y2, score, class
+    """
+    results = []
+    for pred, img, (r, (left, top)) in zip(preds.cpu().numpy(), imgs, ratio_pad):
+        pred = pred[pred[:, 4] > conf].copy()
+        pred[:, [0, 2]] = ((pred[:, [0, 2]] - left) / r).clip(0, img.shape[1])
+        pred[:, [1, 3]] = ((pred[:, [1, 3]] - top) / r).clip(0, img.shape[0])
+        results.append(pred)
+    return results
+
+
+@torch.no_grad()
+def predict(model, metadata, imgs, conf=0.25, device="cpu"):
+    """对一批 BGR 图像执行 预处理 + 前向 + 后处理"""
+    x, ratio_pad = preprocess(imgs, tuple(metadata.get("imgsz", (640, 640))), device)
+    preds = model(x)
+    if isinstance(preds, (list, tuple)):
+        preds = preds[0]
+    return postprocess(preds, imgs, ratio_pad, conf)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="轻量推理入口（仅依赖 torch/numpy/cv2）")
+    parser.add_argument(
+        "--model",
+        required=True,
+        help="tools/export_slim.py --torchscript 导出的模型路径")
+    parser.add_argument(
+        "--source",
+        required=True,
+        help="图像文件或图像目录")
+    parser.add_argument(
+        "--conf",
+        type=float,
+        default=0.25,
+        help="置信度阈值")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="批大小")
+    parser.add_argument(
+        "--device",
+        default="cpu",
+        help="推理设备")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    model, metadata = load_model(args.model, args.device)
+    if os.path.isdir(args.source):
+        files = sorted(os.path.join(args.source, f) for f in os.listdir(args.source) if f.lower().endswith(IMAGE_EXTENSIONS))
+    else:
+        files = [args.source]
+
+    names = metadata["names"]
+    for i in range(0, len(files), args.batch):
+        paths, imgs = [], []
+        for p in files[i : i + args.batch]:
+            im = cv2.imread(p)
+            if im is None:  # 无法读取的文件跳过，不影响同一批次的其他图像
+                print(f"WARNING: 无法读取 {p}，已跳过")
+                continue
+            paths.append(p)
+            imgs.append(im)
+        if not imgs:
+            continue
+        for path, det in zip(paths, predict(model, metadata, imgs, args.conf, args.device)):
+            labels = ", ".join(f"{names.get(int(c), int(c))} {s:.2f}" for *_, s, c in det)
+            print(f"{path}: {len(det)} 个目标 {labels}")
@@ -0,0 +1,370 @@
+import os
+import csv
+import copy
+import argparse
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
+
+import numpy as np
+import torch
+from scipy import stats
+
+from ultralytics import YOLOv10
+from ultralytics.cfg import get_cfg
+from ultralytics.data import YOLODataset, build_yolo_dataset
+from ultralytics.data.utils import check_det_dataset, img2label_paths
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.utils import LOGGER, NUM_THREADS, TQDM, colorstr, yaml_save
+from ultralytics.utils.torch_utils import de_parallel
+
+from slices import patient_id
+
+
+def stratified_group_kfold(groups, counts, k=5, seed=0):
+    """
+    按组划分、按类别分层的 k 折划分，同一组的样本只会出现在同一折中，结果只由 seed 决定
+
+    与 sklearn 的 StratifiedGroupKFold 相同的贪心策略：按类别分布的离散程度从大到小依次放置每个组，
+    选择放入后各折类别比例标准差最小的折，相同时选择样本最少的折。
+
+    参数:
+        groups: 每个样本的组名
+        counts: (n, c) 每个样本各类别的目标数（可包含“背景”列）
+        k: 折数
+        seed: 随机种子
+
+    返回:
+        (n,) 每个样本所在的折
+    """
+    groups = np.asarray(groups)
+    counts = np.asarray(counts, dtype=np.float64)
+    names, inverse = np.unique(groups, return_inverse=True)
+    assert len(names) >= k, f"组数 {len(names)} 少于折数 {k}"
+    group_counts = np.zeros((len(names), counts.shape[1]))
+    np.add.at(group_counts, inverse, counts)
+    group_sizes = np.bincount(inverse, minlength=len(names))
+    total = np.maximum(group_counts.sum(0), 1)
+
+    order = np.random.default_rng(seed).permutation(len(names))
+    order = order[np.argsort(-np.std(group_counts[order], axis=1), kind="stable")]
+
+    fold_counts = np.zeros((k, counts.shape[1]))
+    fold_sizes = np.zeros(k, dtype=np.int64)
+    group_fold = np.zeros(len(names), dtype=np.int64)
+    for g in order:
+        best, best_eval = 0, None
+        for f in range(k):
+            fold_counts[f] += group_counts[g]
+            ev = np.mean(np.std(fold_counts / total, axis=0))
+            fold_counts[f] -= group_counts[g]
+            tie = best_eval is not None and abs(ev - best_eval) <= 1e-12
+            if best_eval is None or (ev < best_eval and not tie) or (tie and fold_sizes[f] < fold_sizes[best]):
+                best, best_eval = f, ev
+        fold_counts[best] += group_counts[g]
+        fold_sizes[best] += group_sizes[g]
+        group_fold[g] = best
+    return group_fold[inverse]
+
+
+class SliceStore:
+    """
+    所有折共享的标签与解码后的图像
+
+    标签只扫描一次；cache="ram" 时图像只解码、缩放一次并保存在内存中，cache="disk" 时只生成一次 .npy。
+    """
+
+    def __init__(self, data, args):
+        self.data = data
+        self.imgsz = args.imgsz
+        self.labels = {}
+        self.images = {}
+        cfg = copy.copy(args)
+        cfg.cache = None
+        img_path = [data["train"]] + ([data["val"]] if data.get("val") else [])  # test 集保持独立，不参与划分
+        img_path = [p for x in img_path for p in (x if isinstance(x, list) else [x])]
+        self.dataset = build_yolo_dataset(cfg, img_path, args.batch, data, mode="val")
+        self.labels = {lb["im_file"]: lb for lb in self.dataset.labels}
+        self.im_files = list(self.labels)
+
+        if args.cache in (True, "ram"):
+            self._cache_ram()
+        elif args.cache == "disk":
+            self.dataset.cache_images("disk")
+
+    def _cache_ram(self):
+        ds = self.dataset
+        b, gb = 0, 1 << 30
+        with ThreadPool(NUM_THREADS) as pool:
+            results = pool.imap(lambda i: ds.load_image(i, rect_mode=True), range(ds.ni))
+            pbar = TQDM(enumerate(results), total=ds.ni)
+            for i, x in pbar:
+                self.images[ds.im_files[i]] = x
+                b += x[0].nbytes
+                pbar.desc = f"{colorstr('kfold: ')}Caching images ({b / gb:.1f}GB RAM)"
+            pbar.close()
+
+    def class_counts(self, nc):
+        """每张图像各类别的目标数，最后一列为背景（空标签）"""
+        counts = np.zeros((len(self.im_files), nc + 1), dtype=np.int64)
+        for i, f in enumerate(self.im_files):
+            cls = self.labels[f]["cls"].reshape(-1).astype(np.int64)
+            counts[i, :nc] = np.bincount(cls, minlength=nc)[:nc]
+            counts[i, nc] = len(cls) == 0
+        return counts
+
+
+class SharedStoreDataset(YOLODataset):
+    """从 SliceStore 读取标签与图像的 YOLODataset，不再扫描标签、不重复缓存图像"""
+
+    def __init__(self, *args, store=None, **kwargs):
+        self.store = store  # get_labels 在父类 __init__ 中调用，需提前设置
+        super().__init__(*args, **kwargs)
+
+    def get_labels(self):
+        self.label_files = img2label_paths(self.im_files)
+        labels = []
+        for f in self.im_files:
+            lb = self.store.labels.get(f)
+            if lb is not None:
+                labels.append(dict(lb, cls=lb["cls"].copy()))  # update_labels 会原地修改 cls
+        self.im_files = [lb["im_file"] for lb in labels]
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        x = self.store.images.get(self.im_files[i]) if rect_mode else None
+        if x is None:
+            return super().load_image(i, rect_mode)
+        im, hw0, hw = x
+        if self.augment:  # 与 BaseDataset.load_image 相同维护 buffer，Mosaic 从中选取拼接图像
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return im.copy(), hw0, hw  # 数据增强可能原地修改图像
+
+
+class KFoldTrainer(YOLOv10DetectionTrainer):
+    """训练集与验证集均从共享的 SliceStore 构建的训练器，store 为 None 时与 YOLOv10DetectionTrainer 相同"""
+
+    store = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if self.store is None:
+            return super().build_dataset(img_path, mode, batch)
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        cfg = self.args
+        return SharedStoreDataset(
+            img_path=img_path,
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=cfg,
+            rect=cfg.rect or mode == "val",
+            cache="disk" if cfg.cache == "disk" else None,
+            single_cls=cfg.single_cls or False,
+            stride=gs,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=cfg.task,
+            classes=cfg.classes,
+            data=self.data,
+            fraction=cfg.fraction if mode == "train" else 1.0,
+            store=self.store,
+        )
+
+
+def write_folds(store, folds, k, out_dir, data):
+    """每一折写出 train.txt、val.txt 与 data.yaml，返回各折 data.yaml 的路径"""
+    out_dir = Path(out_dir)
+    files = np.array(store.im_files)
+    yamls = []
+    for i in range(k):
+        fold_dir = out_dir / f"fold{i}"
+        fold_dir.mkdir(parents=True, exist_ok=True)
+        for split, sel in (("train", folds != i), ("val", folds == i)):
+            with open(fold_dir / f"{split}.txt", "w") as f:
+                for path in files[sel]:
+                    f.write(path + "\n")
+        yaml_save(
+            fold_dir / "data.yaml",
+            {
+                "path": str(fold_dir.resolve()),
+                "train": str((fold_dir / "train.txt").resolve()),
+                "val": str((fold_dir / "val.txt").resolve()),
+                "nc": data["nc"],
+                "names": data["names"],
+            },
+        )
+        yamls.append(fold_dir / "data.yaml")
+    return yamls
+
+
+def _train_fold(job):
+    i, model, fold_yaml, out_dir, train_args, threads = job
+    if threads:
+        torch.set_num_threads(threads)
+    m = YOLOv10(model)
+    m.train(data=str(fold_yaml), trainer=KFoldTrainer, project=str(out_dir), name=f"fold{i}", exist_ok=True, **train_args)
+    return i, dict(m.trainer.metrics)
+
+
+def summarize(fold_metrics, confidence=0.95):
+    """
+    汇总各折指标：均值、标准差与基于 t 分布的置信区间，某折缺失的指标按实际给出的折数计算
+
+    返回:
+        {指标: {"mean", "std", "ci_low", "ci_high"}}
+    """
+    keys = list(dict.fromkeys(k for m in fold_metrics for k in m))
+    summary = {}
+    for key in keys:
+        v = np.array([m.get(key, np.nan) for m in fold_metrics], dtype=np.float64)
+        n = int(np.isfinite(v).sum())  # 只统计给出该指标的折
+        t = stats.t.ppf((1 + confidence) / 2, n - 1) if n > 1 else 0.0
+        mean, std = np.nanmean(v), (np.nanstd(v, ddof=1) if n > 1 else 0.0)
+        half = t * std / np.sqrt(n)
+        summary[key] = {"mean": mean, "std": std, "ci_low": mean - half, "ci_high": mean + half}
+    return summary
+
+
+def run_kfold(
+    data,
+    model="yolov10n.yaml",
+    k=5,
+    seed=0,
+    out_dir="runs/kfold",
+    group_pattern=None,
+    parallel=1,
+    confidence=0.95,
+    **train_args,
+):
+    """
+    按患者分组、按类别分层的 k 折交叉验证，所有折共享一次扫描的标签与一次解码的图像
+
+    参数:
+        data: 数据集配置，train/val 中的全部图像参与划分，test 集不使用
+        model: 模型配置或权重
+        k: 折数
+        seed: 划分的随机种子
+        out_dir: 输出目录，包含各折的列表文件、训练结果与 kfold_results.csv
+        group_pattern: 从图像路径提取患者/检查序号的正则表达式(可选)
+        parallel: 同时训练的折数；大于 1 时以 fork 启动子进程，子进程以写时复制共享 SliceStore
+        confidence: 置信区间的置信水平
+        train_args: 其他训练参数，如 epochs、imgsz、batch、cache
+    """
+    out_dir = Path(out_dir).resolve()
+    args = get_cfg(overrides={"model": model, "data": data, **train_args})
+    data = check_det_dataset(data)
+
+    store = SliceStore(data, args)
+    groups = [patient_id(f, group_pattern) for f in store.im_files]
+    counts = store.class_counts(data["nc"])
+    folds = stratified_group_kfold(groups, counts, k=k, seed=seed)
+    yamls = write_folds(store, folds, k, out_dir, data)
+    for i in range(k):
+        sel = folds == i
+        c = counts[sel].sum(0)
+        LOGGER.info(
+            f"{colorstr('kfold:')} fold{i} {sel.sum()} 张切片 / {len(set(np.array(groups)[sel]))} 个患者, "
+            + ", ".join(f"{data['names'][j]}={c[j]}" for j in range(data["nc"]))
+            + f", 背景={c[-1]}"
+        )
+
+    KFoldTrainer.store = store
+    threads = max(1, (os.cpu_count() or 1) // parallel) if parallel > 1 else None
+    jobs = [(i, model, yamls[i], out_dir, train_args, threads) for i in range(k)]
+    if parallel > 1:
+        import multiprocessing as mp
+
+        with mp.get_context("fork").Pool(parallel, maxtasksperchild=1) as pool:
+            results = dict(pool.imap_unordered(_train_fold, jobs))
+    else:
+        results = dict(map(_train_fold, jobs))
+    fold_metrics = [results[i] for i in range(k)]
+
+    summary = summarize(fold_metrics, confidence)
+    keys = list(summary)
+    with open(out_dir / "kfold_results.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["fold"] + keys)
+        for i, m in enumerate(fold_metrics):
+            writer.writerow([f"fold{i}"] + [round(m.get(key, np.nan), 5) for key in keys])
+        for stat in ("mean", "std", "ci_low", "ci_high"):
+            writer.writerow([stat] + [round(summary[key][stat], 5) for key in keys])
+
+    LOGGER.info(f"{colorstr('kfold:')} {k} 折结果 ({confidence:.0%} 置信区间), 保存到 {out_dir / 'kfold_results.csv'}")
+    for key, s in summary.items():
+        LOGGER.info(f"  {key}: {s['mean']:.4f} ± {s['std']:.4f} [{s['ci_low']:.4f}, {s['ci_high']:.4f}]")
+    return fold_metrics, summary
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="按患者分组、类别分层的 k 折交叉验证")
+    parser.add_argument(
+        "--data",
+        default="configs/emphysema.yaml",
+        help="数据集配置")
+    parser.add_argument(
+        "--model",
+        default="yolov10n.yaml",
+        help="模型配置或权重")
+    parser.add_argument(
+        "--k",
+        type=int,
+        default=5,
+        help="折数")
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="划分的随机种子")
+    parser.add_argument(
+        "--group_pattern",
+        default=None,
+        help="从图像路径提取患者序号的正则表达式(可选)，如 '(patient\\d+)'")
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=100,
+        help="每折训练的 epoch 数")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="输入尺寸")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="batch 大小")
+    parser.add_argument(
+        "--cache",
+        default="ram",
+        help="图像缓存: ram、disk 或 none")
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=1,
+        help="同时训练的折数")
+    parser.add_argument(
+        "--out",
+        default="runs/kfold",
+        help="输出目录")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    run_kfold(
+        args.data,
+        args.model,
+        k=args.k,
+        seed=args.seed,
+        out_dir=args.out,
+        group_pattern=args.group_pattern,
+        parallel=args.parallel,
+        epochs=args.epochs,
+        imgsz=args.imgsz,
+        batch=args.batch,
+        cache=False if args.cache == "none" else args.cache,
+    )
@@ -0,0 +1,391 @@
+"""
+ONNX Runtime IOBinding 推理路径与动态批大小导出
+
+AutoBackend 的 onnx 分支每次调用都执行 im.cpu().numpy() 和 session.run()，ORT 每次重新分配输出数组，
+再由 from_numpy 复制成张量；Exporter.export_onnx 导出的模型批大小固定。这里:
+    export_onnx         导出只含 one2one 分支、批维度动态的端到端图，输出 (B, max_det, 6)
+    IOBindingSession    按批形状预分配并复用输出缓冲区，输入直接绑定到张量内存（类型/设备不符时复制到预分配缓冲区），
+                        稳定状态下每个批次不再分配新张量
+    ORTBackend          使用 IOBindingSession 的 AutoBackend，会话选项来自配置
+    IOBindingPredictor  使用 ORTBackend 的预测器
+
+会话选项（ort_options，可由 yaml 提供）:
+    graph_optimization_level: disable / basic / extended / all
+    intra_op_num_threads, inter_op_num_threads: 0 表示由 ORT 决定
+    execution_mode: sequential / parallel
+    enable_cpu_mem_arena, enable_mem_pattern: 内存池与内存复用规划
+    optimized_model_filepath: 保存优化后的图（可选）
+
+用法:
+    python tools/onnx_iobinding.py --weights best.pt --export --imgsz 640
+    >>> model = YOLOv10("best.onnx")
+    >>> results = model.predict(source, predictor=iobinding_predictor(model, ort_options={"intra_op_num_threads": 4}))
+"""
+import time
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+from ultralytics.engine.exporter import get_latest_opset
+from ultralytics.models.yolov10.slim import load_slim, strip_one2many
+from ultralytics.nn.autobackend import AutoBackend
+from ultralytics.nn.tasks import attempt_load_one_weight
+from ultralytics.utils import LOGGER, yaml_load
+from ultralytics.utils.checks import check_requirements
+from ultralytics.utils.torch_utils import select_device
+
+from result_store import ReusablePredictor, build_predictor
+
+DEFAULT_ORT_OPTIONS = {
+    "graph_optimization_level": "all",
+    "intra_op_num_threads": 0,
+    "inter_op_num_threads": 0,
+    "execution_mode": "sequential",
+    "enable_cpu_mem_arena": True,
+    "enable_mem_pattern": True,
+    "optimized_model_filepath": None,
+}
+ORT_DTYPES = {
+    "tensor(float)": (torch.float32, np.float32),
+    "tensor(float16)": (torch.float16, np.float16),
+    "tensor(int64)": (torch.int64, np.int64),
+    "tensor(int32)": (torch.int32, np.int32),
+}
+
+
+@torch.no_grad()
+def export_onnx(weights, imgsz=640, max_det=300, opset=None, simplify=False, output=None):
+    """
+    导出批维度动态的 YOLOv10 端到端 ONNX 模型
+
+    参数:
+        weights: .pt 检查点或 tools/export_slim.py 导出的 .safetensors 文件
+        imgsz: 输入尺寸（高宽固定，只有批维度动态）
+        max_det: 端到端后处理保留的最大检测框数量
+        opset: ONNX opset，默认使用 torch 支持的最新版本
+        simplify: 使用 onnxslim 简化
+        output: 输出路径，默认与 weights 同名
+    """
+    check_requirements(["onnx>=1.12.0"] + (["onnxslim==0.1.31"] if simplify else []))
+    import onnx
+
+    if str(weights).endswith(".safetensors"):
+        model = load_slim(weights)
+        model.model[-1].max_det = max_det
+    else:
+        model, _ = attempt_load_one_weight(weights, device="cpu", fuse=False)
+        strip_one2many(model.float().eval(), max_det)
+        model.fuse(verbose=False)
+    for p in model.parameters():
+        p.requires_grad = False
+    output = str(output or str(weights).rsplit(".", 1)[0] + ".onnx")
+
+    im = torch.zeros(2, 3, imgsz, imgsz)  # 批大小为 2，避免 trace 时把批维度当作常量 1 特化
+    torch.onnx.export(
+        model.eval(),
+        im,
+        output,
+        opset_version=opset or get_latest_opset(),
+        do_constant_folding=True,
+        input_names=["images"],
+        output_names=["output0"],
+        dynamic_axes={"images": {0: "batch"}, "output0": {0: "batch"}},
+    )
+    model_onnx = onnx.load(output)
+    if simplify:
+        import onnxslim
+
+        model_onnx = onnxslim.slim(model_onnx)
+
+    # trace 得到的输出维度是 Concat 推断出的符号维度，固定为 (max_det, 6)，IOBinding 才能按批大小预分配输出
+    for d, v in zip(model_onnx.graph.output[0].type.tensor_type.shape.dim[1:], (max_det, 6)):
+        d.dim_value = v
+
+    metadata = {
+        "stride": int(max(model.stride)),
+        "task": "detect",
+        "batch": 1,
+        "dynamic_batch": True,
+        "imgsz": [imgsz, imgsz],
+        "names": model.names,
+        "max_det": max_det,
+    }  # 与 Exporter 的元数据一致，AutoBackend 可以直接读取
+    for k, v in metadata.items():
+        meta = model_onnx.metadata_props.add()
+        meta.key, meta.value = k, str(v)
+    onnx.save(model_onnx, output)
+    LOGGER.info(f"ONNX 模型已保存到: {output}（动态批大小，输出 (batch, {max_det}, 6)）")
+    return output
+
+
+def session_options(options=None):
+    """由配置字典构建 onnxruntime.SessionOptions，未给出的项使用 DEFAULT_ORT_OPTIONS"""
+    import onnxruntime as ort
+
+    cfg = {**DEFAULT_ORT_OPTIONS, **(options or {})}
+    unknown = set(cfg) - set(DEFAULT_ORT_OPTIONS)
+    if unknown:
+        raise KeyError(f"未知的 ORT 会话选项 {sorted(unknown)}，可选 {sorted(DEFAULT_ORT_OPTIONS)}")
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    modes = {"sequential": ort.ExecutionMode.ORT_SEQUENTIAL, "parallel": ort.ExecutionMode.ORT_PARALLEL}
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = levels[cfg["graph_optimization_level"]]
+    so.intra_op_num_threads = int(cfg["intra_op_num_threads"])
+    so.inter_op_num_threads = int(cfg["inter_op_num_threads"])
+    so.execution_mode = modes[cfg["execution_mode"]]
+    so.enable_cpu_mem_arena = bool(cfg["enable_cpu_mem_arena"])
+    so.enable_mem_pattern = bool(cfg["enable_mem_pattern"])
+    if cfg["optimized_model_filepath"]:
+        so.optimized_model_filepath = str(cfg["optimized_model_filepath"])
+    return so
+
+
+class IOBindingSession:
+    """
+    以 IOBinding 运行的 ORT 会话，每种批形状一组预分配的输出缓冲区（LRU，最多 max_shapes 组）
+
+    返回的输出张量是复用的缓冲区，下一次调用会覆盖其内容；需要跨批次保留时请先 clone()。
+    输出形状中除批维度外还有动态维度时（如 Exporter 导出的图），每种批形状的第一次调用由 ORT 分配输出，
+    之后按实际输出形状预分配缓冲区并重新绑定。
+
+    参数:
+        path: .onnx 文件路径
+        device: torch.device，cpu 或 cuda
+        options: 会话选项，见 DEFAULT_ORT_OPTIONS
+        max_shapes: 缓存的批形状数量上限
+    """
+
+    def __init__(self, path, device=torch.device("cpu"), options=None, max_shapes=8):
+        self.device = torch.device(device)
+        self.cuda = self.device.type == "cuda"
+        check_requirements("onnxruntime-gpu" if self.cuda else "onnxruntime")
+        import onnxruntime as ort
+
+        providers = ["CUDAExecutionProvider", "CPUExecutionProvider"] if self.cuda else ["CPUExecutionProvider"]
+        self.session = ort.InferenceSession(str(path), session_options(options), providers=providers)
+        self.input = self.session.get_inputs()[0]
+        self.outputs = self.session.get_outputs()
+        self.dtype, self.np_dtype = ORT_DTYPES[self.input.type]
+        self.max_shapes = max_shapes
+        self._bindings = OrderedDict()  # shape -> (binding, 输入缓冲区, 输出缓冲区列表或 None)
+
+    def _device(self):
+        return "cuda" if self.cuda else "cpu", self.device.index or 0
+
+    def _output_shape(self, output, batch):
+        """将批维度替换为 batch，仍有其他动态维度时返回 None"""
+        shape = [d if isinstance(d, int) else None for d in output.shape]
+        if shape and shape[0] is None:
+            shape[0] = batch
+        return None if None in shape else shape
+
+    def _bind_outputs(self, binding, shapes):
+        """将各输出绑定到按 shapes 预分配的张量，返回这些张量"""
+        device_type, device_id = self._device()
+        binding.clear_binding_outputs()
+        outs = []
+        for o, shape in zip(self.outputs, shapes):
+            dtype, np_dtype = ORT_DTYPES[o.type]
+            out = torch.empty(shape, dtype=dtype, device=self.device)
+            binding.bind_output(o.name, device_type, device_id, np_dtype, list(shape), out.data_ptr())
+            outs.append(out)
+        return outs
+
+    def _binding(self, shape):
+        if shape in self._bindings:
+            self._bindings.move_to_end(shape)
+            return self._bindings[shape]
+        binding = self.session.io_binding()
+        buf = torch.empty(shape, dtype=self.dtype, device=self.device)
+        shapes = [self._output_shape(o, shape[0]) for o in self.outputs]
+        if None in shapes:  # 输出形状未知，第一次调用由 ORT 分配
+            device_type, device_id = self._device()
+            for o in self.outputs:
+                binding.bind_output(o.name, device_type, device_id)
+            outs = None
+        else:
+            outs = self._bind_outputs(binding, shapes)
+        self._bindings[shape] = [binding, buf, outs]
+        if len(self._bindings) > self.max_shapes:
+            self._bindings.popitem(last=False)
+        return self._bindings[shape]
+
+    def __call__(self, im):
+        """
+        参数:
+            im: (B, 3, H, W) 张量
+
+        返回:
+            单个输出时为张量，否则为张量列表
+        """
+        shape = tuple(im.shape)
+        binding, buf, outs = self._binding(shape)
+        if im.dtype != self.dtype or im.device != self.device or not im.is_contiguous():
+            im = buf.copy_(im)  # 复制到预分配的输入缓冲区
+        device_type, device_id = self._device()
+        binding.bind_input(self.input.name, device_type, device_id, self.np_dtype, list(im.shape), im.data_ptr())
+        if self.cuda:
+            torch.cuda.current_stream(self.device).synchronize()  # 输入由 torch 的流写入，ORT 使用自己的流
+        self.session.run_with_iobinding(binding)
+        if outs is None:
+            outs = [torch.from_numpy(x).to(self.device) for x in binding.copy_outputs_to_cpu()]
+            self._bindings[shape][2] = self._bind_outputs(binding, [x.shape for x in outs])  # 之后的调用复用
+        return outs[0] if len(outs) == 1 else outs
+
+
+class ORTBackend(AutoBackend):
+    """
+    onnx 模型使用 IOBindingSession 推理的 AutoBackend，其他格式与 AutoBackend 相同
+
+    AutoBackend 初始化时会以默认选项创建一次会话，随后被按 ort_options 创建的会话替换，只发生在加载时。
+    """
+
+    def __init__(self, *args, ort_options=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.onnx:
+            self.ort = IOBindingSession(self.w, self.device, ort_options)
+            self.session = self.ort.session
+
+    def forward(self, im, augment=False, visualize=False, embed=None):
+        if not self.onnx:
+            return super().forward(im, augment, visualize, embed)
+        if self.fp16 and im.dtype != torch.float16:
+            im = im.half()
+        return self.ort(im)
+
+
+class IOBindingPredictor(ReusablePredictor):
+    """模型为 onnx 时以 IOBinding 推理的 YOLOv10 预测器，会话选项由 ort_options 给出"""
+
+    ort_options = {}
+
+    def load_model(self, model, verbose=True):
+        self.model = ORTBackend(
+            weights=model or self.args.model,
+            device=select_device(self.args.device, verbose=verbose),
+            dnn=self.args.dnn,
+            data=self.args.data,
+            fp16=self.args.half,
+            batch=self.args.batch,
+            fuse=True,
+            verbose=verbose,
+            ort_options=self.ort_options,
+        )
+        self.device = self.model.device
+        self.args.half = self.model.fp16
+        self.model.eval()
+
+
+def iobinding_predictor(model, ort_options=None, **kwargs):
+    """
+    构建 IOBindingPredictor 实例，供 Model.predict(predictor=...) 使用
+
+    参数:
+        model: 由 .onnx 文件创建的 YOLOv10 模型
+        ort_options: 会话选项
+        kwargs: 其他预测参数（如 conf、batch）
+    """
+    return build_predictor(IOBindingPredictor, model, {"ort_options": ort_options or {}}, **kwargs)
+
+
+def benchmark(path, batch=8, imgsz=640, iters=20, options=None):
+    """
+    对比 AutoBackend 的 session.run 路径与 IOBinding 路径的耗时，并检查稳定状态下输出缓冲区是否复用
+
+    返回:
+        {"run": 秒/批, "iobinding": 秒/批, "max_abs_diff": 两种路径输出的最大差值, "buffers_reused": 输出缓冲区是否复用}
+    """
+    runner = IOBindingSession(path, options=options)
+    name = runner.input.name
+    out_names = [o.name for o in runner.outputs]
+    im = torch.rand(batch, 3, imgsz, imgsz, generator=torch.Generator().manual_seed(0))
+
+    def run(x):  # 与 AutoBackend.forward 的 onnx 分支相同
+        return torch.tensor(runner.session.run(out_names, {name: x.cpu().numpy()})[0])
+
+    def timed(fn):
+        fn(im)
+        t = time.perf_counter()
+        for _ in range(iters):
+            y = fn(im)
+        return (time.perf_counter() - t) / iters, y
+
+    t_run, y_run = timed(run)
+    t_io, y_io = timed(runner)
+    ref = runner(im)  # 持有引用，输出若是新分配的张量则不可能与其地址相同
+    reused = runner._bindings[tuple(im.shape)][2] is not None and all(
+        runner(im).data_ptr() == ref.data_ptr() for _ in range(5)
+    )
+    result = {
+        "run": t_run,
+        "iobinding": t_io,
+        "max_abs_diff": float((y_run - y_io).abs().max()),
+        "buffers_reused": reused,
+    }
+    LOGGER.info(
+        f"batch {batch}: session.run {t_run * 1e3:.2f} ms，IOBinding {t_io * 1e3:.2f} ms "
+        f"({t_run / t_io:.2f}x)，输出差值 {result['max_abs_diff']:.2e}，"
+        + ("输出缓冲区已复用" if reused else "WARNING ⚠️ 稳定状态下输出缓冲区未复用")
+    )
+    return result
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="动态批大小 ONNX 导出与 ORT IOBinding 推理")
+    parser.add_argument(
+        "--weights",
+        required=True,
+        help="--export 时为 .pt/.safetensors 权重，否则为 .onnx 模型")
+    parser.add_argument(
+        "--export",
+        action="store_true",
+        help="导出动态批大小的 ONNX 模型")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="输入尺寸")
+    parser.add_argument(
+        "--max_det",
+        type=int,
+        default=300,
+        help="端到端后处理保留的最大检测框数量")
+    parser.add_argument(
+        "--opset",
+        type=int,
+        default=None,
+        help="ONNX opset")
+    parser.add_argument(
+        "--simplify",
+        action="store_true",
+        help="使用 onnxslim 简化")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        nargs="+",
+        default=[1, 8],
+        help="benchmark 的批大小")
+    parser.add_argument(
+        "--ort_cfg",
+        default=None,
+        help="ORT 会话选项 yaml")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    path = args.weights
+    if args.export:
+        path = export_onnx(args.weights, args.imgsz, args.max_det, args.opset, args.simplify)
+    options = yaml_load(args.ort_cfg) if args.ort_cfg else None
+    for b in args.batch:
+        benchmark(path, b, args.imgsz, options=options)
@@ -0,0 +1,402 @@
+import os
+import sys
+import copy
+import json
+import time
+import fcntl
+import queue
+import shutil
+import argparse
+import threading
+import subprocess
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import psutil
+import torch
+
+from ultralytics import YOLOv10
+from ultralytics.cfg import get_cfg, get_save_dir
+from ultralytics.data import build_yolo_dataset
+from ultralytics.data.utils import check_det_dataset
+from ultralytics.engine.tuner import Tuner
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.utils import DEFAULT_CFG, LOGGER, colorstr, remove_colorstr, yaml_print, yaml_save
+from ultralytics.utils.plotting import plot_tune_results
+
+
+def asha_rungs(epochs, eta=3, min_epochs=1):
+    """
+    计算 ASHA 的晋级检查点（epoch），如 epochs=30, eta=3, min_epochs=3 时为 [3, 10]
+
+    参数:
+        epochs: 每个 trial 的最大 epoch 数
+        eta: 每一级只保留前 1/eta 的 trial
+        min_epochs: 第一级检查点的最小 epoch 数
+    """
+    rungs, r = [], float(epochs)
+    while r / eta >= min_epochs:
+        r /= eta
+        rungs.append(max(int(round(r)), 1))
+    return sorted(set(rungs))
+
+
+class AshaRungs:
+    """
+    所有并发 trial 共享的 ASHA 晋级记录，保存在 json 文件中并以文件锁保护
+
+    trial 到达检查点时上报 fitness；若该检查点已有至少 eta 条记录且当前 fitness 不在前 1/eta，则停止。
+    """
+
+    def __init__(self, path, rungs, eta=3):
+        self.path = str(path)
+        self.rungs = set(rungs)
+        self.eta = eta
+
+    def report(self, trial, epoch, fitness):
+        """上报 trial 在 epoch 的 fitness，返回是否继续训练"""
+        if epoch not in self.rungs:
+            return True
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)  # 文件关闭时释放
+            f.seek(0)
+            records = json.loads(f.read() or "{}")
+            rung = records.setdefault(str(epoch), {})
+            rung[str(trial)] = fitness
+            f.seek(0)
+            f.truncate()
+            json.dump(records, f)
+
+        values = sorted(rung.values(), reverse=True)
+        k = len(values) // self.eta
+        return k == 0 or fitness >= values[k - 1]
+
+
+class AshaTrialTrainer(YOLOv10DetectionTrainer):
+    """
+    单个调参 trial 的训练器：在 ASHA 检查点强制验证并上报 fitness，被淘汰时提前结束训练
+
+    参数以类属性配置，由 trial 子进程在创建 trainer 前设置。
+    """
+
+    rungs = ()
+    eta = 3
+    rung_file = None
+    trial = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.asha = AshaRungs(self.rung_file, self.rungs, self.eta) if self.rung_file else None
+        self._val, self._val_period = self.args.val, self.args.val_period
+        self.add_callback("on_train_epoch_end", lambda trainer: trainer._force_rung_val())
+        self.add_callback("on_fit_epoch_end", lambda trainer: trainer._report_rung())
+
+    def _force_rung_val(self):
+        """调参时通常 val=False，trainer 只在最后一个 epoch 验证，检查点处需同时打开 val 才能得到 fitness"""
+        if self.epoch + 1 in self.rungs:
+            self.args.val, self.args.val_period = True, 1
+
+    def _report_rung(self):
+        self.args.val, self.args.val_period = self._val, self._val_period
+        if self.asha is None or self.stop or self.epoch + 1 not in self.rungs:
+            return
+        fitness = float(self.fitness or 0.0)
+        if not self.asha.report(self.trial, self.epoch + 1, fitness):
+            LOGGER.info(f"{colorstr('ASHA:')} trial {self.trial} 在 epoch {self.epoch + 1} 被淘汰 (fitness={fitness:.5f})")
+            self.stop = True
+
+
+class ParallelTuner(Tuner):
+    """
+    并发执行调参 trial 的 Tuner
+
+    - 在核心数/内存预算内同时运行多个 trial，每个 trial 绑定独占的 CPU 核心（多 GPU 时轮流分配设备）
+    - 按 ASHA 检查点淘汰表现差的 trial，被淘汰的 trial 以其停止时的 fitness 记入结果
+    - 调参开始前统一构建标签缓存与磁盘图像缓存 (.npy)，所有 trial 以 cache=disk 复用
+
+    结果文件 tune_results.csv、best_hyperparameters.yaml 以及 weights/ 与 Tuner 相同。
+
+    用法:
+        >>> tuner = ParallelTuner(args=dict(model="yolov10n.yaml", data="configs/emphysema.yaml", epochs=30))
+        >>> tuner(iterations=40, parallel=4)
+    """
+
+    def __init__(self, args=DEFAULT_CFG, _callbacks=None, eta=3, min_epochs=1, shared_cache=True):
+        super().__init__(args, _callbacks)
+        self.eta = eta
+        self.min_epochs = min_epochs
+        self.shared_cache = shared_cache
+        self.rungs = asha_rungs(self.args.epochs, eta, min_epochs)
+        self.rng = np.random.default_rng()
+        self._lock = threading.Lock()
+        self._started = 0
+        self._completed = 0
+
+    def _mutate(self, parent="single", n=5, mutation=0.8, sigma=0.2):
+        """
+        与 Tuner._mutate 相同，但适用于并发 trial：
+
+        - 使用独立的随机数生成器，避免同一秒内启动的 trial 得到相同的变异
+        - 尚无结果时，除第一个 trial 外均在默认超参数附近变异，避免并发的首批 trial 重复
+        """
+        keys = list(self.space.keys())
+        if self.tune_csv.exists():
+            x = np.loadtxt(self.tune_csv, ndmin=2, delimiter=",", skiprows=1)
+            n = min(n, len(x))
+            x = x[np.argsort(-x[:, 0])][:n]  # top n mutations
+            w = x[:, 0] - x[:, 0].min() + 1e-6  # weights (sum > 0)
+            if parent == "single" or len(x) == 1:
+                x = x[self.rng.choice(n, p=w / w.sum())]  # weighted selection
+            elif parent == "weighted":
+                x = (x * w.reshape(n, 1)).sum(0) / w.sum()  # weighted combination
+            base = x[1:]
+        elif self._started:
+            base = np.array([getattr(self.args, k) for k in keys], dtype=float)
+        else:
+            base = None
+
+        if base is None:
+            hyp = {k: getattr(self.args, k) for k in keys}
+        else:
+            r = self.rng
+            g = np.array([v[2] if len(v) == 3 else 1.0 for v in self.space.values()])  # gains 0-1
+            ng = len(self.space)
+            v = np.ones(ng)
+            while all(v == 1):  # mutate until a change occurs (prevent duplicates)
+                v = (g * (r.random(ng) < mutation) * r.standard_normal(ng) * r.random() * sigma + 1).clip(0.3, 3.0)
+            hyp = {k: float(base[i] * v[i]) for i, k in enumerate(keys)}
+
+        # Constrain to limits
+        for k, v in self.space.items():
+            hyp[k] = max(hyp[k], v[0])  # lower limit
+            hyp[k] = min(hyp[k], v[1])  # upper limit
+            hyp[k] = round(hyp[k], 5)  # significant digits
+
+        return hyp
+
+    def prebuild_cache(self):
+        """构建一次标签缓存与磁盘图像缓存，之后所有 trial 直接读取"""
+        data = check_det_dataset(self.args.data)
+        cfg = copy.copy(self.args)
+        cfg.cache = "disk"
+        for mode in ("train", "val"):
+            img_path = data["train"] if mode == "train" else data.get("val") or data.get("test")
+            LOGGER.info(f"{self.prefix}构建共享缓存 {mode}: {img_path}")
+            build_yolo_dataset(cfg, img_path, self.args.batch, data, mode=mode)
+        self.args.cache = "disk"
+
+    def budget(self, parallel=None, cores_per_trial=None, mem_per_trial=4.0):
+        """
+        按 CPU 核心与可用内存确定并发数，返回每个并发槽位的 (核心列表, 设备)
+
+        参数:
+            parallel: 并发 trial 数，为 None 时按预算自动确定
+            cores_per_trial: 每个 trial 的核心数，为 None 时自动确定
+            mem_per_trial: 每个 trial 预计占用的内存 (GB)
+        """
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+        mem = psutil.virtual_memory().available / (1 << 30)
+        if parallel is None:
+            by_mem = int(mem // mem_per_trial) if mem_per_trial else len(cores)
+            by_cores = len(cores) // (cores_per_trial or 4)
+            parallel = max(1, min(by_mem, by_cores))
+        cores_per_trial = cores_per_trial or max(1, len(cores) // parallel)
+
+        device = str(self.args.device or "")
+        devices = [d for d in device.split(",") if d] if device not in ("", "cpu", "mps") else [device or None]
+        slots = []
+        for j in range(parallel):
+            slots.append((cores[j * cores_per_trial : (j + 1) * cores_per_trial] or cores, devices[j % len(devices)]))
+        LOGGER.info(
+            f"{self.prefix}并发 {parallel} 个 trial，每个 {cores_per_trial} 核 "
+            f"(可用 {len(cores)} 核, {mem:.1f} GB 内存)，ASHA 检查点 epoch {self.rungs} eta={self.eta}"
+        )
+        return slots
+
+    def __call__(self, model=None, iterations=10, cleanup=True, parallel=None, cores_per_trial=None, mem_per_trial=4.0):
+        """
+        并发执行超参数进化
+
+        参数:
+            model: 未使用，保留与 Tuner 相同的签名
+            iterations: trial 总数
+            cleanup: 是否删除非最优 trial 的权重
+            parallel: 并发 trial 数
+            cores_per_trial: 每个 trial 的核心数
+            mem_per_trial: 每个 trial 预计占用的内存 (GB)
+        """
+        self.t0 = time.time()
+        self.iterations = iterations
+        self.cleanup = cleanup
+        self.best_save_dir, self.best_metrics = None, None
+        (self.tune_dir / "weights").mkdir(parents=True, exist_ok=True)
+        self.rung_file = self.tune_dir / "asha_rungs.json"
+        if self.shared_cache:
+            self.prebuild_cache()
+
+        self._slots = queue.Queue()
+        for slot in self.budget(parallel, cores_per_trial, mem_per_trial):
+            self._slots.put(slot)
+        with ThreadPool(self._slots.qsize()) as pool:
+            for _ in pool.imap_unordered(self._run_trial, range(iterations)):
+                pass
+
+    def _run_trial(self, i):
+        cores, device = self._slots.get()
+        try:
+            with self._lock:
+                mutated_hyp = self._mutate()
+                self._started += 1
+                train_args = {**vars(self.args), **mutated_hyp}
+                save_dir = get_save_dir(get_cfg(train_args))
+                save_dir.mkdir(parents=True, exist_ok=True)  # 占用目录名，避免并发 trial 冲突
+            train_args.update(name=save_dir.name, exist_ok=True, device=device)
+            LOGGER.info(f"{self.prefix}Starting iteration {i + 1}/{self.iterations} with hyperparameters: {mutated_hyp}")
+
+            metrics = {}
+            weights_dir = save_dir / "weights"
+            ckpt_file = weights_dir / "last.pt"
+            trial = {
+                "args": train_args,
+                "rungs": self.rungs,
+                "eta": self.eta,
+                "rung_file": str(self.rung_file),
+                "trial": i + 1,
+                "cores": cores,
+            }
+            env = {**os.environ, "OMP_NUM_THREADS": str(len(cores))}
+            try:
+                cmd = [sys.executable, os.path.abspath(__file__), "--trial", json.dumps(trial, default=str)]
+                subprocess.run(cmd, check=True, env=env)
+                ckpt_file = weights_dir / ("best.pt" if (weights_dir / "best.pt").exists() else "last.pt")
+                metrics = torch.load(ckpt_file)["train_metrics"]
+            except Exception as e:
+                LOGGER.warning(f"WARNING ❌️ training failure for hyperparameter tuning iteration {i + 1}\n{e}")
+
+            with self._lock:
+                self._record(i, mutated_hyp, metrics, save_dir, weights_dir)
+        finally:
+            self._slots.put((cores, device))
+
+    def _record(self, i, mutated_hyp, metrics, save_dir, weights_dir):
+        """与 Tuner.__call__ 相同的结果记录，按 trial 完成顺序追加到 tune_results.csv"""
+        self._completed += 1
+
+        # Save results and mutated_hyp to CSV
+        fitness = metrics.get("fitness", 0.0)
+        log_row = [round(fitness, 5)] + [mutated_hyp[k] for k in self.space.keys()]
+        headers = "" if self.tune_csv.exists() else (",".join(["fitness"] + list(self.space.keys())) + "\n")
+        with open(self.tune_csv, "a") as f:
+            f.write(headers + ",".join(map(str, log_row)) + "\n")
+
+        # Get best results
+        x = np.loadtxt(self.tune_csv, ndmin=2, delimiter=",", skiprows=1)
+        fitness = x[:, 0]  # first column
+        best_idx = fitness.argmax()
+        if best_idx == len(x) - 1:
+            self.best_save_dir = save_dir
+            self.best_metrics = {k: round(v, 5) for k, v in metrics.items()}
+            for ckpt in weights_dir.glob("*.pt"):
+                shutil.copy2(ckpt, self.tune_dir / "weights")
+        elif self.cleanup and weights_dir.exists():
+            shutil.rmtree(weights_dir)  # remove iteration weights/ dir to reduce storage space
+
+        # Plot tune results
+        plot_tune_results(self.tune_csv)
+
+        # Save and print tune results
+        header = (
+            f'{self.prefix}{self._completed}/{self.iterations} iterations complete ✅ ({time.time() - self.t0:.2f}s)\n'
+            f'{self.prefix}Results saved to {colorstr("bold", self.tune_dir)}\n'
+            f'{self.prefix}Best fitness={fitness[best_idx]} observed at iteration {best_idx + 1}\n'
+            f'{self.prefix}Best fitness metrics are {self.best_metrics}\n'
+            f'{self.prefix}Best fitness model is {self.best_save_dir}\n'
+            f'{self.prefix}Best fitness hyperparameters are printed below.\n'
+        )
+        LOGGER.info("\n" + header)
+        data = {k: float(x[best_idx, j + 1]) for j, k in enumerate(self.space.keys())}
+        yaml_save(
+            self.tune_dir / "best_hyperparameters.yaml",
+            data=data,
+            header=remove_colorstr(header.replace(self.prefix, "# ")) + "\n",
+        )
+        yaml_print(self.tune_dir / "best_hyperparameters.yaml")
+
+
+def run_trial(trial):
+    """trial 子进程入口"""
+    if hasattr(os, "sched_setaffinity"):  # 在子进程内绑定核心（仅 Linux），其他平台只限制线程数
+        os.sched_setaffinity(0, trial["cores"])
+    AshaTrialTrainer.rungs = tuple(trial["rungs"])
+    AshaTrialTrainer.eta = trial["eta"]
+    AshaTrialTrainer.rung_file = trial["rung_file"]
+    AshaTrialTrainer.trial = trial["trial"]
+    args = trial["args"]
+    model = YOLOv10(args.pop("model") or "yolov10n.yaml")
+    model.train(trainer=AshaTrialTrainer, **args)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="并发 + ASHA 早停的 YOLOv10 超参数调优")
+    parser.add_argument(
+        "--model",
+        default="yolov10n.yaml",
+        help="模型配置或权重")
+    parser.add_argument(
+        "--data",
+        default="configs/emphysema.yaml",
+        help="数据集配置")
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=30,
+        help="每个 trial 的最大 epoch 数")
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=40,
+        help="trial 总数")
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=None,
+        help="并发 trial 数(可选)")
+    parser.add_argument(
+        "--cores",
+        type=int,
+        default=None,
+        help="每个 trial 的核心数(可选)")
+    parser.add_argument(
+        "--mem",
+        type=float,
+        default=4.0,
+        help="每个 trial 预计占用的内存 (GB)")
+    parser.add_argument(
+        "--eta",
+        type=int,
+        default=3,
+        help="ASHA 每一级只保留前 1/eta")
+    parser.add_argument(
+        "--min_epochs",
+        type=int,
+        default=1,
+        help="ASHA 第一级检查点的最小 epoch 数")
+    parser.add_argument(
+        "--trial",
+        default=None,
+        help=argparse.SUPPRESS)  # trial 子进程使用
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.trial is not None:
+        run_trial(json.loads(args.trial))
+    else:
+        tuner = ParallelTuner(
+            args=dict(model=args.model, data=args.data, epochs=args.epochs, plots=False, val=True),
+            eta=args.eta,
+            min_epochs=args.min_epochs,
+        )
+        tuner(iterations=args.iterations, parallel=args.parallel, cores_per_trial=args.cores, mem_per_trial=args.mem)
@@ -0,0 +1,330 @@
+"""
+推理可观测性: 各阶段耗时直方图、批大小分布、吞吐计数与内存峰值，以 Prometheus 文本格式导出
+
+BasePredictor.stream_inference 只在控制台打印各阶段的平均耗时。PredictMetrics 通过预测回调按批次记录分布，
+可以通过本地 HTTP 端点（/metrics）或文件（node_exporter textfile collector）导出，
+也可以注册 sink 或 on_predict_metrics 回调把快照发送到其他系统。
+
+每个批次只做常数次直方图更新（二分查找桶）和一次 getrusage 调用，导出在抓取时或按 interval 限频进行，
+开启后的开销与批次数成正比，与图像内容无关。
+
+用法:
+    >>> metrics = PredictMetrics(file="/var/lib/node_exporter/yolo.prom")
+    >>> metrics.serve(9464)
+    >>> metrics.attach(model, model_name="emphysema-v10n")
+    >>> for r in model.predict(source, stream=True):
+    ...     ...
+    外部队列可以上报排队时间:
+    >>> metrics.record_queue_wait(time.time() - job.submitted_at, model_name="emphysema-v10n")
+"""
+import os
+import sys
+import math
+import time
+import bisect
+import argparse
+import resource
+import threading
+from pathlib import Path
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+STAGES = ("preprocess", "inference", "postprocess")
+# ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+RSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+class Histogram:
+    """固定桶的累积直方图，observe 为 O(log 桶数)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个为 +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶内线性插值估计分位数，落在 +Inf 桶时返回最大的桶上界"""
+        if not self.count:
+            return float("nan")
+        rank, cum = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            if cum + c >= rank and c:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lo = self.buckets[i - 1] if i else 0.0
+                return lo + (self.buckets[i] - lo) * (rank - cum) / c
+            cum += c
+        return self.buckets[-1]
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels) + "}"
+
+
+def _fmt(v):
+    v = float(v)
+    if not math.isfinite(v):
+        return "NaN" if math.isnan(v) else ("+Inf" if v > 0 else "-Inf")
+    return str(int(v)) if v.is_integer() else repr(v)
+
+
+class PredictMetrics:
+    """
+    预测指标注册表，可同时服务多个模型（以 model 标签区分）
+
+    指标:
+        {prefix}_stage_seconds             每批次各阶段耗时直方图（stage=preprocess/inference/postprocess/wait）,
+                                           wait 为两个批次之间的间隔，即读取下一批与调用方处理结果的时间
+        {prefix}_queue_wait_seconds        record_queue_wait 上报的排队时间直方图
+        {prefix}_batch_size                批大小直方图
+        {prefix}_images_total              已处理图像数
+        {prefix}_batches_total             已处理批次数
+        {prefix}_busy_seconds_total        预处理 + 推理 + 后处理的累计耗时，images_total 与其之比即吞吐
+        {prefix}_rss_peak_bytes            进程常驻内存峰值
+        {prefix}_cuda_memory_peak_bytes    CUDA 显存分配峰值（使用 GPU 时）
+
+    参数:
+        prefix: 指标名前缀
+        file: 定期写入的 Prometheus 文本文件
+        interval: 写文件与调用 sink 的最小间隔（秒）
+        latency_buckets: 耗时直方图的桶（秒）
+        batch_buckets: 批大小直方图的桶
+    """
+
+    def __init__(self, prefix="yolo_predict", file=None, interval=10.0, latency_buckets=LATENCY_BUCKETS,
+                 batch_buckets=BATCH_BUCKETS):
+        self.prefix = prefix
+        self.file = file
+        self.interval = interval
+        self.latency_buckets = latency_buckets
+        self.batch_buckets = batch_buckets
+        self.sinks = []
+        self.server = None
+        self._lock = threading.Lock()
+        self._hist = {}  # (name, labels) -> Histogram
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._last_flush = time.monotonic()
+        self._help = {
+            "stage_seconds": ("histogram", "Per-batch latency of each prediction stage"),
+            "queue_wait_seconds": ("histogram", "Time a request waited in the queue before prediction"),
+            "batch_size": ("histogram", "Number of images per batch"),
+            "images_total": ("counter", "Images processed"),
+            "batches_total": ("counter", "Batches processed"),
+            "busy_seconds_total": ("counter", "Seconds spent in preprocess, inference and postprocess"),
+            "rss_peak_bytes": ("gauge", "Peak resident set size of the process"),
+            "cuda_memory_peak_bytes": ("gauge", "Peak CUDA memory allocated by torch"),
+        }
+
+    def observe(self, name, value, labels=(), buckets=None):
+        key = (name, tuple(labels))
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = Histogram(buckets or self.latency_buckets)
+            h.observe(value)
+
+    def inc(self, name, value=1, labels=()):
+        with self._lock:
+            self._counters[(name, tuple(labels))] += value
+
+    def set_max(self, name, value, labels=()):
+        """高水位 gauge，只记录出现过的最大值"""
+        key = (name, tuple(labels))
+        with self._lock:
+            self._gauges[key] = max(self._gauges.get(key, value), value)
+
+    def record_queue_wait(self, seconds, model_name="default"):
+        """供外部队列上报请求从提交到开始预测的时间"""
+        self.observe("queue_wait_seconds", seconds, (("model", model_name),))
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            hist = {k: (h.buckets, list(h.counts), h.sum, h.count) for k, h in self._hist.items()}
+            counters, gauges = dict(self._counters), dict(self._gauges)
+        series = defaultdict(list)
+        for (name, labels), v in list(counters.items()) + list(gauges.items()):
+            series[name].append(f"{self.prefix}_{name}{_labels(labels)} {_fmt(v)}")
+        for (name, labels), (buckets, counts, total, count) in hist.items():
+            m, cum = f"{self.prefix}_{name}", 0
+            for le, c in zip(buckets + ("+Inf",), counts):
+                cum += c
+                le = le if le == "+Inf" else _fmt(le)
+                series[name].append(f"{m}_bucket{_labels(labels + (('le', le),))} {cum}")
+            series[name] += [f"{m}_sum{_labels(labels)} {_fmt(total)}", f"{m}_count{_labels(labels)} {count}"]
+        lines = []
+        for name in sorted(series):
+            kind, doc = self._help.get(name, ("untyped", name))
+            lines += [f"# HELP {self.prefix}_{name} {doc}", f"# TYPE {self.prefix}_{name} {kind}", *series[name]]
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        """供 sink 使用的字典快照: 计数、gauge 以及各直方图的 count/sum/p50/p90/p99"""
+        with self._lock:
+            out = {"counters": {}, "gauges": {}, "histograms": {}}
+            for (name, labels), v in self._counters.items():
+                out["counters"][name + _labels(labels)] = v
+            for (name, labels), v in self._gauges.items():
+                out["gauges"][name + _labels(labels)] = v
+            for (name, labels), h in self._hist.items():
+                out["histograms"][name + _labels(labels)] = {
+                    "count": h.count,
+                    "sum": h.sum,
+                    **{f"p{int(q * 100)}": h.quantile(q) for q in (0.5, 0.9, 0.99)},
+                }
+        return out
+
+    def write(self, path=None):
+        """原子地写出 Prometheus 文本文件"""
+        path = Path(path or self.file)
+        tmp = path.with_name(f".{path.name}.tmp")
+        tmp.write_text(self.render())
+        os.replace(tmp, path)
+
+    def serve(self, port=9464, host="127.0.0.1"):
+        """在后台线程中启动 HTTP 端点，GET /metrics 返回 Prometheus 文本"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):  # 不在控制台打印每次抓取
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server
+
+    def add_sink(self, fn):
+        """注册 fn(snapshot)，每隔 interval 秒及每次预测结束时调用"""
+        self.sinks.append(fn)
+
+    def flush(self, predictor=None):
+        self._last_flush = time.monotonic()
+        if self.file:
+            self.write()
+        if self.sinks:
+            snapshot = self.snapshot()
+            for fn in self.sinks:
+                fn(snapshot)
+        if predictor is not None:
+            predictor.run_callbacks("on_predict_metrics")
+
+    def attach(self, target, model_name=None):
+        """
+        为 Model 或 Predictor 注册预测回调
+
+        参数:
+            target: 具有 add_callback 的 YOLOv10 模型或预测器
+            model_name: model 标签，默认为权重文件名
+        """
+        target.add_callback("on_predict_start", lambda p: self._on_start(p, model_name))
+        target.add_callback("on_predict_batch_start", self._on_batch_start)
+        target.add_callback("on_predict_batch_end", self._on_batch_end)
+        target.add_callback("on_predict_end", self.flush)
+        return target
+
+    def _on_start(self, predictor, model_name):
+        if model_name is None:
+            model_name = Path(str(predictor.args.model)).stem if predictor.args.model else "default"
+        predictor.metrics = self
+        predictor._metrics_labels = (("model", model_name),)
+        predictor._metrics_t = time.perf_counter()
+
+    def _on_batch_start(self, predictor):
+        now = time.perf_counter()
+        self.observe("stage_seconds", now - predictor._metrics_t, predictor._metrics_labels + (("stage", "wait"),))
+
+    def _on_batch_end(self, predictor):
+        labels, results = predictor._metrics_labels, predictor.results
+        n = len(results)
+        if n:
+            busy = 0.0
+            for stage in STAGES:
+                dt = results[0].speed[stage] * n / 1e3  # speed 为每张图像的毫秒数
+                busy += dt
+                self.observe("stage_seconds", dt, labels + (("stage", stage),))
+            self.observe("batch_size", n, labels, self.batch_buckets)
+            self.inc("images_total", n, labels)
+            self.inc("batches_total", 1, labels)
+            self.inc("busy_seconds_total", busy, labels)
+        self.set_max("rss_peak_bytes", resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT)
+        device = getattr(predictor, "device", None)
+        if device is not None and device.type == "cuda":
+            import torch
+
+            self.set_max("cuda_memory_peak_bytes", torch.cuda.max_memory_allocated(device), labels)
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush(predictor)
+        predictor._metrics_t = time.perf_counter()
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="带指标导出的推理")
+    parser.add_argument(
+        "--weights",
+        required=True,
+        help="模型权重")
+    parser.add_argument(
+        "--source",
+        required=True,
+        help="图像文件或目录")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="批大小")
+    parser.add_argument(
+        "--port",
+        type=int,
+        default=None,
+        help="在该端口提供 /metrics")
+    parser.add_argument(
+        "--file",
+        default=None,
+        help="写出 Prometheus 文本文件")
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=10.0,
+        help="写文件的最小间隔（秒）")
+    parser.add_argument(
+        "--device",
+        default="cpu",
+        help="推理设备")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    from ultralytics import YOLOv10
+
+    args = parse()
+
+    metrics = PredictMetrics(file=args.file, interval=args.interval)
+    if args.port:
+        metrics.serve(args.port)
+    model = metrics.attach(YOLOv10(args.weights), Path(args.weights).stem)
+    for _ in model.predict(args.source, batch=args.batch, device=args.device, stream=True, verbose=False):
+        pass
+    print(metrics.render())
@@ -0,0 +1,425 @@
+import os
+import re
+import json
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from ultralytics import YOLOv10
+from ultralytics.engine.results import Results
+from ultralytics.models.yolov10.predict import YOLOv10DetectionPredictor
+
+STORE_FORMAT = "yolov10-results"
+
+
+def slice_index(path):
+    """从文件名末尾的数字解析切片序号，如 patient01_0123.png -> 123，解析失败时返回 -1"""
+    m = re.search(r"(\d+)$", Path(path).stem)
+    return int(m.group(1)) if m else -1
+
+
+class CompactResult:
+    """
+    轻量的检测结果：检测框以 (n, 6) float32 数组 [x1, y1, x2, y2, conf, cls] 紧凑保存，
+    默认不引用原图，使用 __slots__ 避免每个实例的 __dict__
+
+    需要绘图或裁剪时通过 to_results() 转为 Results（未保存原图时从 path 重新读取）。
+    """
+
+    __slots__ = ("path", "names", "orig_shape", "data", "speed", "orig_img", "save_dir")
+
+    def __init__(self, path, names, orig_shape, data, orig_img=None):
+        self.path = path
+        self.names = names  # 所有结果共享同一个 dict
+        self.orig_shape = tuple(orig_shape)
+        self.data = data
+        self.speed = None
+        self.orig_img = orig_img
+        self.save_dir = None
+
+    @classmethod
+    def from_results(cls, result, keep_image=False):
+        data = result.boxes.data
+        data = data.cpu().numpy() if isinstance(data, torch.Tensor) else np.asarray(data)
+        return cls(
+            result.path,
+            result.names,
+            result.orig_shape,
+            np.ascontiguousarray(data[:, :6], dtype=np.float32),
+            result.orig_img if keep_image else None,
+        )
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"CompactResult(path={self.path!r}, orig_shape={self.orig_shape}, detections={len(self)})"
+
+    @property
+    def xyxy(self):
+        return self.data[:, :4]
+
+    @property
+    def conf(self):
+        return self.data[:, 4]
+
+    @property
+    def cls(self):
+        return self.data[:, 5].astype(np.int64)
+
+    @property
+    def xywhn(self):
+        h, w = self.orig_shape
+        xyxy = self.xyxy
+        xywh = np.concatenate(((xyxy[:, :2] + xyxy[:, 2:]) / 2, xyxy[:, 2:] - xyxy[:, :2]), 1)
+        return xywh / np.array([w, h, w, h], dtype=np.float32)
+
+    def verbose(self):
+        """与 Results.verbose 相同的日志字符串"""
+        if len(self) == 0:
+            return "(no detections), "
+        cls = self.cls
+        return "".join(
+            f"{(cls == c).sum()} {self.names[int(c)]}{'s' * ((cls == c).sum() > 1)}, " for c in np.unique(cls)
+        )
+
+    def save_txt(self, txt_file, save_conf=False):
+        """与 Results.save_txt 相同的 YOLO 格式输出"""
+        lines = []
+        for c, xywhn, conf in zip(self.cls, self.xywhn, self.conf):
+            line = (c, *xywhn) + ((conf,) if save_conf else ())
+            lines.append(("%g " * len(line)).rstrip() % line)
+        if lines:
+            Path(txt_file).parent.mkdir(parents=True, exist_ok=True)
+            with open(txt_file, "a") as f:
+                f.writelines(text + "\n" for text in lines)
+
+    def to_results(self):
+        """转换为完整的 Results"""
+        orig_img = self.orig_img if self.orig_img is not None else cv2.imread(str(self.path))
+        if orig_img is None:
+            raise FileNotFoundError(f"Image Not Found {self.path}，内存中的数据源需要 keep_image=True 才能绘图或裁剪")
+        result = Results(orig_img, path=self.path, names=self.names, boxes=torch.from_numpy(self.data))
+        result.speed = self.speed or {}
+        result.save_dir = self.save_dir
+        return result
+
+    def plot(self, *args, **kwargs):
+        return self.to_results().plot(*args, **kwargs)
+
+    def save_crop(self, *args, **kwargs):
+        return self.to_results().save_crop(*args, **kwargs)
+
+
+class ReusablePredictor(YOLOv10DetectionPredictor):
+    """
+    预先构建、通过 Model.predict(predictor=...) 传入的 YOLOv10 预测器
+
+    Model.predict 会以同一个 nn.Module 再次调用 setup_model()，此时直接跳过，
+    优化后的计算图、ONNX Runtime 会话等开销较大的后端只构建一次。子类重写 load_model() 而不是 setup_model()。
+    """
+
+    _source = None
+
+    def setup_model(self, model, verbose=True):
+        if self.model is not None and model is self._source:
+            return
+        self._source = model
+        self.load_model(model, verbose)
+
+    def load_model(self, model, verbose=True):
+        """为 model 构建推理后端，默认使用 AutoBackend"""
+        super().setup_model(model, verbose)
+
+
+def build_predictor(predictor, model, attrs=None, verbose=True, **kwargs):
+    """
+    按 Model.predict 的默认参数为 model 创建预测器并加载模型
+
+    参数:
+        predictor: 预测器类，如 ReusablePredictor 的子类
+        model: YOLOv10 模型，预测器继承其 overrides 与回调
+        attrs: 加载模型前设置到预测器上的属性（可选）
+        verbose: 是否打印模型加载信息
+        kwargs: 覆盖默认值的预测参数，如 conf、batch、imgsz
+    """
+    custom = {"conf": 0.25, "batch": 1, "save": False, "mode": "predict"}  # Model.predict 的默认参数
+    predictor = predictor(overrides={**model.overrides, **custom, **kwargs}, _callbacks=model.callbacks)
+    for k, v in (attrs or {}).items():
+        setattr(predictor, k, v)
+    predictor.setup_model(model=model.model, verbose=verbose)
+    return predictor
+
+
+class CompactPredictor(ReusablePredictor):
+    """
+    返回 CompactResult 的 YOLOv10 预测器，keep_image 为 True 时保留原图引用
+
+    用法:
+        >>> model = YOLOv10("best.pt")
+        >>> predictor = compact_predictor(model, conf=0.25)
+        >>> results = predictor("images/")  # stream=False 时内存占用也很小
+    """
+
+    keep_image = False
+
+    def setup_source(self, source):
+        if not self.keep_image and (self.args.save or self.args.show or self.args.save_crop):
+            # 绘图和裁剪要从 path 重新读取原图，数组、视频流等内存数据源无法读取
+            raise ValueError("save/show/save_crop 需要原图，请使用 keep_image=True")
+        super().setup_source(source)
+
+    def postprocess(self, preds, img, orig_imgs):
+        results = super().postprocess(preds, img, orig_imgs)
+        return [CompactResult.from_results(r, self.keep_image) for r in results]
+
+
+class ResultSink:
+    """
+    按列分块写入检测结果的磁盘存储，内存占用只与块大小有关，与任务规模无关
+
+    每个块为一个 npz 文件，包含图像表 (path, slice, shape, offset) 与检测表 (xyxy, conf, cls)，
+    第 i 张图像的检测为检测表的 [offset[i], offset[i + 1]) 行；manifest.json 记录所有块，
+    每写完一块即更新，中断的任务已写入的部分仍可查询。目录已存在时继续追加。
+
+    用法:
+        >>> with ResultSink("runs/predict/cohort", names=model.names) as sink:
+        ...     for r in compact_predictor(model)(source, stream=True):
+        ...         sink.append(r)
+        >>> store = ResultStore("runs/predict/cohort")
+    """
+
+    def __init__(self, out_dir, names=None, chunk_images=100000, chunk_detections=1000000):
+        self.out_dir = Path(out_dir)
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self.manifest_file = self.out_dir / "manifest.json"
+        if self.manifest_file.exists():
+            self.manifest = json.loads(self.manifest_file.read_text())
+        else:
+            self.manifest = {"format": STORE_FORMAT, "names": {}, "chunks": []}
+        if names:
+            self.manifest["names"] = {str(k): v for k, v in names.items()}
+        self.chunk_images = chunk_images
+        self.chunk_detections = chunk_detections
+        self._reset()
+
+    def _reset(self):
+        self.paths, self.slices, self.shapes, self.counts, self.dets = [], [], [], [], []
+        self.n_dets = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def append(self, result, slice_idx=None):
+        """
+        追加一张图像的结果
+
+        参数:
+            result: CompactResult 或 Results
+            slice_idx: 切片序号，为 None 时从文件名解析
+        """
+        if isinstance(result, Results):
+            result = CompactResult.from_results(result)
+        if not self.manifest["names"] and result.names:
+            self.manifest["names"] = {str(k): v for k, v in result.names.items()}
+        self.paths.append(str(result.path))
+        self.slices.append(slice_index(result.path) if slice_idx is None else slice_idx)
+        self.shapes.append(result.orig_shape)
+        self.counts.append(len(result))
+        self.dets.append(result.data)
+        self.n_dets += len(result)
+        if len(self.paths) >= self.chunk_images or self.n_dets >= self.chunk_detections:
+            self.flush()
+
+    def flush(self):
+        """将缓冲区写为一个新的块"""
+        if not self.paths:
+            return
+        dets = np.concatenate(self.dets) if self.n_dets else np.zeros((0, 6), dtype=np.float32)
+        name = f"part-{len(self.manifest['chunks']):05d}.npz"
+        np.savez(
+            self.out_dir / name,
+            path=np.array(self.paths),
+            slice=np.array(self.slices, dtype=np.int32),
+            shape=np.array(self.shapes, dtype=np.int32).reshape(-1, 2),
+            offset=np.concatenate(([0], np.cumsum(self.counts))).astype(np.int64),
+            xyxy=dets[:, :4],
+            conf=dets[:, 4],
+            cls=dets[:, 5].astype(np.int16),
+        )
+        self.manifest["chunks"].append({"file": name, "images": len(self.paths), "detections": self.n_dets})
+        self.manifest_file.write_text(json.dumps(self.manifest, ensure_ascii=False))
+        self._reset()
+
+    def close(self):
+        self.flush()
+        if not self.manifest_file.exists():
+            self.manifest_file.write_text(json.dumps(self.manifest, ensure_ascii=False))
+
+
+class ResultStore:
+    """
+    惰性读取 ResultSink 写出的结果，任一时刻只加载一个块
+
+    用法:
+        >>> store = ResultStore("runs/predict/cohort")
+        >>> len(store), store.n_detections
+        >>> store[12345]  # CompactResult
+        >>> for chunk in store.detections(cls=0, min_conf=0.5):
+        ...     chunk["path"], chunk["slice"], chunk["xyxy"], chunk["conf"]
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        manifest = json.loads((self.path / "manifest.json").read_text())
+        assert manifest.get("format") == STORE_FORMAT, f"{path} 不是 {STORE_FORMAT} 格式"
+        self.names = {int(k): v for k, v in manifest["names"].items()}
+        self.chunks = manifest["chunks"]
+        self.starts = np.cumsum([0] + [c["images"] for c in self.chunks])
+        self._cache = (None, None)
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    @property
+    def n_detections(self):
+        return sum(c["detections"] for c in self.chunks)
+
+    def chunk(self, k):
+        """加载第 k 个块，返回各列数组组成的 dict"""
+        if self._cache[0] != k:
+            with np.load(self.path / self.chunks[k]["file"], allow_pickle=False) as f:
+                self._cache = (k, {name: f[name] for name in f.files})
+        return self._cache[1]
+
+    def _result(self, c, j):
+        o0, o1 = c["offset"][j], c["offset"][j + 1]
+        data = np.concatenate((c["xyxy"][o0:o1], c["conf"][o0:o1, None], c["cls"][o0:o1, None]), 1)
+        return CompactResult(str(c["path"][j]), self.names, c["shape"][j], data.astype(np.float32))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        k = int(np.searchsorted(self.starts, i, side="right")) - 1
+        return self._result(self.chunk(k), i - int(self.starts[k]))
+
+    def __iter__(self):
+        for k in range(len(self.chunks)):
+            c = self.chunk(k)
+            for j in range(len(c["path"])):
+                yield self._result(c, j)
+
+    def detections(self, cls=None, min_conf=None):
+        """
+        按块逐个返回检测表，每行附带所属图像的 path 与 slice
+
+        参数:
+            cls: 只保留该类别（int 或 int 列表）
+            min_conf: 只保留置信度不低于该值的检测
+        """
+        for k in range(len(self.chunks)):
+            c = self.chunk(k)
+            image = np.repeat(np.arange(len(c["path"])), np.diff(c["offset"]))
+            keep = np.ones(len(image), dtype=bool)
+            if cls is not None:
+                keep &= np.isin(c["cls"], np.atleast_1d(cls))
+            if min_conf is not None:
+                keep &= c["conf"] >= min_conf
+            image = image[keep]
+            yield {
+                "path": c["path"][image],
+                "slice": c["slice"][image],
+                "xyxy": c["xyxy"][keep],
+                "conf": c["conf"][keep],
+                "cls": c["cls"][keep],
+            }
+
+    def find(self, path):
+        """按图像路径查找结果，未找到时返回 None"""
+        path = str(path)
+        for k in range(len(self.chunks)):
+            c = self.chunk(k)
+            j = np.flatnonzero(c["path"] == path)
+            if len(j):
+                return self._result(c, int(j[0]))
+        return None
+
+
+def compact_predictor(model, keep_image=False, **kwargs):
+    """
+    按 Model.predict 的方式为 model 创建 CompactPredictor
+
+    参数:
+        model: YOLOv10 模型或权重路径
+        keep_image: 是否在结果中保留原图，save/show/save_crop 时必须为 True
+        kwargs: 预测参数，如 conf、imgsz、batch
+    """
+    model = YOLOv10(model) if isinstance(model, (str, Path)) else model
+    return build_predictor(CompactPredictor, model, {"keep_image": keep_image}, verbose=False, **kwargs)
+
+
+def predict_to_store(model, source, out_dir, chunk_images=100000, **kwargs):
+    """
+    流式预测并将结果写入 ResultSink，内存占用与任务规模无关
+
+    参数:
+        model: YOLOv10 模型或权重路径
+        source: 预测的数据源
+        out_dir: 结果目录
+        chunk_images: 每个块的图像数
+        kwargs: 传给 model.predict 的其他参数，如 conf、imgsz、batch
+    """
+    predictor = compact_predictor(model, **kwargs)
+    with ResultSink(out_dir, names=predictor.model.names, chunk_images=chunk_images) as sink:
+        for r in predictor(source, stream=True):
+            sink.append(r)
+    return ResultStore(out_dir)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="大规模预测：结果按列分块写入磁盘")
+    parser.add_argument(
+        "--model",
+        required=True,
+        help="模型权重")
+    parser.add_argument(
+        "--source",
+        required=True,
+        help="图像目录、列表文件或通配符")
+    parser.add_argument(
+        "--out",
+        default="runs/predict/store",
+        help="结果目录")
+    parser.add_argument(
+        "--conf",
+        type=float,
+        default=0.25,
+        help="置信度阈值")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="batch 大小")
+    parser.add_argument(
+        "--chunk",
+        type=int,
+        default=100000,
+        help="每个块的图像数")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    store = predict_to_store(
+        args.model, args.source, args.out, chunk_images=args.chunk, conf=args.conf, batch=args.batch, verbose=False
+    )
+    print(f"{len(store)} 张图像，{store.n_detections} 个检测，已保存到 {os.path.abspath(args.out)}")
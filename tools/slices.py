@@ -0,0 +1,79 @@
+"""
+CT 切片数据集的公共函数: 列出划分中的图像、从路径得到患者/序列号、读取标签类别
+
+由 tools/cascade.py、tools/cpu_optimize.py、tools/dedup.py 与 tools/kfold.py 共用。
+"""
+import os
+import re
+from pathlib import Path
+
+import numpy as np
+
+from ultralytics.data.utils import IMG_FORMATS, img2label_paths
+
+
+def split_files(data, split):
+    """
+    列出数据集配置中某个划分的图像文件
+
+    参数:
+        data: 数据集配置，如 check_det_dataset() 的返回值
+        split: 划分的键名，其值可以是目录、*.txt 图像列表或两者组成的列表
+
+    返回:
+        排序后的图像路径列表，*.txt 列表中的相对路径相对于列表文件所在目录
+    """
+    files = []
+    for p in data[split] if isinstance(data[split], list) else [data[split]]:
+        p = Path(p)
+        if p.is_dir():
+            files += [str(f) for f in p.rglob("*.*")]
+        elif p.is_file():
+            parent = p.parent
+            for x in p.read_text().strip().splitlines():
+                x = x.strip()
+                files.append(x if os.path.isabs(x) else str(parent / (x[2:] if x.startswith("./") else x)))
+        else:
+            raise FileNotFoundError(f"{p} does not exist")
+    return sorted(f for f in files if f.rpartition(".")[-1].lower() in IMG_FORMATS)
+
+
+def patient_id(path, pattern=None):
+    """
+    从 CT 切片路径得到患者/序列号
+
+    参数:
+        path: 图像路径
+        pattern: 第一个分组为序列号的正则表达式(可选)；默认去掉文件名末尾的切片序号，
+            如 patient01_0123.png -> patient01，文件名只有数字时使用上级目录名
+    """
+    if pattern:
+        m = re.search(pattern, str(path))
+        return m.group(1) if m else Path(path).stem
+    gid = re.sub(r"[_\-. ]*\d+$", "", Path(path).stem)
+    return gid or Path(path).parent.name
+
+
+def label_classes(im_files):
+    """
+    读取 im_files 对应 YOLO 标签文件中每个目标框的类别
+
+    返回:
+        每张图像的类别列表；背景切片以及缺失或无法读取的标签文件为空列表
+    """
+    classes = []
+    for lb in img2label_paths(im_files):
+        try:
+            with open(lb) as f:
+                classes.append([int(float(line.split()[0])) for line in f if line.strip()])
+        except OSError:
+            classes.append([])
+    return classes
+
+
+def box_counts(im_files, classes=None):
+    """每张图像的目标框数量，给出 classes 时只统计其中的类别"""
+    return np.array(
+        [sum(c in classes for c in cls) if classes is not None else len(cls) for cls in label_classes(im_files)],
+        dtype=np.int64,
+    )
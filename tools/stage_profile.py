@@ -0,0 +1,417 @@
+import os
+import csv
+import time
+import threading
+import argparse
+from collections import defaultdict
+
+import torch
+
+from ultralytics import YOLOv10
+from ultralytics.cfg import DEFAULT_CFG
+from ultralytics.data import base as data_base
+from ultralytics.data.augment import Compose
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolov10.train import YOLOv10DetectionTrainer
+from ultralytics.utils import LOGGER, RANK, colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+# 主进程等待数据的时间占训练步总时间的比例超过该阈值时判定为 dataloader-bound
+DATA_BOUND_THRESHOLD = 0.2
+TRAINER_STAGES = ("data", "h2d", "forward", "loss", "backward", "optimizer", "other")
+
+
+class _NullStage:
+    """禁用计时时使用的空上下文，开销可以忽略"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, timer, name):
+        self.timer, self.name = timer, name
+
+    def __enter__(self):
+        self.start, self.child = time.perf_counter(), 0.0
+        self.timer._stack.append(self)
+        return self
+
+    def __exit__(self, *args):
+        dt = time.perf_counter() - self.start
+        timer = self.timer
+        timer._stack.pop()
+        timer.totals[self.name] += dt - self.child  # 只记录本阶段独占的时间，嵌套阶段单独统计
+        timer.counts[self.name] += 1
+        if timer._stack:
+            timer._stack[-1].child += dt
+        return False
+
+
+class StageTimer:
+    """
+    按阶段累计耗时的计时器，支持嵌套（如 Mosaic 内部再读取 3 张图像）
+
+    用法:
+        >>> timer = StageTimer()
+        >>> with timer.stage("decode"):
+        ...     im = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+        >>> timer.pop()  # {"decode": (秒, 次数)}
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._stack = []
+
+    def stage(self, name):
+        return _Stage(self, name) if self.enabled else _NULL_STAGE
+
+    def pop(self):
+        """返回自上次 pop 以来的累计结果并清零"""
+        out = {k: (self.totals[k], self.counts[k]) for k in self.totals}
+        self.totals.clear()
+        self.counts.clear()
+        return out
+
+
+class TimedTransform:
+    """包装单个数据增强，统计其耗时"""
+
+    def __init__(self, transform, timer):
+        self.transform = transform
+        self.timer = timer
+        self.name = f"augment/{type(transform).__name__}"
+
+    def __call__(self, labels):
+        with self.timer.stage(self.name):
+            return self.transform(labels)
+
+    def __getattr__(self, item):
+        if item == "transform":  # 反序列化时属性尚未恢复
+            raise AttributeError(item)
+        return getattr(self.transform, item)
+
+
+_ACTIVE = threading.local()  # 当前线程中正在计时的 StageTimer
+
+
+class _TimedCV2:
+    """
+    在 ProfiledYOLODataset.load_image 调用期间临时替换 ultralytics.data.base 中的 cv2 模块，为 imread 与 resize 计时
+
+    计时器按线程保存，其他数据集（如验证集）或缓存线程中的调用直接转发给 cv2。
+    """
+
+    def __init__(self, module):
+        self._cv2 = module
+
+    def __getattr__(self, item):
+        return getattr(self._cv2, item)
+
+    def _timed(self, name, fn, *args, **kwargs):
+        timer = getattr(_ACTIVE, "timer", None)
+        if timer is None:
+            return fn(*args, **kwargs)
+        with timer.stage(name):
+            return fn(*args, **kwargs)
+
+    def imread(self, *args, **kwargs):
+        return self._timed("imread", self._cv2.imread, *args, **kwargs)
+
+    def resize(self, *args, **kwargs):
+        return self._timed("resize", self._cv2.resize, *args, **kwargs)
+
+
+class ProfiledYOLODataset(YOLODataset):
+    """
+    在 YOLODataset 的热路径中插入分阶段计时：图像读取解码（imread）、缩放（resize）、标签拷贝、各数据增强以及 collate
+
+    每个 worker 的统计结果随 batch 一起返回（batch["stage_times"]），由主进程汇总。profile=False 时不做任何计时。
+    """
+
+    def __init__(self, *args, profile=True, **kwargs):
+        self.timer = StageTimer(enabled=profile)  # build_transforms 在父类 __init__ 中调用，需提前创建
+        super().__init__(*args, **kwargs)
+        self.timer.pop()  # dataloader 的 worker 由 fork 创建，构建数据集期间的计时不能带入第一个 epoch
+
+    def build_transforms(self, hyp=None):
+        transforms = super().build_transforms(hyp)
+        if self.timer.enabled:
+            self._wrap(transforms)
+        return transforms
+
+    def _wrap(self, compose):
+        for i, t in enumerate(compose.transforms):
+            if isinstance(t, Compose):
+                self._wrap(t)
+            elif not isinstance(t, TimedTransform):
+                compose.transforms[i] = TimedTransform(t, self.timer)
+
+    def cache_images(self, cache):
+        """缓存在线程池中并发调用 load_image，共享的计时栈不是线程安全的，缓存阶段不计时"""
+        enabled, self.timer.enabled = self.timer.enabled, False
+        try:
+            super().cache_images(cache)
+        finally:
+            self.timer.enabled = enabled
+
+    def load_image(self, i, rect_mode=True):
+        """调用 BaseDataset.load_image，其中的 cv2.imread 与 cv2.resize 分别计入 imread 和 resize；已缓存在内存中的图像计入 load_cached"""
+        if not self.timer.enabled or self.ims[i] is not None:
+            with self.timer.stage("load_cached"):
+                return super().load_image(i, rect_mode)
+
+        cv2 = getattr(data_base.cv2, "_cv2", data_base.cv2)  # 其他线程正在计时时取其包装的原始模块
+        data_base.cv2, _ACTIVE.timer = _TimedCV2(cv2), self.timer
+        try:
+            with self.timer.stage("load_image"):  # imread/resize 以外的部分（读取 .npy、更新缓冲区）
+                return super().load_image(i, rect_mode)
+        finally:
+            data_base.cv2, _ACTIVE.timer = cv2, None  # 只在本次调用内替换，不影响其他数据集和模块
+
+    def get_image_and_label(self, index):
+        with self.timer.stage("label"):
+            return super().get_image_and_label(index)
+
+    def collate_fn(self, batch):
+        with self.timer.stage("collate"):
+            new_batch = YOLODataset.collate_fn(batch)
+        if self.timer.enabled:
+            new_batch["stage_times"] = self.timer.pop()
+        return new_batch
+
+
+class LapClock:
+    """
+    训练步的分段计时：lap(name) 将距上一个时间点的耗时记到 name 阶段
+
+    只包含计时状态，可以安全地被 deepcopy / pickle。
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.device = None
+        self._t = time.perf_counter()
+
+    def lap(self, name):
+        if self.device is not None and self.device.type == "cuda":
+            torch.cuda.synchronize(self.device)
+        t = time.perf_counter()
+        self.totals[name] += t - self._t
+        self._t = t
+
+    def reset(self, device=None):
+        self.totals.clear()
+        self.device = device
+        self._t = time.perf_counter()
+
+
+class StageProfileTrainer(YOLOv10DetectionTrainer):
+    """
+    带分阶段计时的 YOLOv10 训练器
+
+    训练步被划分为 data(等待 dataloader)、h2d(拷贝到设备)、forward、loss(v10DetectLoss)、
+    backward、optimizer 与 other；dataloader 内部各阶段的耗时由 ProfiledYOLODataset 在 worker 中统计，
+    profile_loader = False 时关闭。
+    forward/loss 的分界由检测头与模型上的前向钩子记录，钩子只在 epoch 内注册，检查点中不会带上计时状态。
+    每个 epoch 结束时给出 dataloader-bound / compute-bound 判断，写入 save_dir/stage_times.csv，
+    并触发自定义回调 "on_stage_summary"，汇总结果保存在 trainer.stage_summary 中。
+
+    用法:
+        >>> model = YOLOv10("yolov10n.yaml")
+        >>> model.add_callback("on_stage_summary", lambda trainer: print(trainer.stage_summary["verdict"]))
+        >>> model.train(data="configs/emphysema.yaml", trainer=StageProfileTrainer)
+    """
+
+    profile_loader = True
+
+    def __init__(self, cfg=DEFAULT_CFG, overrides=None, _callbacks=None):
+        super().__init__(cfg, overrides, _callbacks)
+        self.clock = LapClock()
+        self._hooks = []
+        self.loader_totals = defaultdict(float)
+        self.loader_images = 0
+        self.stage_summary = {}
+        self.stage_rows = []
+        self.stage_csv = self.save_dir / "stage_times.csv"
+        self._stepped = False
+        self.add_callback("on_train_epoch_start", lambda trainer: trainer._reset_stages())
+        self.add_callback("on_train_batch_start", lambda trainer: trainer._lap("data"))
+        self.add_callback("on_train_batch_end", lambda trainer: trainer._end_batch())
+        self.add_callback("on_train_epoch_end", lambda trainer: trainer._summarize_stages())
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if mode != "train":
+            return super().build_dataset(img_path, mode, batch)
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        cfg = self.args
+        return ProfiledYOLODataset(
+            img_path=img_path,
+            imgsz=cfg.imgsz,
+            batch_size=batch,
+            augment=True,
+            hyp=cfg,
+            rect=cfg.rect,
+            cache=cfg.cache or None,
+            single_cls=cfg.single_cls or False,
+            stride=gs,
+            pad=0.0,
+            prefix=colorstr(f"{mode}: "),
+            task=cfg.task,
+            classes=cfg.classes,
+            data=self.data,
+            fraction=cfg.fraction,
+            profile=self.profile_loader,
+        )
+
+    @property
+    def stage_totals(self):
+        return self.clock.totals
+
+    def _lap(self, name):
+        """将距上一个时间点的耗时记到 name 阶段"""
+        self.clock.lap(name)
+
+    def _reset_stages(self):
+        self.clock.reset(self.device)
+        self.loader_totals.clear()
+        self.loader_images = 0
+
+        # 检测头输出时前向结束、模型返回时损失计算结束；钩子在 on_train_epoch_end（save_model 之前）移除
+        model = de_parallel(self.model)
+        self._hooks = [
+            model.model[-1].register_forward_hook(lambda m, x, y: self._lap("forward") if m.training else None),
+            model.register_forward_hook(lambda m, x, y: self._lap("loss") if m.training else None),
+        ]
+
+    def _remove_hooks(self):
+        for h in self._hooks:
+            h.remove()
+        self._hooks = []
+
+    def _end_batch(self):
+        self._lap("other" if self._stepped else "backward")
+        self._stepped = False
+
+    def preprocess_batch(self, batch):
+        self._lap("other")
+        for name, (dt, _) in batch.pop("stage_times", {}).items():
+            self.loader_totals[name] += dt
+        self.loader_images += len(batch["im_file"])
+        batch = super().preprocess_batch(batch)
+        self._lap("h2d")
+        return batch
+
+    def optimizer_step(self):
+        self._lap("backward")
+        super().optimizer_step()
+        self._lap("optimizer")
+        self._stepped = True
+
+    def _summarize_stages(self):
+        self._remove_hooks()  # time= 超时会跳过 on_train_batch_end，但 on_train_epoch_end 总会执行
+        wall = sum(self.stage_totals.values()) or 1e-9
+        data_frac = self.stage_totals["data"] / wall
+        n = max(self.loader_images, 1)
+        loader = {k: 1000 * v / n for k, v in sorted(self.loader_totals.items(), key=lambda x: -x[1])}
+        verdict = "dataloader-bound" if data_frac > DATA_BOUND_THRESHOLD else "compute-bound"
+
+        self.stage_summary = {
+            "epoch": self.epoch + 1,
+            "verdict": verdict,
+            "data_fraction": data_frac,
+            "trainer_s": {k: self.stage_totals[k] for k in TRAINER_STAGES},
+            "loader_ms_per_image": loader,
+        }
+        if RANK not in (-1, 0):
+            return
+
+        top = next(iter(loader), None)
+        hint = f", 最慢的数据阶段 {top} {loader[top]:.2f} ms/img" if verdict == "dataloader-bound" and top else ""
+        LOGGER.info(
+            f"{colorstr('stage profile:')} epoch {self.epoch + 1} {verdict} (等待数据占 {data_frac:.1%}{hint}) "
+            + " ".join(f"{k}={self.stage_totals[k]:.1f}s" for k in TRAINER_STAGES)
+        )
+        self._write_stage_csv()
+        self.run_callbacks("on_stage_summary")
+
+    def _write_stage_csv(self):
+        s = self.stage_summary
+        row = {"epoch": s["epoch"], "verdict": s["verdict"], "data_fraction": round(s["data_fraction"], 4)}
+        row.update({f"{k}_s": round(v, 4) for k, v in s["trainer_s"].items()})
+        row.update({f"{k}_ms_per_img": round(v, 4) for k, v in s["loader_ms_per_image"].items()})
+        self.stage_rows.append(row)
+
+        # 数据增强阶段在 close_mosaic 后会变化，每个 epoch 以所有列的并集重写文件
+        fields = list(dict.fromkeys(k for r in self.stage_rows for k in r))
+        os.makedirs(self.save_dir, exist_ok=True)
+        with open(self.stage_csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(self.stage_rows)
+
+
+def parse():
+    parser = argparse.ArgumentParser(description="带分阶段计时的 YOLOv10 训练，判断训练是 dataloader-bound 还是 compute-bound")
+    parser.add_argument(
+        "--model",
+        default="yolov10n.yaml",
+        help="模型配置或权重")
+    parser.add_argument(
+        "--data",
+        default="configs/emphysema.yaml",
+        help="数据集配置")
+    parser.add_argument(
+        "--epochs",
+        type=int,
+        default=3,
+        help="训练轮数")
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="输入尺寸")
+    parser.add_argument(
+        "--batch",
+        type=int,
+        default=16,
+        help="批大小")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="dataloader worker 数")
+    parser.add_argument(
+        "--cache",
+        default="none",
+        choices=["none", "ram", "disk"],
+        help="图像缓存方式")
+    parser.add_argument(
+        "--no_loader_profile",
+        action="store_true",
+        help="关闭 dataloader 内部各阶段的计时，只统计训练步")
+
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse()
+
+    StageProfileTrainer.profile_loader = not args.no_loader_profile
+    model = YOLOv10(args.model)
+    model.train(
+        data=args.data,
+        epochs=args.epochs,
+        imgsz=args.imgsz,
+        batch=args.batch,
+        workers=args.workers,
+        cache=False if args.cache == "none" else args.cache,
+        trainer=StageProfileTrainer,
+    )